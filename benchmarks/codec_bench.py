@@ -0,0 +1,95 @@
+"""
+Microbenchmark of the JSON codecs (lurchhome/codec.py) on the connectors hot paths: CPU time per 10k
+Home Assistant state_changed frames, decoded from str and from bytes, plus the attributes re-dump of each
+stored event, the JSON-RPC payloads and the tool results encoding.
+
+    pdm run python benchmarks/codec_bench.py
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from lurchhome import codec
+
+
+def _frames(count: int) -> List[str]:
+    frames = []
+    for i in range(count):
+        now = datetime.now(timezone.utc).isoformat()
+        state = {'entity_id': f'sensor.bench_{i % 200}', 'state': str(20 + i % 7),
+                 'attributes': {'unit_of_measurement': '°C', 'device_class': 'temperature',
+                                'state_class': 'measurement', 'friendly_name': f'Bench sensor {i % 200}'},
+                 'last_changed': now, 'last_updated': now,
+                 'context': {'id': f'01J{i:023d}', 'parent_id': None, 'user_id': None}}
+        frames.append(json.dumps({'id': 1, 'type': 'event', 'event': {
+            'event_type': 'state_changed', 'time_fired': now, 'origin': 'LOCAL', 'context': state['context'],
+            'data': {'entity_id': state['entity_id'], 'old_state': state, 'new_state': state}}}))
+    return frames
+
+
+def _cpu(fn: Callable[[], None], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        fn()
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def bench(json_codec: codec.Codec, frames: List[str], repeat: int) -> Dict[str, float]:
+    raw = [f.encode() for f in frames]
+    events = [json_codec.loads(f)['event'] for f in frames]
+    tool_result = {'content': [{'type': 'text', 'text': frames[0]}], 'isError': False}
+
+    def decode_str():
+        for f in frames:
+            json_codec.loads(f)
+
+    def decode_bytes():
+        for f in raw:
+            json_codec.loads(f)
+
+    def attributes():
+        for e in events:
+            json_codec.dumpb(e['data']['new_state']['attributes'])
+
+    def payloads():
+        for i in range(len(frames)):
+            json_codec.dumpb({'jsonrpc': '2.0', 'method': 'tools/call', 'id': i,
+                              'params': {'name': 'HassTurnOff', 'arguments': {'name': f'Bench light {i}'}}})
+
+    def tool_results():
+        for _ in range(len(frames)):
+            json_codec.dumpb(tool_result)
+
+    results = {name: _cpu(fn, repeat) * 1000 for name, fn in [('decode_str_ms', decode_str),
+                                                               ('decode_bytes_ms', decode_bytes),
+                                                               ('attributes_ms', attributes),
+                                                               ('payloads_ms', payloads),
+                                                               ('tool_results_ms', tool_results)]}
+    # What a websocket event costs end to end: the frame parse and the attributes re-dump
+    results['per_event_us'] = (results['decode_bytes_ms'] + results['attributes_ms']) / len(frames) * 1000
+    return results
+
+
+def main(args):
+    frames = _frames(args.events)
+    print(f'{args.events} events, {sum(map(len, frames)) / len(frames):.0f} bytes per frame, '
+          f'best of {args.repeat}, CPU ms (active codec: {codec.codec.name})')
+
+    results = {name: bench(json_codec, frames, args.repeat) for name, json_codec in codec.available().items()}
+    baseline = results['json']
+    for name, result in results.items():
+        saved = (baseline['decode_bytes_ms'] + baseline['attributes_ms']) - \
+                (result['decode_bytes_ms'] + result['attributes_ms'])
+        print(f'{name:>8}: ' + ', '.join(f'{k}={v:.1f}' for k, v in result.items()) +
+              (f', saved vs json={saved:.1f} ms' if name != 'json' else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU time of the JSON codecs on the connectors hot paths')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    main(parser.parse_args())
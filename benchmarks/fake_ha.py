@@ -0,0 +1,287 @@
+"""
+In-process fake Home Assistant for the offline benchmarks: a plain asyncio TCP server speaking just enough HTTP/1.1,
+Server-Sent Events and WebSocket to serve
+
+    GET  /mcp_server/sse                 the MCP SSE stream (endpoint event, then the JSON-RPC replies)
+    POST /mcp_server/messages/<ID>       the MCP JSON-RPC requests, answered on the SSE stream after `latency`
+    GET  /api/websocket                  auth, subscribe_events, get_states and the registries, then
+                                         `events` state_changed events at `event_rate` events/s (0 = flat out);
+                                         with subscribe_entities the same changes as compressed diffs
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+TOOLS = [
+    {'name': name, 'description': description,
+     'inputSchema': {'type': 'object', 'properties': {
+         'name': {'type': 'string'}, 'area': {'type': 'string'},
+         'domain': {'type': 'array', 'items': {'type': 'string'}}}}}
+    for name, description in [('HassTurnOn', 'Turns on/opens a device or entity'),
+                              ('HassTurnOff', 'Turns off/closes a device or entity')]
+] + [{'name': 'GetLiveContext', 'description': 'Provides real-time information about the devices',
+      'inputSchema': {'type': 'object', 'properties': {}}}]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _context() -> Dict[str, Any]:
+    return {'id': uuid.uuid4().hex.upper()[:26], 'parent_id': None, 'user_id': None}
+
+
+def _state(entity_id: str, state: str, name: str) -> Dict[str, Any]:
+    return {'entity_id': entity_id, 'state': state,
+            'attributes': {'supported_color_modes': ['brightness'], 'color_mode': None, 'brightness': None,
+                           'friendly_name': name, 'supported_features': 40},
+            'last_changed': _now(), 'last_updated': _now(), 'context': _context()}
+
+
+def _compressed(state: Dict[str, Any]) -> Dict[str, Any]:
+    timestamp = datetime.fromisoformat(state['last_changed']).timestamp()
+    return {'s': state['state'], 'a': state['attributes'], 'c': state['context']['id'], 'lc': timestamp}
+
+
+class FakeHomeAssistant:
+
+    def __init__(self,
+                 *,
+                 latency: float = 0.005,
+                 entities: int = 50,
+                 events: int = 10000,
+                 event_rate: float = 0):
+        self.latency = latency
+        self.events = events
+        self.event_rate = event_rate
+        self.states = [_state(f'light.bench_{i}', 'off', f'Bench light {i}') for i in range(entities)]
+
+        self.tool_calls: int = 0
+        self.events_sent: int = 0
+        self.events_started_at: Optional[float] = None
+        self.events_finished_at: Optional[float] = None
+
+        self._server: Optional[asyncio.Server] = None
+        self._sse_streams: Dict[str, asyncio.StreamWriter] = {}
+        self._tasks = set()
+        self._connections = set()
+
+    @property
+    def url(self) -> str:
+        host, port = next(iter(self._server.sockets)).getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    async def start(self) -> 'FakeHomeAssistant':
+        self._server = await asyncio.start_server(self.__handle, '127.0.0.1', 0)
+        return self
+
+    async def aclose(self):
+        self._server.close()
+        tasks = self._tasks | self._connections
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+
+                request_line, *header_lines = head.decode().split('\r\n')
+                method, path, _ = request_line.split(' ', 2)
+                headers = {k.strip().lower(): v.strip() for k, _, v in
+                           (line.partition(':') for line in header_lines if line)}
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if method == 'GET' and path == '/mcp_server/sse':
+                    await self.__sse(writer)
+                    return
+                if method == 'GET' and path == '/api/websocket':
+                    await self.__websocket(reader, writer, headers)
+                    return
+                if method == 'POST' and path.startswith('/mcp_server/messages/'):
+                    await self.__message(writer, path.rsplit('/', 1)[1], json.loads(body))
+                    continue
+
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def __sse(self, writer: asyncio.StreamWriter):
+        session_id = uuid.uuid4().hex.upper()
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n')
+        writer.write(f'event: endpoint\ndata: /mcp_server/messages/{session_id}\n\n'.encode())
+        await writer.drain()
+
+        self._sse_streams[session_id] = writer
+        try:
+            # The stream stays open until the client goes away
+            while not writer.is_closing():
+                await asyncio.sleep(0.5)
+        finally:
+            self._sse_streams.pop(session_id, None)
+
+    async def __message(self, writer: asyncio.StreamWriter, session_id: str, request: Dict[str, Any]):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        await writer.drain()
+
+        if 'id' in request:
+            task = asyncio.create_task(self.__reply(session_id, request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def __reply(self, session_id: str, request: Dict[str, Any]):
+        method = request['method']
+        if method == 'initialize':
+            result = {'protocolVersion': request['params']['protocolVersion'], 'capabilities': {'tools': {}},
+                      'serverInfo': {'name': 'fake-home-assistant', 'version': '1.0'}}
+        elif method == 'tools/list':
+            result = {'tools': TOOLS}
+        else:
+            await asyncio.sleep(self.latency)
+            self.tool_calls += 1
+            result = {'content': [{'type': 'text', 'text': self.__tool_text(request['params'])}], 'isError': False}
+
+        stream = self._sse_streams.get(session_id)
+        if stream and not stream.is_closing():
+            reply = json.dumps({'jsonrpc': '2.0', 'id': request['id'], 'result': result})
+            stream.write(f'event: message\ndata: {reply}\n\n'.encode())
+            await stream.drain()
+
+    def __tool_text(self, params: Dict[str, Any]) -> str:
+        if params.get('name') == 'GetLiveContext':
+            lines = [f'- names: {s["attributes"]["friendly_name"]}\n  domain: light\n  state: \'{s["state"]}\''
+                     for s in self.states]
+            return json.dumps({'success': True, 'result': 'Live Context: An overview of the areas and the devices '
+                                                          'in this smart home:\n' + '\n'.join(lines)})
+        target = (params.get('arguments') or {}).get('name', '')
+        return json.dumps({'speech': {}, 'response_type': 'action_done', 'language': 'en',
+                           'data': {'targets': [], 'failed': [],
+                                    'success': [{'name': target, 'type': 'entity', 'id': target}]}})
+
+    async def __websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str]):
+        accept = base64.b64encode(hashlib.sha1((headers['sec-websocket-key'] + WS_GUID).encode()).digest()).decode()
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+        await self.__ws_send(writer, {'type': 'auth_required', 'ha_version': '2025.1.0'})
+
+        subscription, entities = None, False
+        while subscription is None:
+            message = await self.__ws_receive(reader, writer)
+            if message is None:
+                return
+
+            if message['type'] == 'auth':
+                await self.__ws_send(writer, {'type': 'auth_ok', 'ha_version': '2025.1.0'})
+            elif message['type'] in ('subscribe_events', 'subscribe_entities'):
+                subscription, entities = message['id'], message['type'] == 'subscribe_entities'
+                await self.__ws_send(writer, {'id': message['id'], 'type': 'result', 'success': True, 'result': None})
+
+        if entities:
+            await self.__ws_send(writer, {'id': subscription, 'type': 'event', 'event': {
+                'a': {s['entity_id']: _compressed(s) for s in self.states}}})
+
+        # get_states (not with subscribe_entities), the three registries and the exposed entities, sent right
+        # after the subscription
+        for _ in range(4 if entities else 5):
+            message = await self.__ws_receive(reader, writer)
+            if message is None:
+                return
+            if message['type'] == 'get_states':
+                result = self.states
+            elif message['type'] == 'homeassistant/expose_entity/list':
+                result = {'exposed_entities': {s['entity_id']: {'conversation': True} for s in self.states}}
+            else:
+                result = []
+            await self.__ws_send(writer, {'id': message['id'], 'type': 'result', 'success': True, 'result': result})
+
+        await self.__stream_events(writer, subscription, entities)
+        while await self.__ws_receive(reader, writer) is not None:
+            pass
+
+    async def __stream_events(self, writer: asyncio.StreamWriter, subscription: int, entities: bool):
+        self.events_started_at = time.perf_counter()
+        for i in range(self.events):
+            entity = self.states[i % len(self.states)]
+            old_state = dict(entity)
+            on = entity['state'] == 'off'
+            entity.update(state='on' if on else 'off', last_changed=_now(), last_updated=_now(), context=_context(),
+                          attributes={**entity['attributes'], 'color_mode': 'brightness' if on else None,
+                                      'brightness': 255 if on else None})
+            if entities:
+                event = {'c': {entity['entity_id']: {'+': {
+                    's': entity['state'], 'c': entity['context']['id'],
+                    'lc': datetime.fromisoformat(entity['last_changed']).timestamp(),
+                    'a': {'color_mode': entity['attributes']['color_mode'],
+                          'brightness': entity['attributes']['brightness']}}}}}
+            else:
+                event = {'event_type': 'state_changed', 'time_fired': entity['last_updated'], 'origin': 'LOCAL',
+                         'context': entity['context'],
+                         'data': {'entity_id': entity['entity_id'], 'old_state': old_state, 'new_state': dict(entity)}}
+            await self.__ws_send(writer, {'id': subscription, 'type': 'event', 'event': event}, drain=i % 100 == 0)
+            self.events_sent += 1
+
+            if self.event_rate:
+                ahead = self.events_started_at + (i + 1) / self.event_rate - time.perf_counter()
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+            elif i % 100 == 0:
+                await asyncio.sleep(0)
+
+        await writer.drain()
+        self.events_finished_at = time.perf_counter()
+
+    @staticmethod
+    async def __ws_send(writer: asyncio.StreamWriter, message: Dict[str, Any], *, drain: bool = True):
+        payload = json.dumps(message).encode()
+        if len(payload) < 126:
+            header = struct.pack('!BB', 0x81, len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack('!BBH', 0x81, 126, len(payload))
+        else:
+            header = struct.pack('!BBQ', 0x81, 127, len(payload))
+        writer.write(header + payload)
+        if drain:
+            await writer.drain()
+
+    @staticmethod
+    async def __ws_receive(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[Dict[str, Any]]:
+        while True:
+            try:
+                first, second = await reader.readexactly(2)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return None
+
+            opcode, length = first & 0x0F, second & 0x7F
+            if length == 126:
+                length, = struct.unpack('!H', await reader.readexactly(2))
+            elif length == 127:
+                length, = struct.unpack('!Q', await reader.readexactly(8))
+            mask = await reader.readexactly(4) if second & 0x80 else b'\x00' * 4
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                writer.write(struct.pack('!BB', 0x8A, len(payload)) + payload)
+                continue
+            if opcode == 0x1:
+                return json.loads(payload)
+
@@ -0,0 +1,189 @@
+"""
+Offline benchmarks against the in-process fake Home Assistant (fake_ha.py) and a scripted chat model
+(scripted_model.py): no Home Assistant, LLM or Redis needed.
+
+    mcp     HAMCPConnector.call_tool requests/s and p50/p99 latency, at the given concurrency
+    ws      HAWSConnector state_changed events/s written through the EventBatchWriter, into an in-memory
+            store or into Redis with --redis, with the bytes received and the parse time
+    ws_entities
+            the same changes received as subscribe_entities compressed diffs
+    turns   end-to-end talk_to_lurch turn latency, with the model latency and the tool calls of the script
+
+Results are printed and written as JSON, so that runs can be compared:
+
+    pdm run python benchmarks/offline_suite.py --output benchmarks/results/before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+from fake_ha import FakeHomeAssistant
+from scripted_model import ScriptedChatModel
+
+from lurchhome import __version__
+from lurchhome.brain.lurch_brain import Lurch
+from lurchhome.brain.lurch_events import TurnStats
+from lurchhome.integrations.ha.ha_mcp_connector import HAMCPConnector
+from lurchhome.integrations.ha.ha_ws_connector import HAWSConnector
+from lurchhome.persistence.event_writer import EventBatchWriter
+from lurchhome.persistence.storage_handler import StorageHandler
+
+BENCHMARKS = ['mcp', 'ws', 'ws_entities', 'turns']
+
+
+class MemoryStorageHandler:
+    def __init__(self):
+        self.events_stored = 0
+
+    async def store_ha_events(self, *, events: List[Dict[str, Any]]) -> int:
+        self.events_stored += len(events)
+        return len(events)
+
+
+def _latencies(samples: List[float]) -> Dict[str, float]:
+    percentiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {'p50_ms': percentiles[49] * 1000, 'p99_ms': percentiles[98] * 1000,
+            'mean_ms': statistics.fmean(samples) * 1000}
+
+
+@contextlib.asynccontextmanager
+async def _running(coro):
+    task = asyncio.create_task(coro)
+    try:
+        yield task
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def bench_mcp(args) -> Dict[str, Any]:
+    fake_ha = await FakeHomeAssistant(latency=args.ha_latency, events=0).start()
+    connector = HAMCPConnector(ha_base_url=fake_ha.url, ha_api_token='bench')
+    try:
+        async with _running(connector.connect_and_run()):
+            await asyncio.wait_for(connector.get_tools(), timeout=10)
+
+            latencies = []
+            slots = asyncio.Semaphore(args.mcp_concurrency)
+
+            async def call(i: int):
+                async with slots:
+                    started = time.perf_counter()
+                    await connector.call_tool(name='HassTurnOff', params={'name': f'Bench light {i % 50}'})
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(call(i) for i in range(args.mcp_calls)))
+            elapsed = time.perf_counter() - started
+    finally:
+        await fake_ha.aclose()
+
+    return {'calls': args.mcp_calls, 'concurrency': args.mcp_concurrency, 'ha_latency_ms': args.ha_latency * 1000,
+            'seconds': elapsed, 'rps': args.mcp_calls / elapsed, **_latencies(latencies)}
+
+
+async def bench_ws(args, *, subscribe_entities: bool = False) -> Dict[str, Any]:
+    fake_ha = await FakeHomeAssistant(events=args.events, event_rate=args.event_rate).start()
+    storage_handler = StorageHandler(host=args.redis) if args.redis else MemoryStorageHandler()
+    event_writer = EventBatchWriter(storage_handler=storage_handler)
+    connector = HAWSConnector(ha_base_url=fake_ha.url, ha_api_token='bench', event_writer=event_writer,
+                              subscribe_entities=subscribe_entities)
+    try:
+        async with _running(connector.listen_ws()):
+            deadline = time.perf_counter() + args.timeout
+            while event_writer.stats()['events_written'] < args.events and time.perf_counter() < deadline:
+                await asyncio.sleep(0.01)
+            finished = time.perf_counter()
+    finally:
+        await fake_ha.aclose()
+
+    written = event_writer.stats()['events_written']
+    elapsed = finished - fake_ha.events_started_at
+    ws_stats = connector.stats()
+    return {'events': args.events, 'event_rate': args.event_rate, 'store': 'redis' if args.redis else 'memory',
+            'mode': ws_stats['mode'], 'events_written': written, 'seconds': elapsed,
+            'events_per_second': written / elapsed, 'avg_batch_size': event_writer.stats()['avg_batch_size'],
+            'bytes_received': ws_stats['bytes_received'], 'bytes_per_event': ws_stats['bytes_received'] / written,
+            'bytes_per_second': ws_stats['bytes_received'] / elapsed,
+            'parse_ms': ws_stats['parse_seconds'] * 1000,
+            'parse_us_per_event': ws_stats['parse_seconds'] / written * 1e6}
+
+
+async def bench_ws_entities(args) -> Dict[str, Any]:
+    return await bench_ws(args, subscribe_entities=True)
+
+
+async def bench_turns(args) -> Dict[str, Any]:
+    fake_ha = await FakeHomeAssistant(latency=args.ha_latency, events=0).start()
+    mcp_connector = HAMCPConnector(ha_base_url=fake_ha.url, ha_api_token='bench')
+    ws_connector = HAWSConnector(ha_base_url=fake_ha.url, ha_api_token='bench')
+    model = ScriptedChatModel(latency=args.llm_latency,
+                              targets=[s['attributes']['friendly_name'] for s in fake_ha.states],
+                              tool_calls=args.tool_calls)
+    try:
+        async with _running(mcp_connector.connect_and_run()), _running(ws_connector.listen_ws()):
+            lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector, ha_ws_connector=ws_connector).startup()
+            while not ws_connector.state_mirror.is_live:
+                await asyncio.sleep(0.01)
+
+            stats: List[TurnStats] = []
+            for turn in range(args.turns):
+                async for event in lurch.stream(message=f'Please switch off a few of the bench lights ({turn})'):
+                    if isinstance(event, TurnStats):
+                        stats.append(event)
+    finally:
+        await fake_ha.aclose()
+
+    llm_seconds = args.llm_latency * (2 if args.tool_calls else 1)
+    latencies = [s.latency for s in stats]
+    return {'turns': args.turns, 'llm_latency_ms': args.llm_latency * 1000, 'tool_calls_per_turn': args.tool_calls,
+            'tool_calls_received': fake_ha.tool_calls, **_latencies(latencies),
+            'ttft_p50_ms': statistics.median(s.time_to_first_token for s in stats) * 1000,
+            'overhead_p50_ms': (statistics.median(latencies) - llm_seconds) * 1000,
+            'input_tokens_per_turn': statistics.fmean(s.input_tokens for s in stats)}
+
+
+async def main(args):
+    results = {'timestamp': datetime.now(timezone.utc).isoformat(), 'version': __version__,
+               'python': platform.python_version(), 'config': vars(args)}
+
+    for name in args.only or BENCHMARKS:
+        results[name] = await globals()[f'bench_{name}'](args)
+        print(f'{name:>6}: ' + ', '.join(f'{k}={v:.1f}' if isinstance(v, float) else f'{k}={v}'
+                                         for k, v in results[name].items()))
+
+    output = args.output or f'benchmarks/results/offline-{datetime.now():%Y%m%d-%H%M%S}.json'
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks with a fake Home Assistant and a scripted LLM')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS)
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/offline-<time>.json)')
+    parser.add_argument('--ha-latency', type=float, default=0.005, help='Fake HA tool call latency, in seconds')
+    parser.add_argument('--mcp-calls', type=int, default=2000)
+    parser.add_argument('--mcp-concurrency', type=int, default=16)
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--event-rate', type=float, default=0, help='Events/s sent by the fake HA (0 = flat out)')
+    parser.add_argument('--redis', help='Write the events to this Redis host instead of an in-memory store')
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Scripted LLM latency per call, in seconds')
+    parser.add_argument('--tool-calls', type=int, default=2, help='Tool calls per turn in the LLM script')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--log', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log.upper(), format='%(levelname)s: %(message)s', stream=sys.stderr)
+    asyncio.run(main(args))
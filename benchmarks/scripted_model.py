@@ -0,0 +1,74 @@
+"""
+Chat model playing a fixed script, for the offline benchmarks: a new request gets one step calling `tool` on
+`tool_calls` of the `targets` (none when 0), the tool results get the final answer. Every call costs `latency`
+seconds, half of it before the first token as with a real model.
+"""
+import asyncio
+import itertools
+import json
+from typing import List, Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult, ChatGeneration
+from pydantic import PrivateAttr
+
+
+class ScriptedChatModel(BaseChatModel):
+    latency: float = 0.05
+    tool: str = 'HassTurnOff'
+    targets: List[str] = []
+    tool_calls: int = 1
+    answer: str = 'Very well, it is done.'
+
+    _next_target: Any = PrivateAttr(default=None)
+    _next_id: Any = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self) -> str:
+        return 'scripted'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.__reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._generate(messages)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self.__reply(messages)
+        await asyncio.sleep(self.latency / 2)
+
+        tokens = reply.content.split(' ') if reply.content else []
+        for token in tokens:
+            await asyncio.sleep(self.latency / 2 / len(tokens))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token + ' '))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+        if not tokens:
+            await asyncio.sleep(self.latency / 2)
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content='',
+            usage_metadata=reply.usage_metadata,
+            tool_call_chunks=[{'name': c['name'], 'args': json.dumps(c['args']), 'id': c['id'], 'index': i}
+                              for i, c in enumerate(reply.tool_calls)]))
+
+    def __reply(self, messages: List[BaseMessage]) -> AIMessage:
+        input_tokens = sum(len(m.text) for m in messages) // 4
+        if isinstance(messages[-1], ToolMessage) or not self.tool_calls or not self.targets:
+            return AIMessage(content=self.answer,
+                             usage_metadata={'input_tokens': input_tokens, 'output_tokens': len(self.answer) // 4,
+                                             'total_tokens': input_tokens + len(self.answer) // 4})
+
+        if self._next_target is None:
+            self._next_target = itertools.cycle(self.targets)
+        return AIMessage(content='',
+                         tool_calls=[{'name': self.tool, 'args': {'name': next(self._next_target)},
+                                      'id': f'call_{next(self._next_id)}'} for _ in range(self.tool_calls)],
+                         usage_metadata={'input_tokens': input_tokens, 'output_tokens': 20 * self.tool_calls,
+                                         'total_tokens': input_tokens + 20 * self.tool_calls})
@@ -0,0 +1,90 @@
+"""
+Load test of the server mode with a fake LLM: every turn costs LLM_LATENCY seconds, as with a model served
+elsewhere. Throughput should grow with the number of sessions, up to --max-concurrent-llm when set.
+
+    pdm run python benchmarks/server_load.py --sessions 1 2 4 8 16 --turns 5
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult, ChatGeneration
+from websockets.asyncio.client import connect
+
+from lurchhome.brain.lurch_brain import Lurch
+from lurchhome.server import LurchServer
+
+ANSWER = 'Very well, I will attend to that immediately.'
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.1
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=ANSWER))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Half of the latency before the first token, the rest spread over the tokens
+        tokens = ANSWER.split(' ')
+        await asyncio.sleep(self.latency / 2)
+        for token in tokens:
+            await asyncio.sleep(self.latency / 2 / len(tokens))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token + ' '))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+async def _session(port: int, session: int, turns: int, ttfts: list, latencies: list):
+    async with connect(f'ws://127.0.0.1:{port}/ws?session=bench-{session}') as ws:
+        for turn in range(turns):
+            await ws.send(json.dumps({'message': f'Turn {turn}'}))
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame['type'] == 'done':
+                    ttfts.append(frame['time_to_first_token'])
+                    latencies.append(frame['latency'])
+                    break
+                if frame['type'] == 'error':
+                    raise RuntimeError(frame['error'])
+
+
+async def main(args):
+    lurch = await Lurch(llm_model=FakeChatModel(latency=args.latency),
+                        max_concurrent_llm=args.max_concurrent_llm).startup()
+    server = await LurchServer(lurch=lurch, port=0).start()
+
+    print(f'{"sessions":>8} {"turns":>6} {"seconds":>8} {"turns/s":>8} {"ttft p50":>9} {"latency p95":>12}')
+    try:
+        for sessions in args.sessions:
+            ttfts, latencies = [], []
+            started = time.perf_counter()
+            await asyncio.gather(*(_session(server.bound_port, i, args.turns, ttfts, latencies)
+                                   for i in range(sessions)))
+            elapsed = time.perf_counter() - started
+
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            print(f'{sessions:>8} {len(latencies):>6} {elapsed:>8.2f} {len(latencies) / elapsed:>8.1f} '
+                  f'{statistics.median(ttfts) * 1000:>7.0f}ms {p95 * 1000:>10.0f}ms')
+    finally:
+        await server.aclose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Server mode load test with a fake LLM')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--turns', type=int, default=5, help='Turns per session')
+    parser.add_argument('--latency', type=float, default=0.1, help='Fake LLM latency per call, in seconds')
+    parser.add_argument('--max-concurrent-llm', type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+import logging
+from typing import List, Optional, Set
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
+
+from lurchhome.brain.home_status_renderer import estimate_tokens
+from lurchhome.brain.lurch_prompt import SUMMARY_PROMPT
+from lurchhome.persistence.conversation_store import ConversationStore, Conversation
+
+DEFAULT_HISTORY_MAX_TOKENS = 2000
+
+
+def _turn_tokens(turn: List[BaseMessage]) -> int:
+    return sum(estimate_tokens(m.text) for m in turn)
+
+
+def _transcript(turns: List[List[BaseMessage]]) -> str:
+    lines = []
+    for turn in turns:
+        for m in turn:
+            if isinstance(m, HumanMessage):
+                lines.append(f'User: {m.text}')
+            elif isinstance(m, AIMessage) and m.text:
+                lines.append(f'Lurch: {m.text}')
+    return '\n'.join(lines)
+
+
+class ConversationMemory:
+    """
+    Token-bounded history of a conversation: when the stored turns exceed `max_tokens`, the oldest ones
+    are rolled up into a summary by the LLM, so that the prompt cost of a long conversation stays constant.
+    """
+
+    def __init__(self,
+                 *,
+                 store: ConversationStore,
+                 llm_model: BaseChatModel,
+                 max_tokens: int = DEFAULT_HISTORY_MAX_TOKENS):
+        self.store = store
+        self.llm_model = llm_model
+        self.max_tokens = max_tokens
+        self._rolling_up: Set[str] = set()
+
+    async def conversation(self, conversation_id: str) -> Conversation:
+        return await self.store.get(conversation_id)
+
+    @staticmethod
+    def history(conversation: Conversation) -> List[BaseMessage]:
+        messages: List[BaseMessage] = []
+        if conversation.summary:
+            messages.append(SystemMessage(f'Summary of the earlier conversation:\n{conversation.summary}'))
+        for turn in conversation.turns:
+            messages.extend(turn)
+        return messages
+
+    async def add_turn(self, conversation: Conversation, turn: List[BaseMessage]):
+        await self.store.append_turn(conversation, turn)
+
+    async def roll_up(self,
+                      conversation: Conversation,
+                      *,
+                      llm_model: Optional[BaseChatModel] = None) -> Optional[AIMessage]:
+        """
+        Folds the oldest turns into the summary when over budget. Returns the summarization reply
+        (for the usage accounting), None when nothing had to be done. The conversation lock is only held
+        while the summary replaces the rolled turns, so new turns are not delayed by the LLM call.
+        `llm_model` overrides the model of the memory, e.g. to count the call in the limit of concurrent calls.
+        """
+        if conversation.conversation_id in self._rolling_up:
+            return None
+
+        total = estimate_tokens(conversation.summary or '') + sum(_turn_tokens(t) for t in conversation.turns)
+        if total <= self.max_tokens or len(conversation.turns) < 2:
+            return None
+
+        # Keep the most recent turns within half of the budget, and at least the last one
+        kept, kept_tokens = [], 0
+        for turn in reversed(conversation.turns):
+            if kept and kept_tokens + _turn_tokens(turn) > self.max_tokens // 2:
+                break
+            kept.insert(0, turn)
+            kept_tokens += _turn_tokens(turn)
+
+        rolled = conversation.turns[:len(conversation.turns) - len(kept)]
+        previous = f'Current summary:\n{conversation.summary}\n\n' if conversation.summary else ''
+
+        self._rolling_up.add(conversation.conversation_id)
+        try:
+            reply = await (llm_model or self.llm_model).ainvoke([
+                SystemMessage(SUMMARY_PROMPT),
+                HumanMessage(f'{previous}New messages:\n{_transcript(rolled)}')
+            ])
+
+            async with conversation.lock:
+                # Turns added while the summary was being written are kept as well
+                await self.store.replace(conversation, summary=reply.text, turns=conversation.turns[len(rolled):])
+        finally:
+            self._rolling_up.discard(conversation.conversation_id)
+
+        logging.info('Conversation %s: %i turns rolled up into the summary',
+                     conversation.conversation_id, len(rolled))
+        return reply
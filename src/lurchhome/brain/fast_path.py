@@ -0,0 +1,201 @@
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional, NamedTuple, Set, Tuple
+
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+
+TURN_ON_TOOL = 'HassTurnOn'
+TURN_OFF_TOOL = 'HassTurnOff'
+SET_TEMPERATURE_TOOL = 'HassClimateSetTemperature'
+
+# Only harmless domains: locks, alarms, covers and the like always go through the agent and its guardrails
+ON_OFF_DOMAINS = {'light', 'switch', 'fan', 'input_boolean'}
+CLIMATE_DOMAIN = 'climate'
+
+# Smoothing factor of the average agent turn latency, used to estimate the latency saved by a hit
+LATENCY_SMOOTHING = 0.2
+
+_POLITE = r'(?:(?:please|per favore|per piacere)\s+)?'
+_TAIL = r'(?:\s+(?:please|per favore|per piacere))?\s*[.!]*'
+
+INTENTS: List[Tuple[str, str, re.Pattern]] = [
+    (TURN_ON_TOOL, 'en', re.compile(rf'^{_POLITE}(?:turn|switch)\s+on\s+(?P<target>.+?){_TAIL}$')),
+    (TURN_ON_TOOL, 'en', re.compile(rf'^{_POLITE}(?:turn|switch)\s+(?P<target>.+?)\s+on{_TAIL}$')),
+    (TURN_OFF_TOOL, 'en', re.compile(rf'^{_POLITE}(?:turn|switch)\s+off\s+(?P<target>.+?){_TAIL}$')),
+    (TURN_OFF_TOOL, 'en', re.compile(rf'^{_POLITE}(?:turn|switch)\s+(?P<target>.+?)\s+off{_TAIL}$')),
+    (SET_TEMPERATURE_TOOL, 'en', re.compile(
+        rf'^{_POLITE}set\s+(?P<target>.+?)\s+to\s+(?P<value>\d+(?:[.,]\d+)?)\s*(?:°|degrees?)?\s*c?{_TAIL}$')),
+    (TURN_ON_TOOL, 'it', re.compile(rf'^{_POLITE}accendi\s+(?P<target>.+?){_TAIL}$')),
+    (TURN_OFF_TOOL, 'it', re.compile(rf'^{_POLITE}spegni\s+(?P<target>.+?){_TAIL}$')),
+    (SET_TEMPERATURE_TOOL, 'it', re.compile(
+        rf'^{_POLITE}(?:imposta|porta|metti)\s+(?P<target>.+?)\s+a\s+(?P<value>\d+(?:[.,]\d+)?)\s*(?:°|gradi)?\s*c?{_TAIL}$')),
+]
+
+# A whole word, not the start of a name ("lamp", "island light"), only the elided l' has no space after it
+_ARTICLES = re.compile(r"^(?:(?:the|all(?: the)?|il|lo|la|i|gli|le|tutte le|tutti i)\s+|l'\s*)")
+_ALL_LIGHTS = re.compile(r"^(?:(?P<a1>.+?)\s+lights?|lights?\s+(?:in|of)\s+(?:the\s+)?(?P<a2>.+?)|"
+                         r"luc[ei]\s+(?:del|della|dello|dell'|dei|delle|in|nel|nella)\s*(?P<a3>.+?))$")
+_THERMOSTAT_WORDS = {'thermostat', 'heating', 'temperature', 'termostato', 'riscaldamento', 'temperatura'}
+
+REPLIES = {
+    ('en', TURN_ON_TOOL): 'Very well. {name} is now on.',
+    ('en', TURN_OFF_TOOL): 'Very well. {name} is now off.',
+    ('en', SET_TEMPERATURE_TOOL): 'Certainly. {name} is set to {value}°.',
+    ('it', TURN_ON_TOOL): 'Molto bene. {name}: acceso.',
+    ('it', TURN_OFF_TOOL): 'Molto bene. {name}: spento.',
+    ('it', SET_TEMPERATURE_TOOL): 'Certamente. {name} impostato a {value}°.',
+}
+
+# The command was sent but its outcome is unknown: never claim it was done, never send it twice
+UNCONFIRMED_REPLIES = {
+    'en': 'I could not confirm that, I am afraid. Home Assistant did not answer about {name}.',
+    'it': 'Temo di non poterlo confermare. Home Assistant non ha risposto su {name}.',
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).lower().replace('’', "'")
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class FastPathMatch(NamedTuple):
+    tool: str
+    params: Dict[str, Any]
+    reply: str
+    unconfirmed_reply: str
+
+
+class FastPath:
+    """
+    Deterministic handling of simple device commands ("turn off the kitchen light", "set the thermostat to 21"),
+    matched against the entity and area names of the home state mirror and the tools exposed by Home Assistant.
+    Only unambiguous commands are matched: anything else returns None and is left to the agent.
+    """
+
+    def __init__(self, *, state_mirror: HomeStateMirror):
+        self.state_mirror = state_mirror
+        self.tool_names: Set[str] = set()
+
+        self._hits: int = 0
+        self._misses: int = 0
+        self._failures: int = 0
+        self._unconfirmed: int = 0
+        self._saved_seconds: float = 0
+        self._agent_latency: Optional[float] = None
+
+    def set_tools(self, tool_names: Set[str]) -> None:
+        self.tool_names = set(tool_names)
+
+    def match(self, message: str) -> Optional[FastPathMatch]:
+        if not self.state_mirror.is_live:
+            return None
+
+        text = _normalize(message)
+        for tool, language, pattern in INTENTS:
+            if tool not in self.tool_names:
+                continue
+
+            m = pattern.match(text)
+            if not m:
+                continue
+
+            target = _ARTICLES.sub('', m.group('target'))
+            if tool == SET_TEMPERATURE_TOOL:
+                resolved = self.__resolve_climate(target, float(m.group('value').replace(',', '.')))
+            else:
+                resolved = self.__resolve_on_off(target)
+
+            if resolved is None:
+                return None
+
+            params, name = resolved
+            return FastPathMatch(tool=tool,
+                                 params=params,
+                                 reply=REPLIES[(language, tool)].format(name=name, value=params.get('temperature')),
+                                 unconfirmed_reply=UNCONFIRMED_REPLIES[language].format(name=name))
+
+        return None
+
+    def record_hit(self, seconds: float) -> float:
+        self._hits += 1
+        saved = max(0.0, self._agent_latency - seconds) if self._agent_latency is not None else 0.0
+        self._saved_seconds += saved
+        return saved
+
+    def record_miss(self, *, failed: bool = False) -> None:
+        self._misses += 1
+        if failed:
+            self._failures += 1
+
+    def record_unconfirmed(self) -> None:
+        self._unconfirmed += 1
+
+    def record_agent_turn(self, seconds: float) -> None:
+        if self._agent_latency is None:
+            self._agent_latency = seconds
+        else:
+            self._agent_latency += LATENCY_SMOOTHING * (seconds - self._agent_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._hits + self._misses + self._unconfirmed
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'failures': self._failures,
+            'unconfirmed': self._unconfirmed,
+            'hit_rate': self._hits / total if total else 0,
+            'saved_seconds': self._saved_seconds,
+            'agent_latency': self._agent_latency
+        }
+
+    def __candidates(self, domains: Set[str]) -> List[Tuple[str, str]]:
+        candidates = []
+        for state in self.state_mirror.states():
+            entity_id = state.get('entity_id') or ''
+            if entity_id.split('.', 1)[0] in domains and not self.state_mirror.is_hidden(entity_id):
+                name = (state.get('attributes') or {}).get('friendly_name') or entity_id
+                candidates.append((entity_id, name))
+        return candidates
+
+    def __by_name(self, target: str, domains: Set[str]) -> Optional[str]:
+        names = [name for entity_id, name in self.__candidates(domains)
+                 if _normalize(name) == target or entity_id == target]
+        # The same name on two entities is ambiguous
+        return names[0] if len(names) == 1 else None
+
+    def __area(self, target: str, domain: str) -> Optional[str]:
+        areas = {self.state_mirror.area_of(entity_id) for entity_id, _ in self.__candidates({domain})}
+        matches = {area for area in areas if area and _normalize(area) == target}
+        return matches.pop() if len(matches) == 1 else None
+
+    def __resolve_on_off(self, target: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        name = self.__by_name(target, ON_OFF_DOMAINS)
+        if name:
+            return {'name': name}, name
+
+        m = _ALL_LIGHTS.match(target)
+        if m:
+            area = self.__area(_ARTICLES.sub('', m.group('a1') or m.group('a2') or m.group('a3')), 'light')
+            if area:
+                return {'area': area, 'domain': ['light']}, area
+
+        return None
+
+    def __resolve_climate(self, target: str, temperature: float) -> Optional[Tuple[Dict[str, Any], str]]:
+        name = self.__by_name(target, {CLIMATE_DOMAIN})
+        if not name and target in _THERMOSTAT_WORDS:
+            # "the thermostat" is only meaningful when there is exactly one
+            candidates = self.__candidates({CLIMATE_DOMAIN})
+            name = candidates[0][1] if len(candidates) == 1 else None
+
+        if not name:
+            return None
+
+        entity = next(self.state_mirror.get(entity_id) for entity_id, n in self.__candidates({CLIMATE_DOMAIN})
+                      if n == name)
+        attributes = entity.get('attributes') or {}
+        if not attributes.get('min_temp', float('-inf')) <= temperature <= attributes.get('max_temp', float('inf')):
+            return None
+
+        value = int(temperature) if temperature.is_integer() else temperature
+        return {'name': name, 'temperature': value}, name
@@ -0,0 +1,270 @@
+import json
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Tuple, NamedTuple
+
+DEFAULT_MAX_TOKENS = 1500
+# Shares of `max_tokens`: at most this much goes to the catalogue, and a pinned snapshot leaves this much of
+# what remains to the changes of the next turns
+CATALOGUE_SHARE = 0.4
+CHANGES_SHARE = 0.3
+MAX_TRACKED_CONVERSATIONS = 256
+NO_AREA = 'Other'
+
+IGNORED_DOMAINS = {
+    'automation', 'conversation', 'event', 'image', 'persistent_notification', 'stt', 'sun', 'tag', 'tts',
+    'update', 'wake_word', 'zone'
+}
+
+IGNORED_ATTRIBUTES = {
+    'friendly_name', 'unit_of_measurement', 'icon', 'entity_picture', 'attribution', 'supported_features',
+    'supported_color_modes', 'color_mode', 'effect_list', 'hs_color', 'rgb_color', 'xy_color', 'min_mireds',
+    'max_mireds', 'min_color_temp_kelvin', 'max_color_temp_kelvin', 'hvac_modes', 'fan_modes', 'preset_modes',
+    'swing_modes', 'min_temp', 'max_temp', 'target_temp_step', 'state_class', 'device_class', 'last_reset',
+    'restored', 'editable', 'id', 'options', 'source_list', 'sound_mode_list', 'entity_id', 'user_id', 'device_trackers',
+    'event_types', 'access_token', 'token'
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough estimate (~4 chars per token), good enough for budgeting and reporting
+    return (len(text) + 3) // 4
+
+
+def _domain_of(entity_id: str) -> str:
+    return entity_id.split('.', 1)[0]
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f'{value:g}'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'), default=str)
+    return str(value)
+
+
+def _entity_name(state: Dict[str, Any]) -> str:
+    return (state.get('attributes') or {}).get('friendly_name') or state.get('entity_id')
+
+
+def _entity_line(state: Dict[str, Any], *, with_name: bool = True) -> str:
+    attributes = state.get('attributes') or {}
+    value = state.get('state')
+    if attributes.get('unit_of_measurement'):
+        value = f"{value} {attributes['unit_of_measurement']}"
+
+    extra = [f'{k}={_format_value(v)}' for k, v in sorted(attributes.items())
+             if k not in IGNORED_ATTRIBUTES and v is not None and v != [] and v != {}]
+
+    line = f'{_entity_name(state)} [{state.get("entity_id")}]={value}' if with_name else f'{state.get("entity_id")}={value}'
+    if extra:
+        line += f' ({", ".join(extra)})'
+    return line
+
+
+class HomeStatus(NamedTuple):
+    # Names and areas of the entities: only changes when devices are added, renamed or moved
+    catalogue: Optional[str] = None
+    # Snapshot of the states pinned for the conversation: same text until a new snapshot is taken
+    pinned: Optional[str] = None
+    # What must be sent fresh on every turn
+    live: Optional[str] = None
+
+    def text(self) -> str:
+        return '\n\n'.join(part for part in self if part)
+
+
+def _omitted(count: int) -> str:
+    return f'…{count} entities omitted (status size limit)'
+
+
+def _line_tokens(text: str) -> int:
+    # Counting the newline joining it to the previous line, so that the sum bounds the size of the whole text
+    return estimate_tokens('\n' + text)
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4] + '\n…(truncated)'
+
+
+class HomeStatusRenderer:
+    """
+    Compact, token-budgeted rendering of the home status. Entities are grouped by area and domain and,
+    when a conversation id is given, the first full snapshot of that conversation is pinned and later turns get
+    the same snapshot followed by what changed since then. The pinned text stays byte-identical between turns,
+    and a new snapshot is taken once the changes no longer fit in the budget next to it.
+
+    `render_parts` splits the status for a cache-friendly prompt: the entity catalogue (names and areas), the
+    pinned snapshot, and the live part; the states are then rendered by entity id only, the names being
+    in the catalogue. `max_tokens` bounds all the parts together.
+    """
+
+    def __init__(self, *, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self._baselines: OrderedDict[str, Tuple[Dict[str, str], str]] = OrderedDict()
+
+    def reset(self, conversation_id: str) -> None:
+        self._baselines.pop(conversation_id, None)
+
+    def render(self,
+               states: List[Dict[str, Any]],
+               *,
+               area_of: Callable[[str], Optional[str]] = lambda _: None,
+               is_hidden: Callable[[str], bool] = lambda _: False,
+               conversation_id: Optional[str] = None) -> str:
+
+        groups, visible = self.__group(states, area_of, is_hidden)
+        lines = {entity_id: _entity_line(state) for entity_id, state in visible.items()}
+        return self.__render_states(groups, lines, conversation_id, grouped=True, budget=self.max_tokens).text()
+
+    def render_parts(self,
+                     states: List[Dict[str, Any]],
+                     *,
+                     area_of: Callable[[str], Optional[str]] = lambda _: None,
+                     is_hidden: Callable[[str], bool] = lambda _: False,
+                     conversation_id: Optional[str] = None) -> HomeStatus:
+
+        groups, visible = self.__group(states, area_of, is_hidden)
+        catalogue = self.__render_catalogue(groups, visible, budget=int(self.max_tokens * CATALOGUE_SHARE))
+        lines = {entity_id: _entity_line(state, with_name=False) for entity_id, state in visible.items()}
+        status = self.__render_states(groups, lines, conversation_id, grouped=False,
+                                      budget=self.max_tokens - estimate_tokens(catalogue))
+        return status._replace(catalogue=catalogue)
+
+    def truncate(self, text: str) -> str:
+        return _truncate(text, self.max_tokens)
+
+    @staticmethod
+    def __group(states: List[Dict[str, Any]],
+                area_of: Callable[[str], Optional[str]],
+                is_hidden: Callable[[str], bool]) -> Tuple[Dict[tuple, List[str]], Dict[str, Dict[str, Any]]]:
+        visible: Dict[str, Dict[str, Any]] = {}
+        groups: Dict[tuple, List[str]] = {}
+        for state in sorted(states, key=lambda s: s.get('entity_id', '')):
+            entity_id = state.get('entity_id')
+            if not entity_id or _domain_of(entity_id) in IGNORED_DOMAINS or is_hidden(entity_id):
+                continue
+
+            visible[entity_id] = state
+            groups.setdefault((area_of(entity_id) or NO_AREA, _domain_of(entity_id)), []).append(entity_id)
+        return groups, visible
+
+    def __render_states(self,
+                        groups: Dict[tuple, List[str]],
+                        lines: Dict[str, str],
+                        conversation_id: Optional[str],
+                        *,
+                        grouped: bool,
+                        budget: int) -> HomeStatus:
+        if not conversation_id:
+            return HomeStatus(live=self.__render_full(groups, lines, grouped=grouped, budget=budget))
+
+        baseline = self._baselines.get(conversation_id)
+        if baseline is not None:
+            changes = self.__render_changes(baseline[0], lines)
+            if estimate_tokens(baseline[1]) + estimate_tokens(changes) <= budget:
+                self._baselines.move_to_end(conversation_id)
+                return HomeStatus(pinned=baseline[1], live=changes)
+
+        # Room is left for the changes of the next turns
+        snapshot = self.__render_full(groups, lines, grouped=grouped, budget=budget - int(budget * CHANGES_SHARE))
+        self._baselines[conversation_id] = (lines, snapshot)
+        self._baselines.move_to_end(conversation_id)
+        while len(self._baselines) > MAX_TRACKED_CONVERSATIONS:
+            self._baselines.popitem(last=False)
+
+        return HomeStatus(pinned=snapshot)
+
+    @staticmethod
+    def __render_catalogue(groups: Dict[tuple, List[str]], states: Dict[str, Dict[str, Any]], *, budget: int) -> str:
+        out = ['Devices (area > domain: name [entity_id]):']
+        budget -= estimate_tokens(out[0]) + _line_tokens(_omitted(len(states)))
+        current_area = None
+        omitted = 0
+
+        for (area, domain) in sorted(groups, key=lambda g: (g[0] == NO_AREA, g)):
+            entries = [f'{_entity_name(states[entity_id])} [{entity_id}]' for entity_id in groups[(area, domain)]]
+            chunk = [f'{area}:'] if area != current_area else []
+            chunk.append(f' {domain}: {", ".join(entries)}')
+
+            cost = _line_tokens('\n'.join(chunk))
+            if cost > budget:
+                omitted += len(entries)
+                continue
+
+            budget -= cost
+            current_area = area
+            out.extend(chunk)
+
+        if omitted:
+            out.append(_omitted(omitted))
+
+        return '\n'.join(out)
+
+    def __render_full(self,
+                      groups: Dict[tuple, List[str]],
+                      lines: Dict[str, str],
+                      *,
+                      grouped: bool,
+                      budget: int) -> str:
+        if not grouped:
+            return self.__render_flat(lines, budget=budget)
+
+        out = ['Live Context (area > domain: name [entity_id]=state):']
+        budget -= estimate_tokens(out[0]) + _line_tokens(_omitted(len(lines)))
+        current_area = None
+        omitted = 0
+
+        for (area, domain) in sorted(groups, key=lambda g: (g[0] == NO_AREA, g)):
+            for entity_id in groups[(area, domain)]:
+                chunk = []
+                if area != current_area:
+                    chunk.append(f'{area}:')
+                chunk.append(f' {domain}: {lines[entity_id]}')
+
+                cost = _line_tokens('\n'.join(chunk))
+                if cost > budget:
+                    omitted += 1
+                    continue
+
+                budget -= cost
+                current_area = area
+                out.extend(chunk)
+
+        if omitted:
+            out.append(_omitted(omitted))
+
+        return '\n'.join(out)
+
+    @staticmethod
+    def __render_flat(lines: Dict[str, str], *, budget: int) -> str:
+        out = ['Live Context (entity_id=state):']
+        budget -= estimate_tokens(out[0]) + _line_tokens(_omitted(len(lines)))
+        omitted = 0
+
+        for line in lines.values():
+            cost = _line_tokens(f' {line}')
+            if cost > budget:
+                omitted += 1
+                continue
+            budget -= cost
+            out.append(f' {line}')
+
+        if omitted:
+            out.append(_omitted(omitted))
+
+        return '\n'.join(out)
+
+    @staticmethod
+    def __render_changes(baseline: Dict[str, str], lines: Dict[str, str]) -> str:
+        changed = [line for entity_id, line in lines.items() if baseline.get(entity_id) != line]
+        removed = [entity_id for entity_id in baseline if entity_id not in lines]
+
+        if not changed and not removed:
+            return 'Live Context: no changes since the snapshot above.'
+
+        out = ['Live Context, changes since the snapshot above:']
+        out.extend(f' {line}' for line in changed)
+        out.extend(f' {entity_id}: removed' for entity_id in removed)
+        return '\n'.join(out)
@@ -1,19 +1,108 @@
+import asyncio
+import contextlib
 import json
 import logging
-from typing import Optional, AsyncIterator, Self
+import time
+from collections import OrderedDict
+from typing import Optional, AsyncIterator, Self, List, Dict, Set, Tuple, Any, Callable, AsyncContextManager
 
+import httpx
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import BaseMessage, SystemMessage, AIMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import Runnable
+from langchain_core.messages import BaseMessage, SystemMessage, AIMessage, HumanMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import Runnable, RunnableBinding, RunnableConfig
+from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
+from redis import RedisError
 
+from lurchhome import tracing
+from lurchhome.brain.conversation_memory import ConversationMemory
+from lurchhome.brain.fast_path import FastPath
+from lurchhome.brain.home_status_renderer import HomeStatusRenderer, HomeStatus, DEFAULT_MAX_TOKENS, estimate_tokens
+from lurchhome.brain.lurch_events import LurchEvent, TextDelta, ToolCall, ToolResult, TurnStats, SOURCE_AGENT, \
+    SOURCE_FAST_PATH, SOURCE_CACHE
 from lurchhome.brain.lurch_prompt import LURCH_PROMPT
-from lurchhome.integrations.ha.ha_mcp_connector import HAMCPConnector
+from lurchhome.brain.model_router import ModelRouter, ModelRoute, llm_name
+from lurchhome.brain.response_cache import ResponseCache
+from lurchhome.integrations.ha.ha_mcp_connector import HAMCPConnector, MCPError, MCPConnectionError
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror, render_home_status
 from lurchhome.integrations.ha.ha_ws_connector import HAWSConnector
-from lurchhome.persistence.storage_handler import StorageHandler
+from lurchhome.persistence.conversation_store import Conversation
+from lurchhome.persistence.storage_handler import StorageHandler, LLMUsage
+from lurchhome.tools.tools_batcher import batching_turn
+from lurchhome.tools.tools_cache import ToolsCache
+from lurchhome.tools.tools_results import ToolResultsCompactor
+from lurchhome.tools.tools_selector import ToolsSelector
 from lurchhome.tools.tools_utils import build_tools
 
+NO_HOME_STATUS = 'Live Context: not available.'
+DEFAULT_CONVERSATION_ID = 'default'
+MAX_CACHED_AGENTS = 32
+
+# Failed tool loads are retried with an exponential backoff, while the agent turns wait for them up to a limit
+TOOLS_RETRY_BASE_DELAY = 1.0
+TOOLS_RETRY_MAX_DELAY = 60.0
+TOOLS_WAIT_TIMEOUT = 30.0
+
+# Fast path outcomes are counted in memory and written to Redis in batches: every N turns or every N seconds
+FAST_PATH_STATS_BATCH = 20
+FAST_PATH_STATS_INTERVAL = 60.0
+
+
+def _token_usage(m: AIMessage) -> tuple[int, int, int]:
+    """
+    Input, output and cached input tokens of a LLM reply. Cached tokens are only known when the provider
+    reports them (OpenAI-style prompt caching, Anthropic cache reads): Ollama reuses its KV cache but does not tell.
+    """
+    if getattr(m, 'usage_metadata', None):
+        input_details = m.usage_metadata.get('input_token_details') or {}
+        return (m.usage_metadata.get('input_tokens') or 0,
+                m.usage_metadata.get('output_tokens') or 0,
+                input_details.get('cache_read') or 0)
+
+    response_metadata = getattr(m, 'response_metadata', None) or {}
+    if 'prompt_eval_count' in response_metadata and 'eval_count' in response_metadata:
+        return response_metadata.get('prompt_eval_count') or 0, response_metadata.get('eval_count') or 0, 0
+    elif 'token_usage' in response_metadata:
+        token_usage = response_metadata.get('token_usage') or {}
+        prompt_details = token_usage.get('prompt_tokens_details') or {}
+        return (token_usage.get('prompt_tokens') or 0,
+                token_usage.get('completion_tokens') or 0,
+                prompt_details.get('cached_tokens') or 0)
+
+    return 0, 0, 0
+
+
+def _model_key(m: AIMessage, llm_model: BaseChatModel) -> str:
+    response_metadata = getattr(m, 'response_metadata', None) or {}
+    provider = response_metadata.get('model_provider') or getattr(llm_model, '_llm_type', None) or 'unknown'
+    model = (response_metadata.get('model_name') or response_metadata.get('model')
+             or getattr(llm_model, 'model_name', None) or getattr(llm_model, 'model', None) or 'unknown')
+    return f'{provider}/{model}'
+
+
+class ToolsUnavailableError(Exception):
+    pass
+
+
+class _SlottedModel(RunnableBinding):
+    """
+    Chat model whose every call runs inside an LLM slot: the slot is held for the model call alone, not while
+    the tools run or the answer is sent.
+    """
+    slot: Optional[Callable[[], AsyncContextManager]] = None
+
+    def bind_tools(self, tools, **kwargs) -> '_SlottedModel':
+        bound = self.bound.bind_tools(tools, **kwargs)
+        if isinstance(bound, RunnableBinding):
+            return _SlottedModel(bound=bound.bound, kwargs={**self.kwargs, **bound.kwargs}, config=bound.config,
+                                 slot=self.slot)
+        return _SlottedModel(bound=bound, kwargs=self.kwargs, config=self.config, slot=self.slot)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        async with self.slot():
+            return await super().ainvoke(input, config, **kwargs)
+
 
 class Lurch:
 
@@ -22,7 +111,17 @@ class Lurch:
                  llm_model: BaseChatModel,
                  ha_mcp_connector: Optional[HAMCPConnector] = None,
                  storage_handler: Optional[StorageHandler] = None,
-                 ha_ws_connector: Optional[HAWSConnector] = None):
+                 ha_ws_connector: Optional[HAWSConnector] = None,
+                 home_status_max_tokens: int = DEFAULT_MAX_TOKENS,
+                 tools_cache: Optional[ToolsCache] = None,
+                 conversation_memory: Optional[ConversationMemory] = None,
+                 fast_path: Optional[FastPath] = None,
+                 tools_top_k: int = 0,
+                 core_tools: Optional[Set[str]] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 max_concurrent_llm: Optional[int] = None,
+                 model_router: Optional[ModelRouter] = None,
+                 tool_results_compactor: Optional[ToolResultsCompactor] = None):
 
         if llm_model is None:
             raise TypeError("model can't be None")
@@ -32,60 +131,560 @@ class Lurch:
         self.storage_handler = storage_handler
         self.chain = Optional[Runnable]
         self.ha_ws_connector = ha_ws_connector
+        self.home_status_renderer = HomeStatusRenderer(max_tokens=home_status_max_tokens)
+        self.tools_cache = tools_cache
+        self.conversation_memory = conversation_memory
+        self.fast_path = fast_path
+        self.tools_top_k = tools_top_k
+        self.core_tools = core_tools
+        self.response_cache = response_cache
+        self.model_router = model_router
+        self.tool_results_compactor = tool_results_compactor
+        # Shared by all the sessions: a local model serves few requests at once, the others wait their turn
+        self._llm_slots = asyncio.Semaphore(max_concurrent_llm) if max_concurrent_llm else None
+        self._llm_waiting: int = 0
+        self._llm_in_flight: int = 0
+        self._llm_peak_in_flight: int = 0
+        self.tools_selector: Optional[ToolsSelector] = None
+        self._prompt: Optional[ChatPromptTemplate] = None
+        self._tools: List[BaseTool] = []
+        self._agents: OrderedDict[tuple, Runnable] = OrderedDict()
+        self._background_tasks = set()
+        self._tools_loaded: Optional[asyncio.Task] = None
+        self._fast_path_pending: Dict[str, float] = {}
+        self._full_status_tokens: Optional[Tuple[tuple, int]] = None
+        self._fast_path_flushed_at: float = time.monotonic()
 
-    async def startup(self) -> Self:
-        prompt = ChatPromptTemplate.from_messages([
+    async def startup(self, *, wait_for_tools: bool = True) -> Self:
+        """
+        Builds the agent. Without `wait_for_tools` it returns right away and the MCP tools are loaded in
+        background, retried until they load: the agent turns wait for them (failing with ToolsUnavailableError
+        after TOOLS_WAIT_TIMEOUT), while cached answers can already be served.
+        """
+        if self.ha_mcp_connector:
+            self._tools_loaded = asyncio.create_task(self.__load_tools(), name='load_tools')
+            if wait_for_tools:
+                await self._tools_loaded
+        else:
+            self.__build_chain([])
+        return self
+
+    async def __load_tools(self):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                tools = await build_tools(with_and_callable_tools=self.ha_mcp_connector,
+                                          tools_cache=self.tools_cache,
+                                          on_tools_changed=self.__on_tools_changed,
+                                          compactor=self.tool_results_compactor)
+                break
+            except Exception as e:
+                delay = min(TOOLS_RETRY_MAX_DELAY, TOOLS_RETRY_BASE_DELAY * 2 ** attempt)
+                attempt += 1
+                logging.error('Unable to load the tools, retrying in %.0f s: %s', delay, e)
+                await asyncio.sleep(delay)
+
+        self.__build_chain(tools)
+        logging.info('Startup: %i tools loaded in %.0f ms', len(tools), (time.monotonic() - started) * 1000)
+
+    def __build_chain(self, tools: List[BaseTool]):
+        # Ordered from the most to the least stable part, so that consecutive turns share the longest possible
+        # prefix (after the tool schemas, sent first by the providers) and hit the Ollama KV cache or the
+        # provider prompt cache: the persona, the entity catalogue, the states pinned for the conversation,
+        # the history (which only grows at the end) and last what changed since the pinned states.
+        self._prompt = ChatPromptTemplate.from_messages([
             SystemMessage(LURCH_PROMPT),
-            SystemMessage("{home_status}"),
+            MessagesPlaceholder("catalogue", optional=True),
+            MessagesPlaceholder("pinned_status", optional=True),
+            MessagesPlaceholder("history", optional=True),
+            MessagesPlaceholder("live_status", optional=True),
             ("human", "{input}")
         ])
 
-        tools = []
-        if self.ha_ws_connector:
-            tools = await build_tools(with_and_callable_tools=self.ha_mcp_connector)
+        self._tools = tools
+        self.agent = create_react_agent(self.__slotted(self.llm_model), tools)
+        self.chain = self._prompt | self.agent
+        self._agents.clear()
 
-        self.chain = prompt | create_react_agent(self.llm_model, tools)
-        return self
+        self.tools_selector = None
+        if self.tools_top_k and len(tools) > self.tools_top_k:
+            self.tools_selector = ToolsSelector(tools=tools, top_k=self.tools_top_k, core=self.core_tools)
 
-    async def __save_analytics(self, m: AIMessage):
-        if self.storage_handler and hasattr(m, 'response_metadata'):
-            response_metadata = m.response_metadata
-            try:
-                input_tokens, output_tokens = 0, 0
-                if 'prompt_eval_count' in response_metadata and 'eval_count' in response_metadata:
-                    input_tokens = response_metadata.get('prompt_eval_count')
-                    output_tokens = response_metadata.get('eval_count')
-                elif 'token_usage' in response_metadata:
-                    token_usage = response_metadata.get('token_usage')
-                    input_tokens = token_usage.get('prompt_tokens')
-                    output_tokens = token_usage.get('completion_tokens')
-
-                if input_tokens + output_tokens > 0:
-                    total_input_tokens, total_output_tokens = await self.storage_handler.update_llm_tokens(
-                        input_tokens=input_tokens,
-                        output_tokens=output_tokens)
-                    logging.info('Current step LLM usage stats: %i->%i. Total LLM stats: %i->%i',
-                                 input_tokens, output_tokens,
-                                 total_input_tokens, total_output_tokens)
-            except KeyError:
-                pass
-
-    async def talk_to_lurch(self, message: str = "") -> AsyncIterator[BaseMessage]:
-        evaluate_payload = {"input": message}
+        if self.fast_path:
+            self.fast_path.set_tools({tool.name for tool in tools})
+
+    def __agent_for(self, query: str, route: Optional[ModelRoute] = None) -> Runnable:
+        if not self.tools_selector and not route:
+            return self.agent
+
+        tools = self.tools_selector.select(query) if self.tools_selector else self._tools
+        names = frozenset(tool.name for tool in tools)
+        logging.debug('Tools selected: %s', sorted(names))
+
+        # Compiling the agent graph is not free: the agents of the recent model and tool subsets are kept
+        key = (route.route if route else None, names)
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = create_react_agent(self.__slotted(route.llm_model if route else self.llm_model), tools)
+            self._agents[key] = agent
+            while len(self._agents) > MAX_CACHED_AGENTS:
+                self._agents.popitem(last=False)
+
+        self._agents.move_to_end(key)
+        return agent
+
+    def __slotted(self, llm_model: BaseChatModel) -> _SlottedModel:
+        return _SlottedModel(bound=llm_model, kwargs={}, slot=self.__llm_slot)
+
+    async def __on_tools_changed(self, tools: List[BaseTool]):
+        logging.info('Tools changed, rebuilding the agent with %i tools', len(tools))
+        self.__build_chain(tools)
+
+    def __collect_usage(self,
+                        turn_usage: Dict[str, LLMUsage],
+                        m: BaseMessage,
+                        llm_model: Optional[BaseChatModel] = None):
+        if not isinstance(m, AIMessage):
+            return
+
+        input_tokens, output_tokens, cached_tokens = _token_usage(m)
+        if input_tokens + output_tokens > 0:
+            model = _model_key(m, llm_model or self.llm_model)
+            usage = turn_usage.get(model, LLMUsage())
+            turn_usage[model] = LLMUsage(input=usage.input + input_tokens,
+                                         output=usage.output + output_tokens,
+                                         calls=usage.calls + 1,
+                                         cached=usage.cached + cached_tokens)
+            logging.info('Current step LLM usage stats (%s): %i->%i, %i input tokens cached',
+                         model, input_tokens, output_tokens, cached_tokens)
+
+    def __save_analytics(self, turn_usage: Dict[str, LLMUsage]):
+        if not self.storage_handler or not turn_usage:
+            return
+
+        # Flushed once per turn, off the response path
+        self.__in_background(self.__flush_usage(turn_usage), name='flush_llm_usage')
+
+    def __in_background(self, coro, *, name: str):
+        task = asyncio.create_task(coro, name=name)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def __flush_usage(self, turn_usage: Dict[str, LLMUsage]):
+        try:
+            total_input_tokens, total_output_tokens = await self.storage_handler.record_llm_usage(usage=turn_usage)
+            logging.info('Total LLM stats: %i->%i', total_input_tokens, total_output_tokens)
+        except RedisError as e:
+            logging.error(e)
+
+    def __save_home_status_analytics(self, *, full_tokens: int, status: str):
+        saved_tokens = full_tokens - estimate_tokens(status)
+        if self.storage_handler and saved_tokens > 0:
+            self.__in_background(self.__flush_home_status_saved_tokens(saved_tokens),
+                                 name='flush_home_status_saved_tokens')
+
+    async def __flush_home_status_saved_tokens(self, saved_tokens: int):
+        try:
+            total_saved_tokens = await self.storage_handler.update_home_status_saved_tokens(saved_tokens=saved_tokens)
+            logging.info('Home status tokens saved: %i. Total saved: %i', saved_tokens, total_saved_tokens)
+        except RedisError as e:
+            logging.error(e)
+
+    def __full_status_tokens(self, state_mirror: HomeStateMirror) -> int:
+        # What GetLiveContext would have sent: rendered once per snapshot, not on every turn
+        snapshot = (state_mirror.seeded_at, state_mirror.exposure_known)
+        if self._full_status_tokens is None or self._full_status_tokens[0] != snapshot:
+            self._full_status_tokens = (snapshot, estimate_tokens(render_home_status(state_mirror.states())))
+        return self._full_status_tokens[1]
+
+    async def __roll_up(self, conversation: Conversation):
+        try:
+            # Summaries share the limit of concurrent LLM calls with the turns
+            reply = await self.conversation_memory.roll_up(
+                conversation, llm_model=self.__slotted(self.conversation_memory.llm_model))
+        except Exception as e:
+            logging.error('Unable to summarize conversation %s: %s', conversation.conversation_id, e)
+            return
+
+        if reply is not None:
+            turn_usage: Dict[str, LLMUsage] = {}
+            self.__collect_usage(turn_usage, reply)
+            self.__save_analytics(turn_usage)
+
+    async def __try_fast_path(self, message: str) -> Optional[AIMessage]:
+        match = self.fast_path.match(message)
+        if match is None:
+            self.fast_path.record_miss()
+            self.__save_fast_path_stats(misses=1)
+            return None
+
+        started = time.monotonic()
+        try:
+            result = await self.ha_mcp_connector.call_tool(name=match.tool, params=match.params)
+            error = result.get('content') if result.get('isError') else None
+        except MCPError as e:
+            error = e
+        except (asyncio.TimeoutError, MCPConnectionError, httpx.HTTPError) as e:
+            # The command may have been carried out: running it again through the agent could act twice
+            logging.warning('Fast path %s not confirmed, not retrying: %r', match.tool, e)
+            self.fast_path.record_unconfirmed()
+            self.__save_fast_path_stats(unconfirmed=1)
+            return AIMessage(content=match.unconfirmed_reply)
+
+        if error:
+            # Home Assistant answered with an error: nothing was done, the agent can try its own way
+            logging.warning('Fast path %s failed, falling back to the agent: %s', match.tool, error)
+            self.fast_path.record_miss(failed=True)
+            self.__save_fast_path_stats(misses=1, failures=1)
+            return None
+
+        saved_seconds = self.fast_path.record_hit(time.monotonic() - started)
+        logging.info('Fast path: %s %s (%.0f ms saved)', match.tool, match.params, saved_seconds * 1000)
+        self.__save_fast_path_stats(hits=1, saved_seconds=saved_seconds)
+        return AIMessage(content=match.reply)
+
+    def __save_fast_path_stats(self, **counts: float):
+        if not self.storage_handler:
+            return
+
+        for field, count in counts.items():
+            self._fast_path_pending[field] = self._fast_path_pending.get(field, 0) + count
+
+        turns = sum(self._fast_path_pending.get(field, 0) for field in ('hits', 'misses', 'unconfirmed'))
+        if turns < FAST_PATH_STATS_BATCH and \
+                time.monotonic() - self._fast_path_flushed_at < FAST_PATH_STATS_INTERVAL:
+            return
+
+        pending, self._fast_path_pending = self._fast_path_pending, {}
+        self._fast_path_flushed_at = time.monotonic()
+        self.__in_background(self.__flush_fast_path_stats(pending), name='flush_fast_path_stats')
+
+    async def __flush_fast_path_stats(self, pending: Dict[str, float]):
+        try:
+            stats = await self.storage_handler.record_fast_path(**pending)
+            total = stats.get('hits', 0) + stats.get('misses', 0) + stats.get('unconfirmed', 0)
+            logging.info('Fast path hit rate: %.1f%%, total saved: %.1f s',
+                         100 * stats.get('hits', 0) / total if total else 0, stats.get('saved_seconds', 0))
+        except RedisError as e:
+            logging.error(e)
+
+    async def __get_home_status(self, conversation_id: Optional[str] = None) -> HomeStatus:
+        state_mirror = self.ha_ws_connector.state_mirror if self.ha_ws_connector else None
+
+        # The mirror stands in for GetLiveContext only when it lists the same entities: the exposed ones
+        if state_mirror and state_mirror.is_live and (state_mirror.exposure_known or not self.ha_mcp_connector):
+            states = state_mirror.states()
+            status = self.home_status_renderer.render_parts(states,
+                                                            area_of=state_mirror.area_of,
+                                                            is_hidden=state_mirror.is_hidden,
+                                                            conversation_id=conversation_id)
+            self.__save_home_status_analytics(full_tokens=self.__full_status_tokens(state_mirror),
+                                              status=status.text())
+            return status
 
         if self.ha_mcp_connector:
-            live_context = await self.ha_mcp_connector.call_tool(name='GetLiveContext', params={})
-            status = (json.loads(live_context.get('content', {})[0].get('text')))['result']
+            if state_mirror:
+                logging.info('Home state mirror not live or exposed entities unknown, '
+                             'falling back to GetLiveContext')
+
+            try:
+                live_context = await self.ha_mcp_connector.call_tool(name='GetLiveContext', params={})
+            except (asyncio.TimeoutError, MCPError, MCPConnectionError, httpx.HTTPError) as e:
+                logging.error('Unable to get the live context: %s', e)
+                return HomeStatus(live=NO_HOME_STATUS)
+
+            full_status = (json.loads(live_context.get('content', {})[0].get('text')))['result']
+            status = self.home_status_renderer.truncate(full_status)
+            self.__save_home_status_analytics(full_tokens=estimate_tokens(full_status), status=status)
+            return HomeStatus(live=status)
+
+        return HomeStatus(live=NO_HOME_STATUS)
+
+    async def talk_to_lurch(self,
+                            message: str = "",
+                            conversation_id: Optional[str] = None) -> AsyncIterator[BaseMessage]:
+        async for kind, data in self.__turn(message, conversation_id):
+            if kind == 'message' and isinstance(data, AIMessage):
+                yield data
+
+    async def stream(self, message: str = "", conversation_id: Optional[str] = None) -> AsyncIterator[LurchEvent]:
+        """
+        Streaming version of `talk_to_lurch`: yields the answer text as it is generated (TextDelta),
+        the tool calls and their results, and the turn timings (TurnStats) as the last event.
+        """
+        streamed = False
+        async for kind, data in self.__turn(message, conversation_id):
+            if kind == 'delta':
+                streamed = True
+                yield TextDelta(data)
+            elif kind == 'stats':
+                yield data
+            elif isinstance(data, AIMessage):
+                for tool_call in data.tool_calls:
+                    yield ToolCall(name=tool_call['name'], args=tool_call['args'])
+                # Replies not generated by a streaming LLM call (fast path, cache) arrive in one piece
+                if data.text and not data.tool_calls and not streamed:
+                    yield TextDelta(data.text)
+            elif isinstance(data, ToolMessage):
+                yield ToolResult(name=data.name, content=data.text)
+
+    async def __turn(self, message: str, conversation_id: Optional[str]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Runs a turn, yielding ('delta', str) for every chunk of answer text, ('message', BaseMessage) for every
+        complete message and, at the end, ('stats', TurnStats) carrying the spans of the turn.
+        """
+        trace, trace_token = tracing.start_trace('turn')
+        try:
+            with batching_turn():
+                async for kind, data in self.__traced_turn(message, conversation_id):
+                    if kind == 'stats':
+                        data = data._replace(trace=tracing.end_trace(trace, trace_token))
+                    yield kind, data
+        finally:
+            if trace.end is None:
+                tracing.end_trace(trace, trace_token)
+
+    async def __traced_turn(self, message: str, conversation_id: Optional[str]) -> AsyncIterator[Tuple[str, Any]]:
+        started = time.monotonic()
+        conversation = None
+        if self.conversation_memory:
+            conversation = await self.conversation_memory.conversation(conversation_id or DEFAULT_CONVERSATION_ID)
+
+        # Turns of the same conversation are serialized, so that each one sees the previous in its history
+        async with conversation.lock if conversation else contextlib.nullcontext():
+            if self.fast_path and self.ha_mcp_connector:
+                with tracing.span('turn.fast_path'):
+                    reply = await self.__try_fast_path(message)
+                if reply is not None:
+                    if conversation:
+                        await self.conversation_memory.add_turn(conversation, [HumanMessage(message), reply])
+                    finished = time.monotonic()
+                    yield 'message', reply
+                    yield 'stats', self.__turn_stats(SOURCE_FAST_PATH, started, finished, finished)
+                    return
+
+            # A follow-up ("and the bedroom?", "turn it off") means something else once there is a history
+            response_cache = self.response_cache
+            if conversation and (conversation.turns or conversation.summary):
+                response_cache = None
+
+            if response_cache:
+                with tracing.span('turn.response_cache'):
+                    cached = await response_cache.get(message)
+                if cached is not None:
+                    if conversation:
+                        await self.conversation_memory.add_turn(conversation, [HumanMessage(message), AIMessage(cached)])
+                    finished = time.monotonic()
+                    yield 'message', AIMessage(content=cached)
+                    yield 'stats', self.__turn_stats(SOURCE_CACHE, started, finished, finished)
+                    return
+
+            cache_fingerprints = response_cache.fingerprints(message) if response_cache else {}
+
+            if self._tools_loaded and not self._tools_loaded.done():
+                with tracing.span('turn.tools_loading'):
+                    try:
+                        await asyncio.wait_for(asyncio.shield(self._tools_loaded), timeout=TOOLS_WAIT_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        raise ToolsUnavailableError('The Home Assistant tools are not available yet') from None
+
+            with tracing.span('turn.home_status'):
+                status = await self.__get_home_status(conversation.conversation_id if conversation else None)
             logging.debug('Status %s', status)
-            evaluate_payload["home_status"] = status
-
-        async for step in self.chain.astream(input=evaluate_payload, stream_mode="values"):
-            logging.debug("chain step: %s", step)
-            if getattr(step, 'get', None):
-                msgs = step.get('agent', {}).get('messages') or []
-            else:
-                msgs = [step]
-
-            for m in msgs:
-                await self.__save_analytics(m)
-                yield m
+            evaluate_payload = {"input": message}
+            for placeholder, text in (('catalogue', status.catalogue),
+                                      ('pinned_status', status.pinned),
+                                      ('live_status', status.live)):
+                if text:
+                    evaluate_payload[placeholder] = [SystemMessage(text)]
+            if conversation:
+                evaluate_payload["history"] = ConversationMemory.history(conversation)
+
+            # The previous request helps with follow-ups such as "and the one in the kitchen?"
+            query = message
+            if conversation and conversation.turns:
+                query = f'{conversation.turns[-1][0].text} {message}'
+
+            turn_usage: Dict[str, LLMUsage] = {}
+            answer: Optional[str] = None
+            tools_called: List[str] = []
+            first_token_at: Optional[float] = None
+            model: Optional[str] = None
+            try:
+                async for kind, data in self.__run_routed(message, query, evaluate_payload, turn_usage):
+                    if kind == 'model':
+                        model = data
+                        continue
+                    if isinstance(data, AIMessage):
+                        tools_called.extend(tool_call['name'] for tool_call in data.tool_calls)
+                        if data.text and not data.tool_calls:
+                            answer = data.text
+                    if kind == 'delta' or answer:
+                        first_token_at = first_token_at or time.monotonic()
+                    yield kind, data
+
+                finished = time.monotonic()
+                if self.fast_path:
+                    self.fast_path.record_agent_turn(finished - started)
+
+                if response_cache and answer:
+                    self.__in_background(response_cache.put(message,
+                                                            answer,
+                                                            fingerprints=cache_fingerprints,
+                                                            tools_called=tools_called),
+                                         name='response_cache_put')
+
+                if conversation and answer:
+                    # Only the exchange is remembered: tool calls and the home status are stale by the next turn
+                    await self.conversation_memory.add_turn(conversation, [HumanMessage(message), AIMessage(answer)])
+                    self.__in_background(self.__roll_up(conversation), name='conversation_roll_up')
+
+                yield 'stats', self.__turn_stats(SOURCE_AGENT, started, finished, first_token_at, turn_usage, model)
+            finally:
+                self.__save_analytics(turn_usage)
+
+    async def __run_routed(self,
+                           message: str,
+                           query: str,
+                           payload: Dict[str, Any],
+                           turn_usage: Dict[str, LLMUsage]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Runs the agent on the model picked by the router, yielding ('model', name) before its first output.
+        On error or timeout the other model takes over, as long as nothing was yielded yet: once text was
+        streamed or a tool was called the turn can't be replayed.
+        """
+        messages = (await self._prompt.ainvoke(payload)).to_messages()
+        routes: List[Optional[ModelRoute]] = self.model_router.route(message) if self.model_router else [None]
+
+        for i, route in enumerate(routes):
+            llm_model = route.llm_model if route else self.llm_model
+            started = time.monotonic()
+            produced = False
+            try:
+                async with asyncio.timeout(self.model_router.timeout if route else None) as deadline:
+                    async for kind, data in self.__run_agent(self.__agent_for(query, route),
+                                                             messages,
+                                                             turn_usage,
+                                                             llm_model):
+                        if not produced:
+                            produced = True
+                            deadline.reschedule(None)
+                            yield 'model', llm_name(llm_model)
+                        yield kind, data
+            except Exception as e:
+                if not route:
+                    raise
+                self.__record_model_turn(route, time.monotonic() - started, failed=True)
+                if produced or i == len(routes) - 1:
+                    raise
+                logging.warning('The %s model failed (%s), falling back to the %s model',
+                                route.route, str(e) or type(e).__name__, routes[i + 1].route)
+                continue
+
+            if route:
+                self.__record_model_turn(route, time.monotonic() - started)
+            return
+
+    def __record_model_turn(self, route: ModelRoute, latency: float, *, failed: bool = False):
+        self.model_router.record(route.route, latency=latency, failed=failed)
+        if self.storage_handler:
+            self.__in_background(self.__flush_model_turn(llm_name(route.llm_model), latency, failed),
+                                 name='flush_model_turn')
+
+    async def __flush_model_turn(self, model: str, latency: float, failed: bool):
+        try:
+            stats = await self.storage_handler.record_model_turn(model=model, latency=latency, failed=failed)
+            successful = stats.get('turns', 0) - stats.get('failures', 0)
+            logging.info('Model %s: %i turns, %i failures, %.0f ms average latency',
+                         model, stats.get('turns', 0), stats.get('failures', 0),
+                         1000 * stats.get('latency_seconds', 0) / successful if successful else 0)
+        except RedisError as e:
+            logging.error(e)
+
+    async def __run_agent(self,
+                          agent: Runnable,
+                          messages: List[BaseMessage],
+                          turn_usage: Dict[str, LLMUsage],
+                          llm_model: BaseChatModel) -> AsyncIterator[Tuple[str, Any]]:
+        # An LLM step runs from the end of the previous step (the prompt or the tool results) to its update
+        step_started = time.perf_counter()
+        async for mode, data in agent.astream({"messages": messages}, stream_mode=["messages", "updates"]):
+            if mode == 'messages':
+                chunk, metadata = data
+                if metadata.get('langgraph_node') == 'agent' and isinstance(chunk, AIMessage) and chunk.text:
+                    yield 'delta', chunk.text
+                continue
+
+            logging.debug("agent step: %s", data)
+            step_finished = time.perf_counter()
+            if 'agent' in data:
+                tracing.record('llm.step', step_started, step_finished, model=llm_name(llm_model))
+            step_started = step_finished
+            for node in data.values():
+                for m in (node or {}).get('messages') or []:
+                    self.__collect_usage(turn_usage, m, llm_model)
+                    yield 'message', m
+
+    @contextlib.asynccontextmanager
+    async def __llm_slot(self):
+        if self._llm_slots:
+            self._llm_waiting += 1
+            try:
+                await self._llm_slots.acquire()
+            finally:
+                self._llm_waiting -= 1
+
+        self._llm_in_flight += 1
+        self._llm_peak_in_flight = max(self._llm_peak_in_flight, self._llm_in_flight)
+        try:
+            yield
+        finally:
+            self._llm_in_flight -= 1
+            if self._llm_slots:
+                self._llm_slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {'llm_in_flight': self._llm_in_flight,
+                                 'llm_peak_in_flight': self._llm_peak_in_flight,
+                                 'llm_waiting': self._llm_waiting}
+        if self.fast_path:
+            stats['fast_path'] = self.fast_path.stats()
+        if self.response_cache:
+            stats['response_cache'] = self.response_cache.stats()
+        if self.ha_mcp_connector:
+            stats['mcp'] = self.ha_mcp_connector.stats()
+        if self.ha_ws_connector:
+            stats['ws'] = self.ha_ws_connector.stats()
+        if self.model_router:
+            stats['models'] = self.model_router.stats()
+        if self.tool_results_compactor:
+            stats['tool_results'] = self.tool_results_compactor.stats()
+        return stats
+
+    @staticmethod
+    def __turn_stats(source: str,
+                     started: float,
+                     finished: float,
+                     first_token_at: Optional[float],
+                     turn_usage: Optional[Dict[str, LLMUsage]] = None,
+                     model: Optional[str] = None) -> TurnStats:
+        usage = (turn_usage or {}).values()
+        stats = TurnStats(source=source,
+                          model=model,
+                          time_to_first_token=first_token_at - started if first_token_at else None,
+                          latency=finished - started,
+                          input_tokens=sum(u.input for u in usage),
+                          cached_input_tokens=sum(u.cached for u in usage),
+                          output_tokens=sum(u.output for u in usage))
+        source = f'{source}, {model}' if model else source
+        if stats.time_to_first_token is not None:
+            logging.info('Turn (%s): first token after %.0f ms, completed in %.0f ms',
+                         source, stats.time_to_first_token * 1000, stats.latency * 1000)
+        else:
+            logging.info('Turn (%s): completed in %.0f ms, no text', source, stats.latency * 1000)
+        if stats.input_tokens:
+            logging.info('Turn (%s): %i input tokens (%i cached, %i uncached), %i output tokens',
+                         source, stats.input_tokens, stats.cached_input_tokens,
+                         stats.input_tokens - stats.cached_input_tokens, stats.output_tokens)
+        return stats
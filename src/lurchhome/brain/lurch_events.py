@@ -0,0 +1,37 @@
+from typing import Dict, Any, NamedTuple, Optional, Union
+
+SOURCE_AGENT = 'agent'
+SOURCE_FAST_PATH = 'fast_path'
+SOURCE_CACHE = 'cache'
+
+
+class TextDelta(NamedTuple):
+    text: str
+
+
+class ToolCall(NamedTuple):
+    name: str
+    args: Dict[str, Any]
+
+
+class ToolResult(NamedTuple):
+    name: str
+    content: str
+
+
+class TurnStats(NamedTuple):
+    source: str
+    # Seconds from the request to the first text delta, None when the turn produced no text
+    time_to_first_token: Optional[float]
+    latency: float
+    # LLM input tokens of the turn, and how many of them were served from the provider prompt cache
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    # "provider/model" that answered, for agent turns
+    model: Optional[str] = None
+    # Spans of the turn (lurchhome.tracing.Trace), for the waterfall
+    trace: Optional[Any] = None
+
+
+LurchEvent = Union[TextDelta, ToolCall, ToolResult, TurnStats]
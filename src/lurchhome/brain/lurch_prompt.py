@@ -51,3 +51,11 @@ OUTPUT STYLE
 - Maintain the user’s language throughout the response where feasible.
 
 """
+
+SUMMARY_PROMPT = r"""
+You maintain the running summary of a conversation between a household member and Lurch, their home butler.
+Merge the current summary (if any) with the new messages into a single updated summary.
+Keep the facts needed to understand follow-up requests: devices, areas and people mentioned, requested actions
+and their outcome, pending questions and stated preferences. Leave out greetings and small talk.
+Write at most 120 words, in the language of the conversation. Reply with the summary only.
+"""
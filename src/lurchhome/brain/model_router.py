@@ -0,0 +1,116 @@
+import re
+import time
+import unicodedata
+from typing import Dict, Any, List, Optional, NamedTuple
+
+from langchain_core.language_models import BaseChatModel
+
+ROUTE_FAST = 'fast'
+ROUTE_LARGE = 'large'
+
+# Longer requests usually carry more than one thing to do
+DEFAULT_FAST_MAX_WORDS = 14
+# Seconds the first output of a model is waited for before falling back to the other one
+DEFAULT_MODEL_TIMEOUT = 20.0
+# A model failing this many turns in a row is tried last, for FAILURE_COOLDOWN seconds
+MAX_CONSECUTIVE_FAILURES = 3
+FAILURE_COOLDOWN = 60.0
+# Smoothing factor of the average turn latency of each model
+LATENCY_SMOOTHING = 0.2
+
+# Requests chaining or conditioning actions, or asking for reasoning, need the large model
+COMPLEX_REQUEST = re.compile(
+    r'\b(?:then|after|afterwards|before|if|unless|when|whenever|every|each|until|schedule|remind|why|explain|'
+    r'compare|suggest|plan|automation|poi|dopo|prima|se|quando|ogni|finché|ricordami|perché|spiega|confronta|'
+    r'suggerisci|automazione)\b')
+# Two actions in the same request: "turn off the lights and close the blinds"
+ACTION_VERBS = re.compile(
+    r'\b(?:turn|switch|set|open|close|lock|unlock|start|stop|pause|play|dim|add|remove|'
+    r'accendi|spegni|imposta|apri|chiudi|blocca|sblocca|avvia|ferma|metti|aggiungi|togli)\b')
+
+
+def llm_name(llm_model: BaseChatModel) -> str:
+    provider = getattr(llm_model, '_llm_type', None) or 'unknown'
+    model = getattr(llm_model, 'model_name', None) or getattr(llm_model, 'model', None) or 'unknown'
+    return f'{provider}/{model}'
+
+
+class ModelRoute(NamedTuple):
+    route: str
+    llm_model: BaseChatModel
+
+
+class ModelStats:
+    def __init__(self):
+        self.turns: int = 0
+        self.failures: int = 0
+        self.consecutive_failures: int = 0
+        self.failed_at: float = 0
+        self.latency: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {'turns': self.turns, 'failures': self.failures, 'latency': self.latency}
+
+
+class ModelRouter:
+    """
+    Picks the model of each agent turn: short requests asking for a single action or a single piece of information
+    go to the fast model, longer ones and requests chaining actions or asking for reasoning go to the large one.
+    `route` returns both models, the preferred one first, so that the caller can fall back to the other on error
+    or timeout. A model failing repeatedly is tried last for a while.
+    """
+
+    def __init__(self,
+                 *,
+                 fast_model: BaseChatModel,
+                 large_model: BaseChatModel,
+                 fast_max_words: int = DEFAULT_FAST_MAX_WORDS,
+                 timeout: float = DEFAULT_MODEL_TIMEOUT):
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self.fast_max_words = fast_max_words
+        self.timeout = timeout
+
+        self._stats: Dict[str, ModelStats] = {ROUTE_FAST: ModelStats(), ROUTE_LARGE: ModelStats()}
+
+    def is_simple(self, message: str) -> bool:
+        text = unicodedata.normalize('NFKC', message).lower()
+        words = re.findall(r'[^\W_]+', text)
+        return (0 < len(words) <= self.fast_max_words
+                and not COMPLEX_REQUEST.search(text)
+                and len(ACTION_VERBS.findall(text)) <= 1
+                and text.count('?') <= 1)
+
+    def route(self, message: str) -> List[ModelRoute]:
+        fast = ModelRoute(ROUTE_FAST, self.fast_model)
+        large = ModelRoute(ROUTE_LARGE, self.large_model)
+        routes = [fast, large] if self.is_simple(message) else [large, fast]
+
+        if self.__cooling_down(routes[0].route) and not self.__cooling_down(routes[1].route):
+            routes.reverse()
+        return routes
+
+    def record(self, route: str, *, latency: float, failed: bool = False) -> None:
+        stats = self._stats[route]
+        stats.turns += 1
+        if failed:
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.failed_at = time.monotonic()
+            return
+
+        stats.consecutive_failures = 0
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency += LATENCY_SMOOTHING * (latency - stats.latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {route: {'model': llm_name(self.fast_model if route == ROUTE_FAST else self.large_model),
+                        **stats.as_dict()}
+                for route, stats in self._stats.items()}
+
+    def __cooling_down(self, route: str) -> bool:
+        stats = self._stats[route]
+        return (stats.consecutive_failures >= MAX_CONSECUTIVE_FAILURES
+                and time.monotonic() - stats.failed_at < FAILURE_COOLDOWN)
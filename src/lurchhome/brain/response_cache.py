@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional, Set
+
+from redis import RedisError
+
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+from lurchhome.persistence.storage_handler import StorageHandler
+
+DEFAULT_RESPONSE_CACHE_TTL = 3600
+DEFAULT_RESPONSE_CACHE_MAX_ENTRIES = 1000
+# A question depending on more entities than this is too broad to be worth caching
+MAX_DEPENDENCIES = 100
+
+# Tools that only read: a turn calling anything else performed an action and is never cached
+READ_ONLY_TOOLS = {'GetLiveContext', 'ReadToolResult'}
+
+# Words that make a question depend on every entity of a domain ("which lights are on?")
+DOMAIN_WORDS = {
+    'light': {'light', 'lamp', 'luce', 'lampada'},
+    'switch': {'switch', 'interruttore'},
+    'cover': {'cover', 'blind', 'shutter', 'garage', 'tapparella'},
+    'lock': {'lock', 'serratura'},
+    'climate': {'thermostat', 'heating', 'termostato', 'riscaldamento'},
+    'media_player': {'speaker', 'tv', 'player'},
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).lower().replace('’', "'")
+    return ' '.join(re.findall(r'[^\W_]+', text))
+
+
+def _words(text: str) -> Set[str]:
+    # Naive plural folding, so that "lights" matches "Kitchen light"
+    return {w[:-1] if len(w) > 3 and w.endswith('s') and not w.endswith('ss') else w
+            for w in _normalize(text).split()}
+
+
+def _fingerprint(state: Optional[Dict[str, Any]]) -> Optional[str]:
+    if state is None:
+        return None
+    payload = json.dumps([state.get('state'), state.get('attributes')], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _cache_key(message: str) -> str:
+    return hashlib.sha256(_normalize(message).encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Answers to state questions ("is the garage door open?"), kept in Redis with a TTL and LRU eviction.
+    An entry records the fingerprint of the entity states the question is about (entities, areas or domains
+    named in it) and is only served while all of them are unchanged. State changes from the websocket
+    drop the affected entries right away. Questions that do not name any entity are never cached.
+    """
+
+    def __init__(self,
+                 *,
+                 storage_handler: StorageHandler,
+                 state_mirror: HomeStateMirror,
+                 ttl: int = DEFAULT_RESPONSE_CACHE_TTL,
+                 max_entries: int = DEFAULT_RESPONSE_CACHE_MAX_ENTRIES):
+        self.storage_handler = storage_handler
+        self.state_mirror = state_mirror
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # entity id -> keys of the entries depending on it, for the entries written by this process
+        self._dependents: Dict[str, Set[str]] = {}
+        self._background_tasks = set()
+
+        self._hits: int = 0
+        self._misses: int = 0
+        self._stores: int = 0
+        self._invalidations: int = 0
+
+        state_mirror.add_listener(self.on_state_changed)
+
+    async def get(self, message: str) -> Optional[str]:
+        if not self.state_mirror.is_live:
+            return None
+
+        key = _cache_key(message)
+        try:
+            value = await self.storage_handler.load_cached_response(key=key)
+        except RedisError as e:
+            logging.error(e)
+            return None
+
+        if value is None:
+            # Expired or evicted by Redis
+            self.__forget(key)
+        else:
+            try:
+                entry = json.loads(value)
+                answer, dependencies = entry['answer'], entry['dependencies']
+            except (ValueError, TypeError, KeyError):
+                logging.warning('Corrupt response cache entry, dropped')
+                self.__invalidate([key])
+            else:
+                if all(_fingerprint(self.state_mirror.get(entity_id)) == fingerprint
+                       for entity_id, fingerprint in dependencies.items()):
+                    self._hits += 1
+                    logging.info('Response cache hit (%i dependencies)', len(dependencies))
+                    return answer
+
+                # Changed while no event reached this process (e.g. written by another instance)
+                self.__invalidate([key])
+
+        self._misses += 1
+        return None
+
+    def fingerprints(self, message: str) -> Dict[str, Optional[str]]:
+        """
+        The states the answer to `message` depends on, to be taken before the agent runs: fingerprints taken
+        when the answer is stored could already include changes the answer does not reflect.
+        """
+        if not self.state_mirror.is_live:
+            return {}
+        return {entity_id: _fingerprint(self.state_mirror.get(entity_id)) for entity_id in self.dependencies(message)}
+
+    async def put(self, message: str, answer: str, *, fingerprints: Dict[str, Optional[str]], tools_called: List[str]):
+        if not fingerprints or len(fingerprints) > MAX_DEPENDENCIES:
+            return
+        if any(tool not in READ_ONLY_TOOLS for tool in tools_called):
+            return
+
+        dependencies = fingerprints.keys()
+        key = _cache_key(message)
+        entry = {'answer': answer, 'dependencies': fingerprints}
+        try:
+            evicted = await self.storage_handler.store_cached_response(key=key,
+                                                                       value=json.dumps(entry),
+                                                                       ttl=self.ttl,
+                                                                       max_entries=self.max_entries)
+        except RedisError as e:
+            logging.error(e)
+            return
+
+        for entity_id in dependencies:
+            self._dependents.setdefault(entity_id, set()).add(key)
+        self._stores += 1
+        logging.debug('Response cached with %i dependencies, %i entries evicted', len(dependencies), evicted)
+
+    def dependencies(self, message: str) -> Set[str]:
+        words = _words(message)
+        domains = {domain for domain, domain_words in DOMAIN_WORDS.items() if words & domain_words}
+
+        dependencies = set()
+        for state in self.state_mirror.states():
+            entity_id = state.get('entity_id') or ''
+            name = (state.get('attributes') or {}).get('friendly_name')
+            area = self.state_mirror.area_of(entity_id)
+            if ((name and _words(name) <= words)
+                    or entity_id in message
+                    or (area and _words(area) <= words)
+                    or entity_id.split('.', 1)[0] in domains):
+                dependencies.add(entity_id)
+        return dependencies
+
+    def on_state_changed(self, entity_id: str) -> None:
+        keys = self._dependents.pop(entity_id, None)
+        if keys:
+            self.__invalidate(list(keys))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': self._hits / total if total else 0,
+            'stores': self._stores,
+            'invalidations': self._invalidations
+        }
+
+    def __forget(self, key: str):
+        for entity_id in [entity_id for entity_id, keys in self._dependents.items() if key in keys]:
+            keys = self._dependents[entity_id]
+            keys.discard(key)
+            if not keys:
+                del self._dependents[entity_id]
+
+    def __invalidate(self, keys: List[str]):
+        for key in keys:
+            self.__forget(key)
+        self._invalidations += len(keys)
+        task = asyncio.create_task(self.__delete(keys), name='response_cache_invalidate')
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def __delete(self, keys: List[str]):
+        try:
+            await self.storage_handler.delete_cached_responses(keys=keys)
+        except RedisError as e:
+            logging.error(e)
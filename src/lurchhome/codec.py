@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, NamedTuple, Union
+
+"""
+JSON codec of the connectors: orjson or msgspec when installed (pip install lurchhome[fast]), the standard
+library otherwise. All of them decode str and bytes alike, so frames received as bytes are parsed without
+decoding them to str first, and encode compactly to UTF-8 (no ASCII escapes), values of other types as their str().
+"""
+
+# Preference order, LURCH_JSON_CODEC picks one explicitly
+CODECS = ['orjson', 'msgspec', 'json']
+
+JSONInput = Union[str, bytes, bytearray, memoryview]
+
+
+class Codec(NamedTuple):
+    name: str
+    # Raises ValueError on malformed input, whatever the library
+    loads: Callable[[JSONInput], Any]
+    dumpb: Callable[[Any], bytes]
+
+
+def _orjson_codec() -> Codec:
+    import orjson
+
+    def dumpb(value: Any) -> bytes:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    return Codec('orjson', orjson.loads, dumpb)
+
+
+def _msgspec_codec() -> Codec:
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder(enc_hook=str)
+
+    def loads(data: JSONInput) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    return Codec('msgspec', loads, encoder.encode)
+
+
+def _json_codec() -> Codec:
+    def loads(data: JSONInput) -> Any:
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+    def dumpb(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode()
+
+    return Codec('json', loads, dumpb)
+
+
+_FACTORIES: Dict[str, Callable[[], Codec]] = {'orjson': _orjson_codec, 'msgspec': _msgspec_codec, 'json': _json_codec}
+
+
+def available() -> Dict[str, Codec]:
+    codecs = {}
+    for name in CODECS:
+        try:
+            codecs[name] = _FACTORIES[name]()
+        except ImportError:
+            pass
+    return codecs
+
+
+def _select() -> Codec:
+    wanted = os.getenv('LURCH_JSON_CODEC')
+    if wanted:
+        try:
+            return _FACTORIES[wanted]()
+        except (KeyError, ImportError):
+            logging.warning('JSON codec %s not available, picking the fastest installed one', wanted)
+
+    for name in CODECS:
+        try:
+            return _FACTORIES[name]()
+        except ImportError:
+            pass
+
+
+codec = _select()
+
+loads = codec.loads
+dumpb = codec.dumpb
+
+
+def dumps(value: Any) -> str:
+    return dumpb(value).decode()
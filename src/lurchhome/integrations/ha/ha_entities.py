@@ -0,0 +1,122 @@
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, NamedTuple
+
+"""
+Home Assistant `subscribe_entities` feed: instead of a state_changed event with the full old and new states,
+every message carries compressed diffs (the protocol of the HA frontend):
+
+    {"a": {entity_id: {"s": state, "a": attributes, "c": context, "lc": last_changed, "lu": last_updated}},
+     "c": {entity_id: {"+": {changed keys, "a": changed attributes}, "-": {"a": [removed attributes]}}},
+     "r": [entity_id, ...]}
+
+The first message adds every entity. Timestamps are epoch seconds, "lu" is omitted when equal to "lc".
+"""
+
+ADDED = 'a'
+CHANGED = 'c'
+REMOVED = 'r'
+
+STATE = 's'
+ATTRIBUTES = 'a'
+CONTEXT = 'c'
+LAST_CHANGED = 'lc'
+LAST_UPDATED = 'lu'
+
+
+class EntityChange(NamedTuple):
+    entity_id: str
+    # None when the entity was just added
+    old_state: Optional[Dict[str, Any]]
+    # None when the entity was removed
+    new_state: Optional[Dict[str, Any]]
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _context(context: Any, current: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Just the id when the parent and the user are unset
+    if isinstance(context, str):
+        return {**(current or {'parent_id': None, 'user_id': None}), 'id': context}
+    return {**(current or {}), **(context or {})}
+
+
+def _expand(entity_id: str, compressed: Dict[str, Any]) -> Dict[str, Any]:
+    last_changed = _iso(compressed.get(LAST_CHANGED, 0))
+    return {
+        'entity_id': entity_id,
+        'state': compressed.get(STATE),
+        'attributes': compressed.get(ATTRIBUTES) or {},
+        'last_changed': last_changed,
+        'last_updated': _iso(compressed[LAST_UPDATED]) if LAST_UPDATED in compressed else last_changed,
+        'context': _context(compressed.get(CONTEXT))
+    }
+
+
+class EntityTable:
+    """
+    Local copy of the entity states, rebuilt from the `subscribe_entities` diffs. Every applied message returns
+    the changes as full old/new states, the same shape of the state_changed events. The states are never
+    updated in place, so an old state handed out stays valid.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(entity_id)
+
+    def states(self) -> List[Dict[str, Any]]:
+        return list(self._states.values())
+
+    def clear(self) -> None:
+        self._states.clear()
+
+    def apply(self, message: Dict[str, Any]) -> List[EntityChange]:
+        changes = []
+
+        for entity_id, compressed in (message.get(ADDED) or {}).items():
+            new_state = _expand(entity_id, compressed)
+            changes.append(EntityChange(entity_id, self._states.get(entity_id), new_state))
+            self._states[entity_id] = new_state
+
+        for entity_id in message.get(REMOVED) or []:
+            old_state = self._states.pop(entity_id, None)
+            if old_state is not None:
+                changes.append(EntityChange(entity_id, old_state, None))
+
+        for entity_id, diff in (message.get(CHANGED) or {}).items():
+            old_state = self._states.get(entity_id)
+            if old_state is None:
+                # A change of an entity never added: nothing to apply it to
+                continue
+
+            new_state = self.__patch(old_state, diff.get('+') or {}, (diff.get('-') or {}).get(ATTRIBUTES) or [])
+            changes.append(EntityChange(entity_id, old_state, new_state))
+            self._states[entity_id] = new_state
+
+        return changes
+
+    @staticmethod
+    def __patch(state: Dict[str, Any], added: Dict[str, Any], removed_attributes: List[str]) -> Dict[str, Any]:
+        state = dict(state)
+        if STATE in added:
+            state['state'] = added[STATE]
+        if CONTEXT in added:
+            state['context'] = _context(added[CONTEXT], state.get('context'))
+        if LAST_CHANGED in added:
+            state['last_changed'] = state['last_updated'] = _iso(added[LAST_CHANGED])
+        elif LAST_UPDATED in added:
+            state['last_updated'] = _iso(added[LAST_UPDATED])
+
+        if ATTRIBUTES in added or removed_attributes:
+            attributes = {**state.get('attributes', {}), **added.get(ATTRIBUTES, {})}
+            for key in removed_attributes:
+                attributes.pop(key, None)
+            state['attributes'] = attributes
+
+        return state
@@ -0,0 +1,141 @@
+import time
+from fnmatch import fnmatchcase
+from typing import Dict, Any, List, Optional, Tuple
+
+
+def parse_patterns(value: Optional[str]) -> List[str]:
+    # "light.*, sensor.power" -> ['light.*', 'sensor.power']
+    return [p.strip() for p in (value or '').split(',') if p.strip()]
+
+
+def parse_pattern_values(value: Optional[str]) -> Dict[str, float]:
+    # "sensor.*_power=10, sensor.temp=0.5" -> {'sensor.*_power': 10.0, 'sensor.temp': 0.5}
+    values = {}
+    for item in parse_patterns(value):
+        pattern, _, number = item.partition('=')
+        values[pattern.strip()] = float(number)
+    return values
+
+
+def _first_match(entity_id: str, rules: Dict[str, float]) -> Optional[float]:
+    for pattern, value in rules.items():
+        if fnmatchcase(entity_id, pattern):
+            return value
+    return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EventFilter:
+    """
+    Drops or coalesces `state_changed` events before they are persisted. Rules, in order:
+    include/exclude glob patterns on the entity id (use "light.*" for a whole domain), events where neither state
+    nor attributes changed, numeric changes below a per-entity deadband, and per-entity debounce windows where
+    only the latest event of the window is kept and emitted when the window ends.
+    """
+
+    def __init__(self,
+                 *,
+                 include: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None,
+                 debounce: Optional[Dict[str, float]] = None,
+                 deadbands: Optional[Dict[str, float]] = None):
+        self.include = include or []
+        self.exclude = exclude or []
+        self.debounce = debounce or {}
+        self.deadbands = deadbands or {}
+
+        self._rules: Dict[str, Tuple[bool, Optional[float], Optional[float]]] = {}
+        self._last_stored: Dict[str, Tuple[Any, Any]] = {}
+        self._last_stored_at: Dict[str, float] = {}
+        self._pending: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._stats: Dict[str, int] = {
+            'received': 0, 'passed': 0, 'excluded': 0, 'unchanged': 0, 'deadband': 0, 'coalesced': 0, 'debounced': 0
+        }
+
+    @property
+    def has_debounce(self) -> bool:
+        return bool(self.debounce)
+
+    def accept(self, event: Dict[str, Any], *, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        data = event.get('data') or {}
+        entity_id = data.get('entity_id') or ''
+        self._stats['received'] += 1
+
+        allowed, deadband, debounce = self.__rules_for(entity_id)
+        if not allowed:
+            self._stats['excluded'] += 1
+            return False
+
+        new_state = data.get('new_state')
+        if new_state is None:
+            # Entity removed: always persisted, and forget everything about it
+            self._last_stored.pop(entity_id, None)
+            self._pending.pop(entity_id, None)
+            return self.__passed(entity_id, None, now)
+
+        state, attributes = new_state.get('state'), new_state.get('attributes')
+        last = self._last_stored.get(entity_id)
+        if last is None and data.get('old_state'):
+            old_state = data['old_state']
+            last = (old_state.get('state'), old_state.get('attributes'))
+
+        if last is not None and last[1] == attributes:
+            if last[0] == state:
+                # Back to what was stored: any change held by the debounce is outdated too
+                self._pending.pop(entity_id, None)
+                self._stats['unchanged'] += 1
+                return False
+
+            if deadband is not None:
+                new_value, last_value = _as_float(state), _as_float(last[0])
+                if new_value is not None and last_value is not None and abs(new_value - last_value) < deadband:
+                    self._pending.pop(entity_id, None)
+                    self._stats['deadband'] += 1
+                    return False
+
+        if debounce is not None and now - self._last_stored_at.get(entity_id, float('-inf')) < debounce:
+            if entity_id in self._pending:
+                self._stats['coalesced'] += 1
+            self._pending[entity_id] = (self._last_stored_at[entity_id] + debounce, event)
+            return False
+
+        self._pending.pop(entity_id, None)
+        return self.__passed(entity_id, (state, attributes), now)
+
+    def pop_due(self, *, now: Optional[float] = None, force: bool = False) -> List[Dict[str, Any]]:
+        now = time.monotonic() if now is None else now
+        due = []
+        for entity_id, (due_at, event) in list(self._pending.items()):
+            if force or due_at <= now:
+                del self._pending[entity_id]
+                new_state = event['data']['new_state']
+                self.__passed(entity_id, (new_state.get('state'), new_state.get('attributes')), now)
+                self._stats['debounced'] += 1
+                due.append(event)
+        return due
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._stats, pending=len(self._pending))
+
+    def __passed(self, entity_id: str, stored: Optional[Tuple[Any, Any]], now: float) -> bool:
+        if stored is not None:
+            self._last_stored[entity_id] = stored
+        self._last_stored_at[entity_id] = now
+        self._stats['passed'] += 1
+        return True
+
+    def __rules_for(self, entity_id: str) -> Tuple[bool, Optional[float], Optional[float]]:
+        rules = self._rules.get(entity_id)
+        if rules is None:
+            allowed = ((not self.include or any(fnmatchcase(entity_id, p) for p in self.include))
+                       and not any(fnmatchcase(entity_id, p) for p in self.exclude))
+            rules = (allowed, _first_match(entity_id, self.deadbands), _first_match(entity_id, self.debounce))
+            self._rules[entity_id] = rules
+        return rules
@@ -1,11 +1,14 @@
 import asyncio
-import json
 import logging
+import random
 import re
-from typing import Dict, Any, List
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 
 import httpx
 
+from lurchhome import codec, tracing
 from lurchhome.tools.tools_interfaces import CallableTools, WithTools
 
 """
@@ -14,8 +17,36 @@ Read more: https://modelcontextprotocol.io/specification/2024-11-05
 """
 MCP_PROTOCOL_VERSION = "2024-11-05"
 
+# Bounds on the JSON-RPC requests sent and still waiting for their reply
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_METHOD_LIMITS = {'tools/call': 8}
 
-def _create_jsonrpc_payload(method: str, params: Dict = None, rpc_id=None) -> str:
+DEFAULT_REQUEST_TIMEOUT = 10
+# How many expired request ids are remembered to tell late replies from orphan ones
+EXPIRED_REQUESTS_MEMORY = 1024
+
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+
+# Requests that can be safely sent again when the session drops before their reply arrives.
+# Anything else (e.g. a tool that operates a device) fails fast, to avoid acting twice.
+REPLAYABLE_METHODS = {'tools/list', 'prompts/list', 'resources/list'}
+REPLAYABLE_TOOLS = {'GetLiveContext', 'GetDateTime'}
+
+
+class MCPError(Exception):
+    def __init__(self, *, code: int, message: str, data: Any = None):
+        super().__init__(f'MCP error {code}: {message}')
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class MCPConnectionError(Exception):
+    pass
+
+
+def _create_jsonrpc_payload(method: str, params: Dict = None, rpc_id=None) -> bytes:
     payload: Dict[str, any] = {
         "jsonrpc": "2.0"
     }
@@ -29,7 +60,7 @@ def _create_jsonrpc_payload(method: str, params: Dict = None, rpc_id=None) -> st
     if rpc_id:
         payload["id"] = rpc_id
 
-    return json.dumps(payload)
+    return codec.dumpb(payload)
 
 
 def _is_valid_message_path(path):
@@ -37,6 +68,30 @@ def _is_valid_message_path(path):
     return bool(re.match(pattern, path))
 
 
+def _is_replayable(command: Dict[str, Any]) -> bool:
+    if command['method'] == 'tools/call':
+        return (command.get('params') or {}).get('name') in REPLAYABLE_TOOLS
+    return command['method'] in REPLAYABLE_METHODS
+
+
+def _trace_request(method: str, params: Optional[Dict[str, Any]], timings: Dict[str, float]):
+    # Split of a request latency: waiting in queue (and for a slot), the POST, then the wait for the SSE reply
+    if 'queued' not in timings:
+        return
+    finished = time.perf_counter()
+    attributes = {'method': (params or {}).get('name', method) if method == 'tools/call' else method}
+    dispatched = timings.get('dispatched', finished)
+    tracing.record('mcp.queue', timings['queued'], dispatched, **attributes)
+    if 'posted' in timings:
+        tracing.record('mcp.post', dispatched, timings['posted'], **attributes)
+        tracing.record('mcp.reply', timings['posted'], finished, **attributes)
+
+
+def _reconnect_delay(attempt: int, *, base: float = RECONNECT_BASE_DELAY, cap: float = RECONNECT_MAX_DELAY) -> float:
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
 def _build_request_body(method: str, params=None, request_id=None):
     request_body = {
         'action': 'send_request',
@@ -53,7 +108,12 @@ def _build_request_body(method: str, params=None, request_id=None):
 
 
 class HAMCPConnector(WithTools, CallableTools):
-    def __init__(self, *, ha_base_url: str, ha_api_token: str):
+    def __init__(self,
+                 *,
+                 ha_base_url: str,
+                 ha_api_token: str,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 method_limits: Optional[Dict[str, int]] = None):
         self.base_url: str = ha_base_url
         self.api_token: str = ha_api_token
         self.messages_url: str | None = None
@@ -67,7 +127,34 @@ class HAMCPConnector(WithTools, CallableTools):
 
         self._current_request_id: int = 1
         self._command_queue: asyncio.Queue = asyncio.Queue()
-        self._pending_requests: Dict[int, asyncio.Event | Dict[str, any]] = {}
+        self._pending_requests: Dict[int, asyncio.Future] = {}
+        self._expired_requests: OrderedDict[int, None] = OrderedDict()
+        self._late_replies: int = 0
+        self._orphan_replies: int = 0
+
+        # Dispatcher
+        self._in_flight_limit = asyncio.Semaphore(max_in_flight)
+        self._method_limits: Dict[str, asyncio.Semaphore] = {
+            method: asyncio.Semaphore(limit)
+            for method, limit in (DEFAULT_METHOD_LIMITS if method_limits is None else method_limits).items()
+        }
+        self._in_flight: Dict[str, int] = {}
+        # Dequeued, waiting for their method or global slot
+        self._waiting: int = 0
+        self._dispatch_tasks = set()
+        self._sent_requests: Dict[int, Tuple[Dict[str, Any], Callable]] = {}
+
+        # Session supervision: requests are held back until the first session is initialized, and while
+        # it is being re-established
+        self._dispatch_ready: asyncio.Event = asyncio.Event()
+        self._session_started_at: Optional[float] = None
+        self._session_lost_at: Optional[float] = None
+        self._reconnects: int = 0
+        self._last_reconnect_seconds: Optional[float] = None
+        self._last_outage_seconds: Optional[float] = None
+        self._outage_seconds_total: float = 0
+        self._replayed_requests: int = 0
+        self._failed_fast_requests: int = 0
 
     def __set_messages_url(self, messages_url: str) -> None:
         self.messages_url = messages_url
@@ -92,50 +179,184 @@ class HAMCPConnector(WithTools, CallableTools):
         if response.status_code != 200:
             raise httpx.HTTPError(f"HTTP {response.status_code}: {response.text}")
 
-    async def __queue_request(self, method: str, params=None):
-        await self._command_queue.put(_build_request_body(method, params=params))
+    async def __queue_request_and_wait_response(self,
+                                                method: str,
+                                                params=None,
+                                                timeout: float = DEFAULT_REQUEST_TIMEOUT) -> Dict[str, any]:
+        # perf_counter timestamps of the request, set by __dispatch as it goes
+        timings: Dict[str, float] = {}
 
-    async def __queue_request_and_wait_response(self, method: str, params=None, timeout: float = 10) -> Dict[str, any]:
-        ev = asyncio.Event()
+        async def send(request_id: int):
+            command = _build_request_body(method, params=params, request_id=request_id)
+            command['timings'] = timings
+            timings['queued'] = time.perf_counter()
+            await self._command_queue.put(command)
+
+        try:
+            return await self.__wait_response(send, timeout=timeout)
+        finally:
+            _trace_request(method, params, timings)
+
+    async def __post_request_and_wait_response(self,
+                                               method: str,
+                                               params=None,
+                                               timeout: float = DEFAULT_REQUEST_TIMEOUT) -> Dict[str, any]:
+        # Bypasses the command queue: used by the session handshake, which must not wait behind other requests
+        async def send(request_id: int):
+            await self.__do_post_request(method, request_id=request_id, params=params)
+
+        return await self.__wait_response(send, timeout=timeout)
+
+    async def __wait_response(self, send: Callable[[int], Awaitable[None]], *, timeout: float) -> Dict[str, any]:
         id = self._current_request_id
         self._current_request_id += 1
-        self._pending_requests[id] = ev
+        future = asyncio.get_running_loop().create_future()
+        self._pending_requests[id] = future
+
+        async def send_and_wait():
+            await send(id)
+            return await future
 
         try:
-            await self._command_queue.put(_build_request_body(method, params=params, request_id=id))
+            # The deadline covers the time spent in queue as well
+            return await asyncio.wait_for(send_and_wait(), timeout=timeout)
+        except asyncio.TimeoutError as e:
+            logging.error(f"[RPC] Timeout waiting reply for the request_id {id})")
+            raise e
+        finally:
+            if self._pending_requests.pop(id, None) is not None:
+                # Timed out or cancelled by the caller: a reply may still come later
+                future.cancel()
+                self.__remember_expired(id)
+
+    def __remember_expired(self, request_id: int):
+        self._expired_requests[request_id] = None
+        while len(self._expired_requests) > EXPIRED_REQUESTS_MEMORY:
+            self._expired_requests.popitem(last=False)
+
+    def __resolve_reply(self, reply: Dict[str, Any]):
+        request_id = reply['id']
+        future = self._pending_requests.pop(request_id, None)
+
+        if future is None:
+            if request_id in self._expired_requests:
+                del self._expired_requests[request_id]
+                self._late_replies += 1
+                logging.warning('[RPC] Late reply for the request_id %s', request_id)
+            else:
+                self._orphan_replies += 1
+                logging.warning('[RPC] Orphan reply for the unknown request_id %s', request_id)
+            return
+
+        if future.done():
+            return
+
+        if 'error' in reply:
+            error = reply.get('error') or {}
+            future.set_exception(MCPError(code=error.get('code', 0),
+                                          message=error.get('message', ''),
+                                          data=error.get('data')))
+        else:
+            future.set_result(reply.get('result'))
+
+    async def __dispatch(self, command: Dict[str, Any]):
+        method = command['method']
+        request_id = command.get('request_id')
+        method_limit = self._method_limits.get(method)
+        future = self._pending_requests.get(request_id) if request_id else None
+
+        def release(*_):
+            self._in_flight[method] -= 1
+            if method_limit:
+                method_limit.release()
+            self._in_flight_limit.release()
+
+        # The method slot comes first: requests of a saturated method wait without holding a global slot,
+        # so they can't starve the others (e.g. a burst of tools/call blocking tools/list)
+        self._waiting += 1
+        try:
+            if method_limit:
+                await method_limit.acquire()
             try:
-                await asyncio.wait_for(ev.wait(), timeout=timeout)
-                return self._pending_requests[id]
-            except asyncio.TimeoutError as e:
-                logging.error(f"[RPC] Timeout waiting reply for the request_id {id})")
-                raise e
-            finally:
-                self._pending_requests.pop(id, None)
+                await self._in_flight_limit.acquire()
+            except BaseException:
+                if method_limit:
+                    method_limit.release()
+                raise
+        except BaseException:
+            self._command_queue.task_done()
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._in_flight[method] = self._in_flight.get(method, 0) + 1
+        try:
+            if (future and future.done()) or request_id in self._expired_requests:
+                # The caller already gave up: don't send it at all
+                release()
+                return
+
+            await self._dispatch_ready.wait()
+
+            timings = command.get('timings', {})
+            if command['action'] == 'send_request':
+                timings['dispatched'] = time.perf_counter()
+                await self.__do_post_request(
+                    method,
+                    request_id=request_id,
+                    params=command.get('params')
+                )
+                timings['posted'] = time.perf_counter()
+
+            if future:
+                # Keep the slot until the reply comes (or the caller gives up waiting)
+                self._sent_requests[request_id] = (command, release)
+                future.add_done_callback(release)
+                future.add_done_callback(lambda _: self._sent_requests.pop(request_id, None))
+            else:
+                release()
+
+        except Exception as e:
+            logging.error(f"Command processor error: {e}")
+            if future and not future.done():
+                future.set_exception(e)
+            release()
+
         finally:
-            if id in self._pending_requests:
-                del self._pending_requests[id]
+            self._command_queue.task_done()
 
     async def __command_processor(self, forever=True):
         await self._messages_url_ready.wait()
 
         while True:
-            try:
-                command = await self._command_queue.get()
-                if command['action'] == 'send_request':
-                    await self.__do_post_request(
-                        command['method'],
-                        request_id=command.get('request_id'),
-                        params=command.get('params')
-                    )
-
-                self._command_queue.task_done()
-
-                if not forever:
-                    break
-
-            except Exception as e:
-                logging.error(f"Command processor error: {e}")
-                await asyncio.sleep(1)
+            command = await self._command_queue.get()
+
+            # The slots are taken by the dispatch task, the requests waiting for them count as queued
+            task = asyncio.create_task(self.__dispatch(command), name=f"dispatch_{command['method']}")
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+
+            if not forever:
+                await task
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self._command_queue.qsize() + self._waiting,
+            'in_flight': sum(self._in_flight.values()),
+            'in_flight_by_method': {method: n for method, n in self._in_flight.items() if n},
+            'pending': len(self._pending_requests),
+            'late_replies': self._late_replies,
+            'orphan_replies': self._orphan_replies,
+            'connected': self._sse_initialized.is_set(),
+            'reconnects': self._reconnects,
+            'last_reconnect_seconds': self._last_reconnect_seconds,
+            'last_outage_seconds': self._last_outage_seconds,
+            'outage_seconds_total': self._outage_seconds_total + (
+                time.monotonic() - self._session_lost_at if self._session_lost_at is not None else 0),
+            'replayed_requests': self._replayed_requests,
+            'failed_fast_requests': self._failed_fast_requests
+        }
 
     async def __sse_listener(self):
         if not self._client:
@@ -159,15 +380,12 @@ class HAMCPConnector(WithTools, CallableTools):
                         continue
 
                     try:
-                        event_data = json.loads(data)
+                        event_data = codec.loads(data)
 
-                        if 'id' in event_data and event_data['id'] in self._pending_requests:
-                            request_id = event_data['id']
-                            event = self._pending_requests[request_id]
-                            self._pending_requests[request_id] = event_data['result']
-                            event.set()
+                        if 'id' in event_data:
+                            self.__resolve_reply(event_data)
 
-                    except json.JSONDecodeError:
+                    except ValueError:
                         if _is_valid_message_path(data):
                             self.__set_messages_url(data)
                         else:
@@ -176,47 +394,119 @@ class HAMCPConnector(WithTools, CallableTools):
                     except Exception as e:
                         logging.error(e)
 
+    async def __handshake(self):
+        logging.debug("Waiting the messages URL from the HA server")
+        await self._messages_url_ready.wait()
+
+        init_params = {
+            "protocolVersion": f'{MCP_PROTOCOL_VERSION}',
+            "capabilities": {},
+            "clientInfo": {
+                "name": "LurchHome",
+                "version": "1.0.0"
+            }
+        }
+        init_response: Dict = await self.__post_request_and_wait_response("initialize", params=init_params)
+        logging.debug(init_response)
+        if init_response:
+            await self.__do_post_request("notifications/initialized")
+            self._sse_initialized.set()
+            self._dispatch_ready.set()
+            logging.info("SSE init complete in %.0f ms", (time.monotonic() - self._session_started_at) * 1000)
+
+            if self._session_lost_at is not None:
+                now = time.monotonic()
+                self._reconnects += 1
+                self._last_reconnect_seconds = now - self._session_started_at
+                self._last_outage_seconds = now - self._session_lost_at
+                self._outage_seconds_total += self._last_outage_seconds
+                self._session_lost_at = None
+                logging.info("SSE session re-established in %.2fs, after %.2fs of outage",
+                             self._last_reconnect_seconds, self._last_outage_seconds)
+
+    async def __run_session(self):
+        self._session_started_at = time.monotonic()
+        sse_task = asyncio.create_task(self.__sse_listener(), name="sse_listener")
+        handshake_task = asyncio.create_task(self.__handshake(), name="sse_handshake")
+
+        try:
+            await asyncio.wait({sse_task, handshake_task}, return_when=asyncio.FIRST_COMPLETED)
+            if handshake_task.done():
+                handshake_task.result()
+            await sse_task
+
+        finally:
+            sse_task.cancel()
+            handshake_task.cancel()
+            await asyncio.gather(sse_task, handshake_task, return_exceptions=True)
+
+    def __on_session_lost(self):
+        self._sse_initialized.clear()
+        self._dispatch_ready.clear()
+        self._messages_url_ready.clear()
+        self.messages_url = None
+        if self._session_lost_at is None:
+            self._session_lost_at = time.monotonic()
+
+        # Replies to requests sent on the old session will never come: replay them or fail fast
+        for request_id, (command, release) in list(self._sent_requests.items()):
+            del self._sent_requests[request_id]
+            future = self._pending_requests.get(request_id)
+            if future is None or future.done():
+                continue
+
+            future.remove_done_callback(release)
+            release()
+            if _is_replayable(command):
+                self._replayed_requests += 1
+                self._command_queue.put_nowait(command)
+            else:
+                self._failed_fast_requests += 1
+                future.set_exception(MCPConnectionError(
+                    f"Connection lost before the reply to the request_id {request_id}"))
+
     async def connect_and_run(self):
         async with httpx.AsyncClient(timeout=None) as client:
             self._client = client
 
-            sse_task = asyncio.create_task(self.__sse_listener(), name="sse_listener")
             cmd_task = asyncio.create_task(self.__command_processor(), name="command_processor")
+            attempt = 0
 
             try:
-                logging.debug("Waiting the messages URL from the HA server")
-                await self._messages_url_ready.wait()
-
-                init_params = {
-                    "protocolVersion": f'{MCP_PROTOCOL_VERSION}',
-                    "capabilities": {},
-                    "clientInfo": {
-                        "name": "LurchHome",
-                        "version": "1.0.0"
-                    }
-                }
-                init_response: Dict = await self.__queue_request_and_wait_response("initialize", params=init_params)
-                logging.debug(init_response)
-                if init_response:
-                    await self.__queue_request("notifications/initialized")
-                    self._sse_initialized.set()
-                    logging.info("SSE init complete!")
-
-                await asyncio.gather(sse_task, cmd_task)
+                while True:
+                    try:
+                        await self.__run_session()
+                        logging.warning("SSE stream closed by the HA server")
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        logging.error(f"SSE session error: {e}")
+
+                    attempt = 0 if self._sse_initialized.is_set() else attempt + 1
+                    self.__on_session_lost()
+
+                    delay = _reconnect_delay(attempt)
+                    logging.info("Reconnecting to the HA MCP server in %.2fs", delay)
+                    await asyncio.sleep(delay)
 
             finally:
-                sse_task.cancel()
                 cmd_task.cancel()
+                for task in self._dispatch_tasks:
+                    task.cancel()
 
-                await asyncio.gather(sse_task, cmd_task, return_exceptions=True)
+                await asyncio.gather(cmd_task, *self._dispatch_tasks, return_exceptions=True)
 
-    async def get_tools(self) -> List[Dict[str, Any]]:
-        await self._sse_initialized.wait()
-        return (await self.__queue_request_and_wait_response("tools/list")).get("tools", [])
+    async def get_tools(self, *, timeout: float = DEFAULT_REQUEST_TIMEOUT) -> List[Dict[str, Any]]:
+        started = time.monotonic()
+        await asyncio.wait_for(self._sse_initialized.wait(), timeout=timeout)
+        return (await self.__queue_request_and_wait_response(
+            "tools/list", timeout=timeout - (time.monotonic() - started))).get("tools", [])
 
-    async def call_tool(self, *, name=str, params=Dict) -> Dict[str, Any]:
-        await self._sse_initialized.wait()
+    async def call_tool(self, *, name=str, params=Dict, timeout: float = DEFAULT_REQUEST_TIMEOUT) -> Dict[str, Any]:
+        # While reconnecting, wait for the session within the same deadline instead of hanging forever
+        started = time.monotonic()
+        await asyncio.wait_for(self._sse_initialized.wait(), timeout=timeout)
         return await self.__queue_request_and_wait_response("tools/call", params={
             'name': name,
             'arguments': params or {}
-        })
+        }, timeout=timeout - (time.monotonic() - started))
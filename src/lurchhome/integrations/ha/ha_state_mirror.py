@@ -0,0 +1,138 @@
+import json
+import logging
+import time
+from typing import Dict, Any, List, Optional, Set, Callable
+
+
+def _is_newer(candidate: Dict[str, Any], current: Optional[Dict[str, Any]]) -> bool:
+    if not current:
+        return True
+
+    # HA timestamps are ISO-8601 in UTC, so they compare correctly as strings
+    return (candidate.get('last_updated') or '') >= (current.get('last_updated') or '')
+
+
+def render_home_status(states: List[Dict[str, Any]]) -> str:
+    lines = ['Live Context: An overview of the devices in this smart home:']
+    for state in sorted(states, key=lambda s: s.get('entity_id', '')):
+        attributes = dict(state.get('attributes') or {})
+        name = attributes.pop('friendly_name', None) or state.get('entity_id')
+        lines.append(f"- names: {name}")
+        lines.append(f"  entity_id: {state.get('entity_id')}")
+        lines.append(f"  state: '{state.get('state')}'")
+        if attributes:
+            lines.append(f"  attributes: {json.dumps(attributes, separators=(',', ':'), default=str)}")
+
+    return '\n'.join(lines)
+
+
+class HomeStateMirror:
+    """
+    In-memory copy of the Home Assistant entity states, seeded with `get_states`
+    and kept up to date by the `state_changed` events received by HAWSConnector.
+    Only the entities exposed to Assist are listed, the same ones GetLiveContext returns.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._areas: Dict[str, str] = {}
+        self._hidden: Set[str] = set()
+        # None until known: Home Assistant may not tell (older versions, non admin tokens)
+        self._exposed: Optional[Set[str]] = None
+        self._seeded: bool = False
+        self._seeded_at: Optional[float] = None
+        self._connected: bool = False
+        self._last_update_at: Optional[float] = None
+        self._disconnected_at: Optional[float] = None
+        self._listeners: List[Callable[[str], None]] = []
+
+    @property
+    def is_live(self) -> bool:
+        return self._connected and self._seeded
+
+    @property
+    def exposure_known(self) -> bool:
+        return self._exposed is not None
+
+    @property
+    def seeded_at(self) -> Optional[float]:
+        # Changes with every new snapshot
+        return self._seeded_at
+
+    @property
+    def last_update_at(self) -> Optional[float]:
+        return self._last_update_at
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        # Called with the entity id on every state change, from the websocket reader: must not block
+        self._listeners.append(listener)
+
+    def mark_connected(self) -> None:
+        self._connected = True
+        self._disconnected_at = None
+
+    def mark_disconnected(self) -> None:
+        if self._connected:
+            logging.warning('Home state mirror is now stale: websocket disconnected')
+
+        self._connected = False
+        # Events may be missed while disconnected, so a new snapshot is required
+        self._seeded = False
+        self._disconnected_at = time.monotonic()
+
+    def seed(self, states: List[Dict[str, Any]]) -> None:
+        # The snapshot replaces the table, dropping the entities deleted while disconnected. The only states
+        # kept are the ones of events received after subscribing and newer than the snapshot
+        previous, self._states = self._states, {}
+        for state in states:
+            self.__upsert(state)
+        for entity_id, state in previous.items():
+            if entity_id in self._states:
+                self.__upsert(state)
+
+        self._seeded = True
+        self._seeded_at = self._last_update_at = time.monotonic()
+        logging.info('Home state mirror seeded with %i entities', len(self._states))
+
+    def apply_state_changed(self, data: Dict[str, Any]) -> None:
+        entity_id = data.get('entity_id')
+        if not entity_id:
+            return
+
+        new_state = data.get('new_state')
+        if new_state is None:
+            self._states.pop(entity_id, None)
+        else:
+            self.__upsert(new_state)
+
+        self._last_update_at = time.monotonic()
+
+        for listener in self._listeners:
+            listener(entity_id)
+
+    def set_entity_registry(self, *, areas: Dict[str, str], hidden: Set[str]) -> None:
+        self._areas = areas
+        self._hidden = hidden
+
+    def set_exposed_entities(self, exposed: Optional[Set[str]]) -> None:
+        self._exposed = exposed
+
+    def is_exposed(self, entity_id: str) -> bool:
+        return self._exposed is None or entity_id in self._exposed
+
+    def area_of(self, entity_id: str) -> Optional[str]:
+        return self._areas.get(entity_id)
+
+    def is_hidden(self, entity_id: str) -> bool:
+        return entity_id in self._hidden
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(entity_id)
+
+    def states(self) -> List[Dict[str, Any]]:
+        return [state for entity_id, state in self._states.items() if self.is_exposed(entity_id)]
+
+    def __upsert(self, state: Dict[str, Any]) -> None:
+        entity_id = state.get('entity_id')
+        if entity_id and _is_newer(state, self._states.get(entity_id)):
+            self._states[entity_id] = state
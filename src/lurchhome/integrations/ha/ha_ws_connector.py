@@ -1,28 +1,56 @@
-import json
+import asyncio
 import logging
-from json import JSONDecodeError
-from typing import Optional
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Any, Set, Tuple, Union
 
-from httpx_ws import aconnect_ws
+from httpx_ws import aconnect_ws, WebSocketInvalidTypeReceived
+from wsproto.events import TextMessage, BytesMessage
 
+from lurchhome import codec
+from lurchhome.integrations.ha.ha_entities import EntityTable
+from lurchhome.integrations.ha.ha_event_filter import EventFilter
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+from lurchhome.persistence.event_writer import EventBatchWriter
 from lurchhome.persistence.storage_handler import StorageHandler
 
 EVENT_TYPES = ['state_changed']
+DEBOUNCE_FLUSH_INTERVAL = 0.5
+REGISTRY_TYPES = ['config/area_registry/list', 'config/device_registry/list', 'config/entity_registry/list']
+EXPOSED_ENTITIES_TYPE = 'homeassistant/expose_entity/list'
+# The assistant whose exposed entities are the ones of GetLiveContext
+ASSISTANT = 'conversation'
 
 
-async def ha_ws_subscribe(ws, event_types=None):
+async def _receive_frame(ws) -> Union[str, bytes]:
+    event = await ws.receive()
+    # Binary frames are parsed straight from bytes; wsproto already hands the text ones over as str
+    if isinstance(event, (TextMessage, BytesMessage)):
+        return event.data
+    raise WebSocketInvalidTypeReceived(event)
+
+
+async def _receive_json(ws) -> Dict[str, Any]:
+    return codec.loads(await _receive_frame(ws))
+
+
+async def ha_ws_subscribe(ws, event_types=None, *, subscribe_entities: bool = False) -> int:
     next_id = 1
 
     async def send_and_wait(payload):
         nonlocal next_id
         payload["id"] = next_id
-        await ws.send_text(json.dumps(payload))
-        reply = json.loads(await ws.receive_text())
+        await ws.send_text(codec.dumps(payload))
+        reply = await _receive_json(ws)
         ok = reply.get("success", True) if reply.get("type") == "result" else True
         next_id += 1
         return ok
 
-    if event_types:
+    if subscribe_entities:
+        res = await send_and_wait({"type": "subscribe_entities"})
+        logging.debug("send_and_wait: subscribe_entities result -> %s", res)
+
+    elif event_types:
         for ev in event_types:
             res = await send_and_wait({"type": "subscribe_events", "event_type": ev})
             logging.debug("send_and_wait: subscribe_events result -> %s", res)
@@ -31,44 +59,226 @@ async def ha_ws_subscribe(ws, event_types=None):
         res = await send_and_wait({"type": "subscribe_events"})
         logging.debug("send_and_wait: subscribe_events result -> %s", res)
 
+    return next_id
+
+
+def _resolve_entity_registry(*,
+                             areas: List[Dict[str, Any]],
+                             devices: List[Dict[str, Any]],
+                             entities: List[Dict[str, Any]]) -> Tuple[Dict[str, str], Set[str]]:
+    area_names = {a.get('area_id'): a.get('name') for a in areas}
+    device_areas = {d.get('id'): d.get('area_id') for d in devices}
+
+    entity_areas, hidden = {}, set()
+    for entity in entities:
+        entity_id = entity.get('entity_id')
+        area_id = entity.get('area_id') or device_areas.get(entity.get('device_id'))
+        if area_id in area_names:
+            entity_areas[entity_id] = area_names[area_id]
+
+        # Config/diagnostic entities and hidden ones are not part of the "home status"
+        if entity.get('hidden_by') or entity.get('entity_category'):
+            hidden.add(entity_id)
+
+    return entity_areas, hidden
+
+
+def _resolve_exposed_entities(result: Dict[str, Any]) -> Set[str]:
+    return {entity_id for entity_id, assistants in (result.get('exposed_entities') or {}).items()
+            if (assistants or {}).get(ASSISTANT)}
+
+
+def _to_stored_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    data = event.get("data", {})
+    # None for a removed entity: Redis refuses None values, so the whole pipeline of the batch would fail
+    new_state = data.get('new_state') or {}
+    return {
+        'entity_id': data.get("entity_id") or "",
+        'state': new_state.get('state') or "",
+        'attributes': codec.dumps(new_state.get('attributes')),
+        'timestamp': event.get("time_fired") or event.get("time") or "",
+        'event_type': event.get("event_type") or ""
+    }
+
 
 class HAWSConnector:
-    def __init__(self, *, ha_base_url: str, ha_api_token: str, storage_handler: Optional[StorageHandler] = None):
+    def __init__(self,
+                 *,
+                 ha_base_url: str,
+                 ha_api_token: str,
+                 storage_handler: Optional[StorageHandler] = None,
+                 state_mirror: Optional[HomeStateMirror] = None,
+                 event_writer: Optional[EventBatchWriter] = None,
+                 event_filter: Optional[EventFilter] = None,
+                 subscribe_entities: bool = False):
         self.base_url: str = ha_base_url
         self.api_token: str = ha_api_token
         self.storage_handler: Optional[StorageHandler] = storage_handler
+        self.state_mirror: HomeStateMirror = state_mirror if state_mirror is not None else HomeStateMirror()
+
+        if event_writer is None and storage_handler:
+            event_writer = EventBatchWriter(storage_handler=storage_handler)
+        self.event_writer: Optional[EventBatchWriter] = event_writer
+        self.event_filter: Optional[EventFilter] = event_filter
+        # Compressed add/change/remove diffs of subscribe_entities, applied to a local table, instead of the
+        # state_changed events carrying both the full old and new states
+        self.subscribe_entities: bool = subscribe_entities
+        self._entities: EntityTable = EntityTable()
+        self._entities_seeded: bool = False
+
+        self._connected_at: Optional[float] = None
+        self._frames_received: int = 0
+        # Characters for the text frames, which wsproto hands over already decoded
+        self._bytes_received: int = 0
+        self._parse_seconds: float = 0
 
     async def listen_ws(self):
+        writer_task = asyncio.create_task(self.event_writer.run(), name="event_writer") if self.event_writer else None
+        debounce_task = None
+        if self.event_writer and self.event_filter and self.event_filter.has_debounce:
+            debounce_task = asyncio.create_task(self.__flush_debounced(), name="event_debounce")
+
+        try:
+            await self.__listen_ws()
+        finally:
+            self.state_mirror.mark_disconnected()
+
+            if debounce_task:
+                debounce_task.cancel()
+                await asyncio.gather(debounce_task, return_exceptions=True)
+                for event in self.event_filter.pop_due(force=True):
+                    await self.event_writer.put(_to_stored_event(event))
+
+            if writer_task:
+                writer_task.cancel()
+                await asyncio.gather(writer_task, return_exceptions=True)
+                await self.event_writer.flush()
+
+    async def __flush_debounced(self):
+        while True:
+            await asyncio.sleep(DEBOUNCE_FLUSH_INTERVAL)
+            for event in self.event_filter.pop_due():
+                await self.event_writer.put(_to_stored_event(event))
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._connected_at if self._connected_at else 0
+        return {
+            'mode': 'subscribe_entities' if self.subscribe_entities else 'state_changed',
+            'frames_received': self._frames_received,
+            'bytes_received': self._bytes_received,
+            'bytes_per_second': self._bytes_received / elapsed if elapsed else 0,
+            'parse_seconds': self._parse_seconds
+        }
+
+    async def __receive(self, ws) -> Dict[str, Any]:
+        while True:
+            frame = await _receive_frame(ws)
+            self._frames_received += 1
+            self._bytes_received += len(frame)
+            started = time.perf_counter()
+            try:
+                payload = codec.loads(frame)
+            except ValueError:
+                # A malformed frame is skipped, the next one may be fine
+                logging.exception('listen_ws: unable to decode a frame of %i bytes', len(frame))
+                continue
+            finally:
+                self._parse_seconds += time.perf_counter() - started
+            return payload
+
+    async def __on_state_changed(self, event: Dict[str, Any]):
+        self.state_mirror.apply_state_changed(event.get("data", {}))
+
+        if self.event_writer and (self.event_filter is None or self.event_filter.accept(event)):
+            await self.event_writer.put(_to_stored_event(event))
+
+    async def __on_entities(self, message: Dict[str, Any]):
+        changes = self._entities.apply(message)
+
+        # The first message adds every entity: it's the snapshot, as get_states in the state_changed mode
+        if not self._entities_seeded:
+            self._entities_seeded = True
+            self.state_mirror.seed(self._entities.states())
+            return
+
+        for change in changes:
+            # Same shape of a state_changed event, so the filters and the stored records don't change
+            await self.__on_state_changed({
+                'event_type': 'state_changed',
+                'time_fired': (change.new_state or {}).get('last_updated') or datetime.now(timezone.utc).isoformat(),
+                'data': {'entity_id': change.entity_id, 'old_state': change.old_state, 'new_state': change.new_state}
+            })
+
+    async def __listen_ws(self):
+        started = time.monotonic()
+        self._entities.clear()
+        self._entities_seeded = False
         async with aconnect_ws(f'{self.base_url}/api/websocket') as ws:
-            first = json.loads(await ws.receive_text())
+            first = await self.__receive(ws)
             if first.get("type") != "auth_required":
                 raise RuntimeError(f"Unexpected first frame: {first}")
 
-            await ws.send_text(json.dumps({"type": "auth", "access_token": self.api_token}))
-            auth_reply = json.loads(await ws.receive_text())
+            await ws.send_text(codec.dumps({"type": "auth", "access_token": self.api_token}))
+            auth_reply = await self.__receive(ws)
             if auth_reply.get("type") != "auth_ok":
                 raise RuntimeError(f"Auth failed: {auth_reply}")
 
             logging.info("Logged to the Home Assistant Websocket")
-            await ha_ws_subscribe(ws, EVENT_TYPES)
+            next_id = await ha_ws_subscribe(ws, EVENT_TYPES, subscribe_entities=self.subscribe_entities)
+            self._connected_at = time.monotonic()
+            self.state_mirror.mark_connected()
+            logging.info("Subscribed to the Home Assistant %s in %.0f ms",
+                         'entities' if self.subscribe_entities else 'events', (time.monotonic() - started) * 1000)
+
+            get_states_id = None
+            if not self.subscribe_entities:
+                # Subscribing first and seeding afterwards guarantees no change is lost in between:
+                # events received before the snapshot are reconciled by the mirror using last_updated
+                get_states_id = next_id
+                next_id += 1
+                await ws.send_text(codec.dumps({"id": get_states_id, "type": "get_states"}))
+
+            registry_ids = {}
+            for request_id, registry in enumerate(REGISTRY_TYPES, start=next_id):
+                registry_ids[request_id] = registry
+                await ws.send_text(codec.dumps({"id": request_id, "type": registry}))
+            registries = {}
+
+            exposed_id = next_id + len(REGISTRY_TYPES)
+            await ws.send_text(codec.dumps({"id": exposed_id, "type": EXPOSED_ENTITIES_TYPE}))
 
             while True:
-                try:
-                    payload = json.loads(await ws.receive_text())
-                    logging.debug("listen_ws: %s", payload)
-                    event = payload.get('event', None)
-                    if event:
-                        data = event.get("data", {})
-                        new_state = data.get('new_state', {})
-                        ret_event = {
-                            'entity_id': data.get("entity_id"),
-                            'state': new_state.get('state'),
-                            'attributes': json.dumps(new_state.get('attributes'), separators=(",", ":")),
-                            'timestamp': event.get("time_fired") or event.get("time") or "",
-                            'event_type': event.get("event_type") or ""
-                        }
-                        if self.storage_handler:
-                            await self.storage_handler.store_ha_event(event=ret_event)
-
-                except JSONDecodeError as e:
-                    logging.error(f'listen_ws: json decode exception')
+                payload = await self.__receive(ws)
+                logging.debug("listen_ws: %s", payload)
+
+                if payload.get('type') == 'result' and payload.get('id') == get_states_id:
+                    if payload.get('success'):
+                        self.state_mirror.seed(payload.get('result') or [])
+                    else:
+                        logging.error("listen_ws: get_states failed -> %s", payload.get('error'))
+                    continue
+
+                if payload.get('type') == 'result' and payload.get('id') in registry_ids:
+                    registries[registry_ids[payload['id']]] = payload.get('result') or []
+                    if len(registries) == len(REGISTRY_TYPES):
+                        areas, hidden = _resolve_entity_registry(
+                            areas=registries['config/area_registry/list'],
+                            devices=registries['config/device_registry/list'],
+                            entities=registries['config/entity_registry/list'])
+                        self.state_mirror.set_entity_registry(areas=areas, hidden=hidden)
+                    continue
+
+                if payload.get('type') == 'result' and payload.get('id') == exposed_id:
+                    if payload.get('success'):
+                        self.state_mirror.set_exposed_entities(
+                            _resolve_exposed_entities(payload.get('result') or {}))
+                    else:
+                        logging.warning("listen_ws: exposed entities unknown -> %s", payload.get('error'))
+                        self.state_mirror.set_exposed_entities(None)
+                    continue
+
+                event = payload.get('event', None)
+                if event and self.subscribe_entities:
+                    await self.__on_entities(event)
+                elif event:
+                    await self.__on_state_changed(event)
@@ -1,20 +1,75 @@
 import argparse
 import asyncio
 import contextlib
+import importlib
 import logging
 import os
+import time
+from typing import List, Optional, Tuple
 
-from langchain.chat_models.base import init_chat_model
-from langchain_core.messages import AIMessage
+from redis import RedisError
 
-from lurchhome import __version__
-from lurchhome.brain.lurch_brain import Lurch
+from lurchhome import __version__, tracing
+from lurchhome.brain.fast_path import FastPath
+from lurchhome.brain.home_status_renderer import DEFAULT_MAX_TOKENS
+from lurchhome.brain.response_cache import ResponseCache, DEFAULT_RESPONSE_CACHE_TTL, \
+    DEFAULT_RESPONSE_CACHE_MAX_ENTRIES
+from lurchhome.integrations.ha.ha_event_filter import EventFilter, parse_patterns, parse_pattern_values
 from lurchhome.integrations.ha.ha_mcp_connector import HAMCPConnector
 from lurchhome.integrations.ha.ha_ws_connector import HAWSConnector
-from lurchhome.persistence.storage_handler import StorageHandler
+from lurchhome.persistence.event_writer import EventBatchWriter, DEFAULT_BATCH_SIZE, DEFAULT_FLUSH_INTERVAL, \
+    DEFAULT_QUEUE_SIZE, OVERFLOW_DROP
+from lurchhome.persistence.storage_handler import StorageHandler, StreamRetention, EVENTS_STREAM_KEY, \
+    DEFAULT_MAX_CONNECTIONS, DEFAULT_SOCKET_TIMEOUT, DEFAULT_HEALTH_CHECK_INTERVAL, DEFAULT_EVENTS_MAXLEN, \
+    DEFAULT_EVENTS_MAX_AGE
+from lurchhome.tools.tools_cache import ToolsCache
 
+# Modules pulling langchain, langgraph and the LLM provider SDKs: imported in a thread while the connections to
+# Home Assistant and Redis are set up, instead of before anything else can start. The models are initialized in
+# the same thread afterwards, so that no package is imported by two threads at once
+LAZY_MODULES = ['langchain.chat_models', 'lurchhome.brain.lurch_brain']
 
-async def run():
+
+def _elapsed_ms(started: float) -> float:
+    return (time.perf_counter() - started) * 1000
+
+
+def _import_lazy_modules(modules: List[str]):
+    for module in modules:
+        started = time.perf_counter()
+        importlib.import_module(module)
+        logging.info('Startup: imported %s in %.0f ms', module, _elapsed_ms(started))
+
+
+def _init_chat_model(model: Optional[str], provider: Optional[str]):
+    from langchain.chat_models.base import init_chat_model
+
+    started = time.perf_counter()
+    llm_model = init_chat_model(model=model, model_provider=provider)
+    logging.info('Startup: model %s initialized in %.0f ms', model, _elapsed_ms(started))
+    return llm_model
+
+
+def _load_models(modules: List[str], models: List[Tuple[Optional[str], Optional[str]]]):
+    _import_lazy_modules(modules)
+    return [_init_chat_model(model, provider) for model, provider in models]
+
+
+async def _connect_redis(storage_handler: Optional[StorageHandler]):
+    if not storage_handler:
+        return
+
+    started = time.perf_counter()
+    try:
+        await storage_handler.connect()
+        logging.info('Startup: connected to Redis in %.0f ms', _elapsed_ms(started))
+    except RedisError as e:
+        # Not fatal: the connection pool retries on the next command
+        logging.warning('Startup: unable to connect to Redis: %s', e)
+
+
+async def run(*, serve: bool = False, trace: bool = False):
+    started = time.perf_counter()
     ha_base_url = os.getenv('HA_BASE_URL')
     ha_api_token = os.getenv("HA_API_TOKEN")
 
@@ -29,35 +84,144 @@ async def run():
         os.environ[os.getenv("SET_ENVIRONMENT_API_KEY")] = os.getenv(os.getenv("SET_ENVIRONMENT_API_KEY"))
 
     redis_url = os.getenv('REDIS_URL')
+    redis_socket = os.getenv('REDIS_SOCKET')
     storage_handler = None
-    if redis_url:
+    if redis_url or redis_socket:
         port = os.getenv('REDIS_PORT', None)
-        storage_handler = StorageHandler(host=redis_url, port=port)
+        storage_handler = StorageHandler(
+            host=redis_url,
+            port=port,
+            unix_socket_path=redis_socket,
+            max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)),
+            socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', DEFAULT_SOCKET_TIMEOUT)),
+            health_check_interval=int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', DEFAULT_HEALTH_CHECK_INTERVAL)),
+            retention={
+                EVENTS_STREAM_KEY: StreamRetention(
+                    maxlen=int(os.getenv('LURCH_EVENTS_MAXLEN', DEFAULT_EVENTS_MAXLEN)) or None,
+                    max_age=float(os.getenv('LURCH_EVENTS_MAX_AGE', DEFAULT_EVENTS_MAX_AGE)) or None)
+            })
 
     ha_mcp_connector = None
     ha_ws_connector = None
     t_mcp = None
     t_ws = None
 
-    model = init_chat_model(model=os.getenv('LURCH_LLM_MODEL'), model_provider=os.getenv('LURCH_LLM_PROVIDER'))
-
     async with asyncio.TaskGroup() as tg:
         if ha_base_url:
             ha_mcp_connector = HAMCPConnector(ha_base_url=ha_base_url,
                                               ha_api_token=ha_api_token)
+            event_writer = None
+            if storage_handler:
+                event_writer = EventBatchWriter(
+                    storage_handler=storage_handler,
+                    batch_size=int(os.getenv('HA_EVENTS_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+                    flush_interval=float(os.getenv('HA_EVENTS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)),
+                    max_queue_size=int(os.getenv('HA_EVENTS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)),
+                    overflow=os.getenv('HA_EVENTS_OVERFLOW', OVERFLOW_DROP))
+
             ha_ws_connector = HAWSConnector(ha_base_url=ha_base_url,
                                             ha_api_token=ha_api_token,
-                                            storage_handler=storage_handler)
+                                            storage_handler=storage_handler,
+                                            event_writer=event_writer,
+                                            event_filter=EventFilter(
+                                                include=parse_patterns(os.getenv('HA_EVENTS_INCLUDE')),
+                                                exclude=parse_patterns(os.getenv('HA_EVENTS_EXCLUDE')),
+                                                debounce=parse_pattern_values(os.getenv('HA_EVENTS_DEBOUNCE')),
+                                                deadbands=parse_pattern_values(os.getenv('HA_EVENTS_DEADBAND'))),
+                                            subscribe_entities=os.getenv('HA_SUBSCRIBE_ENTITIES', '0') == '1')
 
             t_mcp = tg.create_task(ha_mcp_connector.connect_and_run())
             t_ws = tg.create_task(ha_ws_connector.listen_ws())
 
+        # The MCP handshake and the websocket auth and subscription run on the loop in the meantime
+        models = [(os.getenv('LURCH_LLM_MODEL'), os.getenv('LURCH_LLM_PROVIDER'))]
+        if os.getenv('LURCH_LLM_FAST_MODEL'):
+            models.append((os.getenv('LURCH_LLM_FAST_MODEL'),
+                           os.getenv('LURCH_LLM_FAST_PROVIDER', os.getenv('LURCH_LLM_PROVIDER'))))
+        (model, *fast_models), _ = await asyncio.gather(
+            asyncio.to_thread(_load_models, LAZY_MODULES + (['lurchhome.server'] if serve else []), models),
+            _connect_redis(storage_handler))
+        fast_model = fast_models[0] if fast_models else None
+
+        from lurchhome.brain.conversation_memory import ConversationMemory, DEFAULT_HISTORY_MAX_TOKENS
+        from lurchhome.brain.lurch_brain import Lurch, ToolsUnavailableError
+        from lurchhome.brain.lurch_events import TextDelta, ToolCall, TurnStats
+        from lurchhome.brain.model_router import ModelRouter, DEFAULT_FAST_MAX_WORDS, DEFAULT_MODEL_TIMEOUT
+        from lurchhome.persistence.conversation_store import ConversationStore
+        from lurchhome.tools.tools_results import ToolResultsCompactor, DEFAULT_TOOL_RESULT_MAX_CHARS, \
+            DEFAULT_TOOL_RESULT_TTL
+        from lurchhome.tools.tools_selector import DEFAULT_TOP_K
+
+        model_router = None
+        if fast_model:
+            model_router = ModelRouter(fast_model=fast_model,
+                                       large_model=model,
+                                       fast_max_words=int(os.getenv('LURCH_LLM_FAST_MAX_WORDS',
+                                                                    DEFAULT_FAST_MAX_WORDS)),
+                                       timeout=float(os.getenv('LURCH_LLM_TIMEOUT', DEFAULT_MODEL_TIMEOUT)))
+
+        response_cache = None
+        if storage_handler and ha_ws_connector and os.getenv('LURCH_RESPONSE_CACHE', '0') == '1':
+            response_cache = ResponseCache(
+                storage_handler=storage_handler,
+                state_mirror=ha_ws_connector.state_mirror,
+                ttl=int(os.getenv('LURCH_RESPONSE_CACHE_TTL', DEFAULT_RESPONSE_CACHE_TTL)),
+                max_entries=int(os.getenv('LURCH_RESPONSE_CACHE_MAX_ENTRIES', DEFAULT_RESPONSE_CACHE_MAX_ENTRIES)))
+
+        tool_results_compactor = None
+        if int(os.getenv('LURCH_TOOL_RESULT_MAX_CHARS', DEFAULT_TOOL_RESULT_MAX_CHARS)):
+            tool_results_compactor = ToolResultsCompactor(
+                storage_handler=storage_handler,
+                max_chars=int(os.getenv('LURCH_TOOL_RESULT_MAX_CHARS', DEFAULT_TOOL_RESULT_MAX_CHARS)),
+                limits={pattern: int(limit)
+                        for pattern, limit in parse_pattern_values(os.getenv('LURCH_TOOL_RESULT_LIMITS')).items()},
+                ttl=int(os.getenv('LURCH_TOOL_RESULT_TTL', DEFAULT_TOOL_RESULT_TTL)))
+
         lurch = await (Lurch(llm_model=model,
                              ha_mcp_connector=ha_mcp_connector,
                              storage_handler=storage_handler,
-                             ha_ws_connector=ha_ws_connector)
-                       .startup())
+                             ha_ws_connector=ha_ws_connector,
+                             home_status_max_tokens=int(os.getenv('LURCH_HOME_STATUS_MAX_TOKENS',
+                                                                  DEFAULT_MAX_TOKENS)),
+                             tools_cache=ToolsCache(storage_handler=storage_handler,
+                                                    cache_file=os.getenv('LURCH_TOOLS_CACHE_FILE')),
+                             conversation_memory=ConversationMemory(
+                                 store=ConversationStore(storage_handler=storage_handler),
+                                 llm_model=model,
+                                 max_tokens=int(os.getenv('LURCH_HISTORY_MAX_TOKENS', DEFAULT_HISTORY_MAX_TOKENS))),
+                             fast_path=FastPath(state_mirror=ha_ws_connector.state_mirror)
+                             if ha_ws_connector and os.getenv('LURCH_FAST_PATH', '1') != '0' else None,
+                             tools_top_k=int(os.getenv('LURCH_TOOLS_TOP_K', DEFAULT_TOP_K)),
+                             core_tools={t.strip() for t in os.getenv('LURCH_CORE_TOOLS').split(',') if t.strip()}
+                             if os.getenv('LURCH_CORE_TOOLS') else None,
+                             response_cache=response_cache,
+                             max_concurrent_llm=int(os.getenv('LURCH_MAX_CONCURRENT_LLM', 0)) or None,
+                             model_router=model_router,
+                             tool_results_compactor=tool_results_compactor)
+                       .startup(wait_for_tools=False))
+        logging.info('Startup: ready for prompts in %.0f ms', _elapsed_ms(started))
+
+        if serve:
+            from lurchhome.server import LurchServer, DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT, \
+                DEFAULT_SESSION_QUEUE_SIZE
+
+            server = LurchServer(lurch=lurch,
+                                 host=os.getenv('LURCH_SERVER_HOST', DEFAULT_SERVER_HOST),
+                                 port=int(os.getenv('LURCH_SERVER_PORT', DEFAULT_SERVER_PORT)),
+                                 session_queue_size=int(os.getenv('LURCH_SESSION_QUEUE_SIZE',
+                                                                  DEFAULT_SESSION_QUEUE_SIZE)))
+            try:
+                await server.serve_forever()
+            finally:
+                await server.aclose()
+                if t_mcp:
+                    t_mcp.cancel()
+                if t_ws:
+                    t_ws.cancel()
+            return
 
+        # Latency histograms in the Prometheus text format, rewritten after every turn
+        metrics_file = os.getenv('LURCH_METRICS_FILE')
         try:
             while True:
                 user_input = await asyncio.to_thread(input, "$ ")
@@ -76,12 +240,28 @@ async def run():
                     break
 
                 if len(user_input) > 0:
-                    async for step in lurch.talk_to_lurch(message=user_input):
-                        if isinstance(step, AIMessage):
-                            if hasattr(step, 'content') and step.content:
-                                print(f'> {step.text()}')
-                            else:
-                                print(f'| working')
+                    answering = False
+                    try:
+                        async for event in lurch.stream(message=user_input):
+                            if isinstance(event, TextDelta):
+                                if not answering:
+                                    print('> ', end='')
+                                    answering = True
+                                print(event.text, end='', flush=True)
+                            elif isinstance(event, ToolCall):
+                                if answering:
+                                    print()
+                                    answering = False
+                                print(f'| {event.name}')
+                            elif isinstance(event, TurnStats):
+                                if answering:
+                                    print()
+                                if trace and event.trace:
+                                    print(tracing.waterfall(event.trace))
+                    except ToolsUnavailableError as e:
+                        print(f'! {e}, please retry in a while')
+                    if metrics_file:
+                        tracing.write_prometheus(metrics_file)
         finally:
 
             if t_mcp:
@@ -120,7 +300,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Set the logging level via command line")
     parser.add_argument('--log', default='WARNING',
                         help='Set the logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Serve several sessions over WebSocket instead of reading from stdin')
+    parser.add_argument('--trace', action='store_true',
+                        help='Print the latency waterfall of every turn')
     args = parser.parse_args()
     logging.basicConfig(level=args.log.upper(), format='%(levelname)s: %(message)s')
 
-    asyncio.run(run())
+    asyncio.run(run(serve=args.serve, trace=args.trace))
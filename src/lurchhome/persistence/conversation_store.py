@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, messages_to_dict, messages_from_dict
+from redis import RedisError
+
+from lurchhome.persistence.storage_handler import StorageHandler
+
+DEFAULT_CONVERSATION_TTL = 7 * 24 * 3600
+MAX_CACHED_CONVERSATIONS = 64
+
+
+class Conversation:
+    def __init__(self, *, conversation_id: str, summary: Optional[str] = None,
+                 turns: Optional[List[List[BaseMessage]]] = None):
+        self.conversation_id = conversation_id
+        self.summary = summary
+        self.turns: List[List[BaseMessage]] = turns or []
+        # Serializes the updates of a conversation (turn append, roll-up)
+        self.lock = asyncio.Lock()
+
+
+class ConversationStore:
+    """
+    Conversations are kept in Redis (a summary string and a list of turns, each one a JSON list of messages)
+    and loaded lazily into a small in-memory LRU. Without a StorageHandler they only live in memory.
+    """
+
+    def __init__(self, *, storage_handler: Optional[StorageHandler] = None, ttl: int = DEFAULT_CONVERSATION_TTL):
+        self.storage_handler = storage_handler
+        self.ttl = ttl
+        self._cache: OrderedDict[str, Conversation] = OrderedDict()
+        # One load per conversation: concurrent loads would hand out two objects, each with its own lock
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def get(self, conversation_id: str) -> Conversation:
+        conversation = self._cache.get(conversation_id)
+        if conversation is None:
+            loading = self._loading.get(conversation_id)
+            if loading is None:
+                loading = asyncio.create_task(self.__load_and_cache(conversation_id), name='conversation_load')
+                self._loading[conversation_id] = loading
+            # Shielded, so that a cancelled caller does not cancel the load for the others
+            conversation = await asyncio.shield(loading)
+
+        if conversation_id in self._cache:
+            self._cache.move_to_end(conversation_id)
+        self.__evict(keep=conversation_id)
+
+        return conversation
+
+    async def append_turn(self, conversation: Conversation, turn: List[BaseMessage]):
+        conversation.turns.append(turn)
+        if self.storage_handler:
+            try:
+                await self.storage_handler.append_conversation_turn(conversation_id=conversation.conversation_id,
+                                                                    turn=json.dumps(messages_to_dict(turn)),
+                                                                    ttl=self.ttl)
+            except RedisError as e:
+                logging.error(e)
+
+    async def replace(self, conversation: Conversation, *, summary: Optional[str], turns: List[List[BaseMessage]]):
+        conversation.summary = summary
+        conversation.turns = turns
+        if self.storage_handler:
+            try:
+                await self.storage_handler.store_conversation(
+                    conversation_id=conversation.conversation_id,
+                    summary=summary,
+                    turns=[json.dumps(messages_to_dict(turn)) for turn in turns],
+                    ttl=self.ttl)
+            except RedisError as e:
+                logging.error(e)
+
+    def __evict(self, *, keep: str):
+        # A conversation in use is never evicted: reloaded, it would get a second lock
+        for conversation_id in [c for c in self._cache if c != keep and not self._cache[c].lock.locked()]:
+            if len(self._cache) <= MAX_CACHED_CONVERSATIONS:
+                break
+            del self._cache[conversation_id]
+
+    async def __load_and_cache(self, conversation_id: str) -> Conversation:
+        try:
+            conversation = await self.__load(conversation_id)
+            self._cache[conversation_id] = conversation
+            return conversation
+        finally:
+            del self._loading[conversation_id]
+
+    async def __load(self, conversation_id: str) -> Conversation:
+        if not self.storage_handler:
+            return Conversation(conversation_id=conversation_id)
+
+        try:
+            summary, turns = await self.storage_handler.load_conversation(conversation_id=conversation_id)
+        except RedisError as e:
+            logging.error(e)
+            return Conversation(conversation_id=conversation_id)
+
+        logging.debug('Conversation %s loaded: %i turns', conversation_id, len(turns))
+        return Conversation(conversation_id=conversation_id,
+                            summary=summary,
+                            turns=[messages_from_dict(json.loads(turn)) for turn in turns])
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from typing import Dict, List, Any
+
+from lurchhome.persistence.storage_handler import StorageHandler
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_QUEUE_SIZE = 10000
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP = 'drop'
+
+
+class EventBatchWriter:
+    """
+    Decouples the websocket reader from Redis: events are buffered in a bounded queue and written
+    in a single pipeline once `batch_size` events are collected or `flush_interval` seconds elapsed.
+    """
+
+    def __init__(self,
+                 *,
+                 storage_handler: StorageHandler,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_queue_size: int = DEFAULT_QUEUE_SIZE,
+                 overflow: str = OVERFLOW_DROP):
+
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self.storage_handler = storage_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._batch: List[Dict[str, Any]] = []
+
+        self._events_received: int = 0
+        self._events_dropped: int = 0
+        self._events_written: int = 0
+        self._events_batched: int = 0
+        self._batches: int = 0
+        # Batches Redis refused: their events are lost
+        self._failed_batches: int = 0
+        self._events_failed: int = 0
+        self._last_batch_size: int = 0
+        self._max_batch_size: int = 0
+
+    async def put(self, event: Dict[str, Any]):
+        self._events_received += 1
+
+        if self.overflow == OVERFLOW_BLOCK:
+            await self._queue.put(event)
+            return
+
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._events_dropped += 1
+            if self._events_dropped % 1000 == 1:
+                logging.warning('EventBatchWriter: queue full, %i events dropped so far', self._events_dropped)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Kept on the instance, so a batch being collected when the writer is cancelled is not lost
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._batch) < self.batch_size:
+                if not self._queue.empty():
+                    self._batch.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Cleared once written: cancelled while writing, the batch is written again by `flush`
+            await self.__write(self._batch)
+            self._batch = []
+
+    async def flush(self):
+        while self._batch or not self._queue.empty():
+            while len(self._batch) < self.batch_size and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+            await self.__write(self._batch)
+            self._batch = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self._queue.qsize(),
+            'events_received': self._events_received,
+            'events_dropped': self._events_dropped,
+            'events_written': self._events_written,
+            'events_failed': self._events_failed,
+            'batches': self._batches,
+            'failed_batches': self._failed_batches,
+            'last_batch_size': self._last_batch_size,
+            'max_batch_size': self._max_batch_size,
+            'avg_batch_size': self._events_batched / self._batches if self._batches else 0
+        }
+
+    async def __write(self, batch: List[Dict[str, Any]]):
+        written = await self.storage_handler.store_ha_events(events=batch)
+        if not written and len(batch) > 1:
+            # One event Redis refuses fails the whole pipeline: written one by one, only that one is lost
+            logging.warning('EventBatchWriter: batch of %i events not written, retrying them one by one', len(batch))
+            for event in batch:
+                written += await self.storage_handler.store_ha_events(events=[event])
+        self._events_written += written
+        if written < len(batch):
+            self._failed_batches += 1
+            self._events_failed += len(batch) - written
+            logging.warning('EventBatchWriter: %i events of a batch of %i not written, %i batches failed so far',
+                            len(batch) - written, len(batch), self._failed_batches)
+        self._events_batched += len(batch)
+        self._batches += 1
+        self._last_batch_size = len(batch)
+        self._max_batch_size = max(self._max_batch_size, len(batch))
+        logging.debug('EventBatchWriter: batch of %i events written', len(batch))
@@ -1,30 +1,129 @@
 import asyncio
 import logging
-from typing import Dict, Optional
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, List, NamedTuple, Tuple
 
 import redis.asyncio as aioredis
 from redis import RedisError
 
+from lurchhome.tracing import traced
+
 INPUT_TOKEN_KEY = 'lurch:llm:i_tok'
 OUTPUT_TOKEN_KEY = 'lurch:llm:o_tok'
+LLM_USAGE_KEY = 'lurch:llm:usage'
+HOME_STATUS_SAVED_TOKEN_KEY = 'lurch:llm:home_status_saved_tok'
+MCP_TOOLS_KEY = 'lurch:mcp:tools'
+FAST_PATH_KEY = 'lurch:fast_path'
+RESPONSE_CACHE_KEY = 'lurch:resp_cache'
+RESPONSE_CACHE_LRU_KEY = 'lurch:resp_cache_lru'
+CONVERSATION_KEY = 'lurch:conv'
+MODEL_STATS_KEY = 'lurch:llm:models'
+TOOL_RESULT_KEY = 'lurch:tool_result'
 EVENTS_STREAM_KEY = 'lurch:ha:events'
-EVENTS_MAXLEN = 10
+
+DEFAULT_EVENTS_MAXLEN = 100000
+DEFAULT_EVENTS_MAX_AGE = 7 * 24 * 3600
+
+USAGE_PERIODS = {
+    # period: (key suffix format, retention in seconds)
+    'hour': ('%Y%m%d%H', 8 * 24 * 3600),
+    'day': ('%Y%m%d', 400 * 24 * 3600)
+}
+USAGE_COUNTERS = ('input', 'output', 'calls', 'cached')
+
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_POOL_TIMEOUT = 5
+DEFAULT_SOCKET_TIMEOUT = 5
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+
+class StreamRetention(NamedTuple):
+    maxlen: Optional[int] = None
+    # seconds
+    max_age: Optional[float] = None
+
+
+def stream_id(timestamp: float) -> str:
+    return f'{int(timestamp * 1000)}-0'
+
+
+def _decode_entries(entries) -> List[Dict[str, str]]:
+    return [dict({k.decode(): v.decode() for k, v in fields.items()}, id=entry_id.decode())
+            for entry_id, fields in entries]
+
+
+def _usage_key(period: str, when: datetime) -> str:
+    return f'{LLM_USAGE_KEY}:{period}:{when.strftime(USAGE_PERIODS[period][0])}'
+
+
+class LLMUsage(NamedTuple):
+    input: int = 0
+    output: int = 0
+    calls: int = 0
+    # Input tokens served from the provider prompt cache (part of `input`)
+    cached: int = 0
 
 
 class StorageHandler:
 
-    def __init__(self, *, host='localhost', port: Optional[str]):
+    def __init__(self,
+                 *,
+                 host='localhost',
+                 port: Optional[str] = None,
+                 unix_socket_path: Optional[str] = None,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 pool_timeout: float = DEFAULT_POOL_TIMEOUT,
+                 socket_timeout: float = DEFAULT_SOCKET_TIMEOUT,
+                 health_check_interval: int = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 retention: Optional[Dict[str, StreamRetention]] = None):
         if port:
             port = int(port)
         else:
             port = 6379
 
-        self.redis = aioredis.Redis(
-            host=host,
-            port=port,
-            db=0
-        )
+        connection_kwargs = {
+            'db': 0,
+            'socket_timeout': socket_timeout,
+            'socket_connect_timeout': socket_timeout,
+            'health_check_interval': health_check_interval
+        }
+
+        if unix_socket_path:
+            connection_kwargs.update(connection_class=aioredis.UnixDomainSocketConnection, path=unix_socket_path)
+        else:
+            connection_kwargs.update(host=host, port=port, socket_keepalive=True)
 
+        # Blocking pool: when all the connections are busy, wait (up to pool_timeout) instead of opening new ones
+        self.pool = aioredis.BlockingConnectionPool(max_connections=max_connections,
+                                                    timeout=pool_timeout,
+                                                    **connection_kwargs)
+        self.redis = aioredis.Redis(connection_pool=self.pool)
+
+        self.retention: Dict[str, StreamRetention] = {
+            EVENTS_STREAM_KEY: StreamRetention(maxlen=DEFAULT_EVENTS_MAXLEN, max_age=DEFAULT_EVENTS_MAX_AGE)
+        }
+        self.retention.update(retention or {})
+
+    async def aclose(self):
+        await self.redis.aclose()
+        await self.pool.disconnect()
+
+    @traced('redis')
+    async def connect(self):
+        # Opens the first pooled connection up front, instead of on the first command of the first turn
+        await self.redis.ping()
+
+    def __add_to_stream(self, pipe, stream: str, events: List[Dict]):
+        retention = self.retention.get(stream, StreamRetention())
+        for event in events:
+            pipe.xadd(stream, event, maxlen=retention.maxlen, approximate=True)
+
+        # Redis can't trim by length and by age in the same XADD
+        if retention.max_age:
+            pipe.xtrim(stream, minid=stream_id(time.time() - retention.max_age), approximate=True)
+
+    @traced('redis')
     async def update_llm_tokens(self, *, input_tokens: int, output_tokens: int) -> tuple[int, int]:
         async with self.redis.pipeline(transaction=True) as pipe:
             await asyncio.gather(pipe.incrby(INPUT_TOKEN_KEY, input_tokens),
@@ -32,9 +131,237 @@ class StorageHandler:
             new_input, new_output = await pipe.execute()
         return int(new_input), int(new_output)
 
+    @traced('redis')
+    async def record_llm_usage(self,
+                               *,
+                               usage: Dict[str, LLMUsage],
+                               when: Optional[datetime] = None) -> tuple[int, int]:
+        """
+        Adds the usage of each model ("provider/model") to the global counters and to the hourly and daily
+        hashes, in a single round trip. Returns the new global input/output totals.
+        """
+        when = when or datetime.now(timezone.utc)
+        input_tokens = sum(u.input for u in usage.values())
+        output_tokens = sum(u.output for u in usage.values())
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(INPUT_TOKEN_KEY, input_tokens)
+            pipe.incrby(OUTPUT_TOKEN_KEY, output_tokens)
+            for period, (_, ttl) in USAGE_PERIODS.items():
+                key = _usage_key(period, when)
+                for model, model_usage in usage.items():
+                    for counter in USAGE_COUNTERS:
+                        pipe.hincrby(key, f'{model}:{counter}', getattr(model_usage, counter))
+                pipe.expire(key, ttl)
+            results = await pipe.execute()
+
+        return int(results[0]), int(results[1])
+
+    @traced('redis')
+    async def get_llm_usage(self, *, period: str = 'day', when: Optional[datetime] = None) -> Dict[str, LLMUsage]:
+        entries = await self.redis.hgetall(_usage_key(period, when or datetime.now(timezone.utc)))
+
+        counters: Dict[str, Dict[str, int]] = {}
+        for field, value in entries.items():
+            model, _, counter = field.decode().rpartition(':')
+            counters.setdefault(model, {})[counter] = int(value)
+
+        return {model: LLMUsage(**{c: v for c, v in values.items() if c in USAGE_COUNTERS})
+                for model, values in counters.items()}
+
+    @traced('redis')
+    async def get_llm_totals(self) -> tuple[int, int]:
+        input_tokens, output_tokens = await self.redis.mget(INPUT_TOKEN_KEY, OUTPUT_TOKEN_KEY)
+        return int(input_tokens or 0), int(output_tokens or 0)
+
+    @traced('redis')
+    async def top_llm_consumers(self,
+                                *,
+                                period: str = 'day',
+                                when: Optional[datetime] = None,
+                                limit: int = 5) -> List[Tuple[str, LLMUsage]]:
+        usage = await self.get_llm_usage(period=period, when=when)
+        return sorted(usage.items(), key=lambda item: item[1].input + item[1].output, reverse=True)[:limit]
+
+    @traced('redis')
+    async def load_conversation(self, *, conversation_id: str) -> Tuple[Optional[str], List[str]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(f'{CONVERSATION_KEY}:{conversation_id}:summary')
+            pipe.lrange(f'{CONVERSATION_KEY}:{conversation_id}:turns', 0, -1)
+            summary, turns = await pipe.execute()
+        return summary.decode() if summary else None, [turn.decode() for turn in turns]
+
+    @traced('redis')
+    async def append_conversation_turn(self, *, conversation_id: str, turn: str, ttl: int):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(f'{CONVERSATION_KEY}:{conversation_id}:turns', turn)
+            pipe.expire(f'{CONVERSATION_KEY}:{conversation_id}:turns', ttl)
+            pipe.expire(f'{CONVERSATION_KEY}:{conversation_id}:summary', ttl)
+            await pipe.execute()
+
+    @traced('redis')
+    async def store_conversation(self, *, conversation_id: str, summary: Optional[str], turns: List[str], ttl: int):
+        summary_key = f'{CONVERSATION_KEY}:{conversation_id}:summary'
+        turns_key = f'{CONVERSATION_KEY}:{conversation_id}:turns'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(summary_key, turns_key)
+            if summary:
+                pipe.set(summary_key, summary, ex=ttl)
+            if turns:
+                pipe.rpush(turns_key, *turns)
+                pipe.expire(turns_key, ttl)
+            await pipe.execute()
+
+    @traced('redis')
+    async def update_home_status_saved_tokens(self, *, saved_tokens: int) -> int:
+        return int(await self.redis.incrby(HOME_STATUS_SAVED_TOKEN_KEY, saved_tokens))
+
+    @traced('redis')
+    async def record_fast_path(self,
+                               *,
+                               hits: int = 0,
+                               misses: int = 0,
+                               failures: int = 0,
+                               unconfirmed: int = 0,
+                               saved_seconds: float = 0) -> Dict[str, float]:
+        """
+        Adds a batch of fast path outcomes to the counters and returns them all.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for field, count in (('hits', hits), ('misses', misses), ('failures', failures),
+                                 ('unconfirmed', unconfirmed)):
+                if count:
+                    pipe.hincrby(FAST_PATH_KEY, field, count)
+            if saved_seconds:
+                pipe.hincrbyfloat(FAST_PATH_KEY, 'saved_seconds', saved_seconds)
+            pipe.hgetall(FAST_PATH_KEY)
+            results = await pipe.execute()
+        return {k.decode(): float(v) for k, v in results[-1].items()}
+
+    @traced('redis')
+    async def record_model_turn(self, *, model: str, latency: float, failed: bool = False) -> Dict[str, float]:
+        """
+        Adds an agent turn run by `model` ("provider/model") to its counters: turns, failures and the total
+        latency of the successful turns. Returns the counters of the model.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(MODEL_STATS_KEY, f'{model}:turns', 1)
+            if failed:
+                pipe.hincrby(MODEL_STATS_KEY, f'{model}:failures', 1)
+            else:
+                pipe.hincrbyfloat(MODEL_STATS_KEY, f'{model}:latency_seconds', latency)
+            pipe.hgetall(MODEL_STATS_KEY)
+            results = await pipe.execute()
+
+        stats = {}
+        for field, value in results[-1].items():
+            name, _, counter = field.decode().rpartition(':')
+            if name == model:
+                stats[counter] = float(value)
+        return stats
+
+    @traced('redis')
+    async def load_mcp_tools(self) -> Dict[str, str]:
+        entries = await self.redis.hgetall(MCP_TOOLS_KEY)
+        return {k.decode(): v.decode() for k, v in entries.items()}
+
+    @traced('redis')
+    async def store_mcp_tools(self, *, tools: Dict[str, str]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(MCP_TOOLS_KEY)
+            if tools:
+                pipe.hset(MCP_TOOLS_KEY, mapping=tools)
+            await pipe.execute()
+
+    @traced('redis')
+    async def store_tool_result(self, *, handle: str, text: str, ttl: int):
+        await self.redis.set(f'{TOOL_RESULT_KEY}:{handle}', text, ex=ttl)
+
+    @traced('redis')
+    async def load_tool_result(self, *, handle: str) -> Optional[str]:
+        value = await self.redis.get(f'{TOOL_RESULT_KEY}:{handle}')
+        return value.decode() if value else None
+
+    @traced('redis')
+    async def load_cached_response(self, *, key: str) -> Optional[str]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(f'{RESPONSE_CACHE_KEY}:{key}')
+            # Only refresh the recency of entries still in the index
+            pipe.zadd(RESPONSE_CACHE_LRU_KEY, {key: time.time()}, xx=True)
+            value, _ = await pipe.execute()
+        return value.decode() if value else None
+
+    @traced('redis')
+    async def store_cached_response(self, *, key: str, value: str, ttl: int, max_entries: int) -> int:
+        """
+        Stores a response cache entry and evicts the least recently used ones over `max_entries`.
+        Returns the number of evicted entries.
+        """
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(f'{RESPONSE_CACHE_KEY}:{key}', value, ex=ttl)
+            pipe.zadd(RESPONSE_CACHE_LRU_KEY, {key: now})
+            # Entries not used for longer than the TTL are expired already
+            pipe.zremrangebyscore(RESPONSE_CACHE_LRU_KEY, '-inf', now - ttl)
+            pipe.zcard(RESPONSE_CACHE_LRU_KEY)
+            results = await pipe.execute()
+
+        overflow = int(results[-1]) - max_entries
+        if overflow <= 0:
+            return 0
+
+        evicted = [key.decode() for key, _ in await self.redis.zpopmin(RESPONSE_CACHE_LRU_KEY, overflow)]
+        if evicted:
+            await self.redis.delete(*(f'{RESPONSE_CACHE_KEY}:{key}' for key in evicted))
+        return len(evicted)
+
+    @traced('redis')
+    async def delete_cached_responses(self, *, keys: List[str]):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(*(f'{RESPONSE_CACHE_KEY}:{key}' for key in keys))
+            pipe.zrem(RESPONSE_CACHE_LRU_KEY, *keys)
+            await pipe.execute()
+
+    @traced('redis')
     async def store_ha_event(self, *, event: Dict):
         try:
-            await self.redis.xadd(EVENTS_STREAM_KEY, event, maxlen=EVENTS_MAXLEN)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                self.__add_to_stream(pipe, EVENTS_STREAM_KEY, [event])
+                await pipe.execute()
         except RedisError as e:
             logging.error(e)
         logging.debug("StorageHandler.store_ha_event")
+
+    @traced('redis')
+    async def store_ha_events(self, *, events: List[Dict]) -> int:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                self.__add_to_stream(pipe, EVENTS_STREAM_KEY, events)
+                await pipe.execute()
+        except RedisError as e:
+            logging.error(e)
+            return 0
+
+        logging.debug("StorageHandler.store_ha_events: %i events", len(events))
+        return len(events)
+
+    @traced('redis')
+    async def read_ha_events(self,
+                             *,
+                             start: str = '-',
+                             end: str = '+',
+                             count: int = 100,
+                             reverse: bool = False) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Reads a page of events between the stream ids `start` and `end` (see `stream_id` to read by time),
+        oldest first or, with `reverse`, newest first. Returns the events and the cursor to pass back as
+        `start` (or `end` when reversed) for the next page, None when there are no more events.
+        """
+        if reverse:
+            entries = await self.redis.xrevrange(EVENTS_STREAM_KEY, max=end, min=start, count=count)
+        else:
+            entries = await self.redis.xrange(EVENTS_STREAM_KEY, min=start, max=end, count=count)
+
+        events = _decode_entries(entries)
+        cursor = f"({events[-1]['id']}" if len(events) == count else None
+        return events, cursor
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import logging
+import uuid
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs
+
+from websockets.asyncio.server import serve, ServerConnection, Server
+from websockets.exceptions import ConnectionClosed
+from websockets.http11 import Request, Response
+
+from lurchhome import codec, tracing
+from lurchhome.brain.lurch_brain import Lurch
+from lurchhome.brain.lurch_events import TextDelta, ToolCall, ToolResult, TurnStats
+
+DEFAULT_SERVER_HOST = '127.0.0.1'
+DEFAULT_SERVER_PORT = 8765
+DEFAULT_SESSION_QUEUE_SIZE = 8
+WS_PATH = '/ws'
+
+
+def _event_to_json(event) -> Dict[str, Any]:
+    if isinstance(event, TextDelta):
+        return {'type': 'delta', 'text': event.text}
+    if isinstance(event, ToolCall):
+        return {'type': 'tool_call', 'name': event.name, 'args': event.args}
+    if isinstance(event, ToolResult):
+        return {'type': 'tool_result', 'name': event.name}
+    if isinstance(event, TurnStats):
+        return {'type': 'done', 'source': event.source, 'time_to_first_token': event.time_to_first_token,
+                'latency': event.latency, 'input_tokens': event.input_tokens,
+                'cached_input_tokens': event.cached_input_tokens, 'output_tokens': event.output_tokens,
+                'model': event.model}
+    raise TypeError(f'Unknown event {event!r}')
+
+
+class Session:
+    """
+    A websocket connection: messages are queued and answered one at a time, in order, while other
+    sessions are served concurrently. The session id is also the conversation id.
+    """
+
+    def __init__(self, *, session_id: str, connection: ServerConnection, queue_size: int):
+        self.session_id = session_id
+        self.connection = connection
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.turns: int = 0
+
+
+class LurchServer:
+    """
+    WebSocket front end to a shared Lurch instance (and so to a single MCP connector, websocket connector
+    and Redis pool). Clients connect to ws://<host>:<port>/ws?session=<id>, send {"message": "..."} and receive
+    the answer as a stream of {"type": "delta"|"tool_call"|"tool_result"|"done"|"error", ...} frames.
+    GET /health and GET /stats are served as plain HTTP.
+    """
+
+    def __init__(self,
+                 *,
+                 lurch: Lurch,
+                 host: str = DEFAULT_SERVER_HOST,
+                 port: int = DEFAULT_SERVER_PORT,
+                 session_queue_size: int = DEFAULT_SESSION_QUEUE_SIZE):
+        self.lurch = lurch
+        self.host = host
+        self.port = port
+        self.session_queue_size = session_queue_size
+
+        self._sessions: Dict[ServerConnection, Session] = {}
+        self._server: Optional[Server] = None
+        self._turns: int = 0
+        self._rejected: int = 0
+
+    @property
+    def bound_port(self) -> Optional[int]:
+        if not self._server:
+            return None
+        return next(iter(self._server.sockets)).getsockname()[1]
+
+    async def start(self) -> 'LurchServer':
+        self._server = await serve(self.__handle, self.host, self.port, process_request=self.__process_request)
+        logging.info('Lurch server listening on %s:%i', self.host, self.bound_port)
+        return self
+
+    async def serve_forever(self):
+        if not self._server:
+            await self.start()
+        await self._server.serve_forever()
+
+    async def aclose(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self._sessions),
+            'queued': sum(session.queue.qsize() for session in self._sessions.values()),
+            'turns': self._turns,
+            'rejected': self._rejected,
+            'lurch': self.lurch.stats()
+        }
+
+    def __process_request(self, connection: ServerConnection, request: Request) -> Optional[Response]:
+        path = urlparse(request.path).path
+        if path == WS_PATH:
+            return None
+        if path == '/health':
+            return connection.respond(200, 'ok\n')
+        if path == '/stats':
+            response = connection.respond(200, codec.dumps(self.stats()))
+            response.headers['Content-Type'] = 'application/json'
+            return response
+        if path == '/metrics':
+            response = connection.respond(200, tracing.render_prometheus())
+            response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+            return response
+        return connection.respond(404, 'not found\n')
+
+    async def __handle(self, connection: ServerConnection):
+        query = parse_qs(urlparse(connection.request.path).query)
+        session = Session(session_id=(query.get('session') or [str(uuid.uuid4())])[0],
+                          connection=connection,
+                          queue_size=self.session_queue_size)
+        self._sessions[connection] = session
+        logging.info('Session %s connected (%i sessions)', session.session_id, len(self._sessions))
+
+        worker = asyncio.create_task(self.__worker(session), name=f'session_{session.session_id}')
+        try:
+            async for frame in connection:
+                if isinstance(frame, bytes):
+                    frame = frame.decode(errors='replace')
+                try:
+                    message = codec.loads(frame)['message'] if frame.startswith('{') else frame
+                except (ValueError, KeyError, TypeError):
+                    await connection.send(codec.dumps({'type': 'error', 'error': 'expected {"message": "..."}'}))
+                    continue
+
+                try:
+                    session.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self._rejected += 1
+                    await connection.send(codec.dumps({'type': 'error', 'error': 'busy'}))
+        except ConnectionClosed:
+            pass
+        finally:
+            worker.cancel()
+            del self._sessions[connection]
+            logging.info('Session %s disconnected after %i turns', session.session_id, session.turns)
+
+    async def __worker(self, session: Session):
+        while True:
+            message = await session.queue.get()
+            try:
+                async for event in self.lurch.stream(message=message, conversation_id=session.session_id):
+                    await session.connection.send(codec.dumps(_event_to_json(event)))
+            except ConnectionClosed:
+                return
+            except Exception as e:
+                logging.exception('Session %s: turn failed', session.session_id)
+                with contextlib.suppress(ConnectionClosed):
+                    await session.connection.send(codec.dumps({'type': 'error', 'error': str(e)}))
+
+            session.turns += 1
+            self._turns += 1
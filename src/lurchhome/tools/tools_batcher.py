@@ -0,0 +1,138 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterator
+
+from lurchhome.tools.tools_interfaces import CallableTools
+
+# Seconds calls to the same tool are collected for before being sent: the calls of an agent step start together
+DEFAULT_BATCH_WINDOW = 0.005
+
+
+def list_params(input_schema: Dict[str, Any]) -> Set[str]:
+    properties = input_schema.get('properties') or {}
+    return {name for name, schema in properties.items()
+            if schema.get('type') == 'array' or any(s.get('type') == 'array' for s in schema.get('anyOf') or [])}
+
+
+# The turn the tool calls are made for, set by the brain: the batcher is shared by all the sessions, so only the
+# calls of the same turn are merged, and none when the turn is unknown
+_turn: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar('lurch_batching_turn', default=None)
+
+
+@contextlib.contextmanager
+def batching_turn() -> Iterator[None]:
+    token = _turn.set(object())
+    try:
+        yield
+    finally:
+        try:
+            _turn.reset(token)
+        except ValueError:
+            # Left from another context, e.g. a generator closed by the event loop: nothing to restore there
+            pass
+
+
+def _merge_key(name: str, params: Dict[str, Any], lists: Set[str], turn: object) -> tuple:
+    # Calls can only be merged when they differ in the list arguments alone
+    scalars = json.dumps({k: v for k, v in params.items() if k not in lists}, sort_keys=True, default=str)
+    return name, scalars, frozenset(lists), turn
+
+
+def _differing(params: Dict[str, Any], other: Dict[str, Any], lists: Set[str]) -> Set[str]:
+    def values(v: List[Any]) -> List[str]:
+        return sorted(json.dumps(item, sort_keys=True, default=str) for item in v)
+
+    return {k for k in lists if values(params[k]) != values(other[k])}
+
+
+def _group(batch: List[Tuple[Dict[str, Any], asyncio.Future]],
+           lists: Set[str]) -> List[Tuple[Dict[str, Any], List[asyncio.Future]]]:
+    """
+    Groups the calls differing from the first of their group in the same single list argument, each group sent
+    as one call. Merging calls that differ in two, e.g. (["Kitchen"], ["light"]) and (["Hall"], ["switch"]),
+    would act on their cross product as well.
+    """
+    # first call, list argument that varies (None until known), merged params, callers
+    groups: List[Tuple[Dict[str, Any], Optional[str], Dict[str, Any], List[asyncio.Future]]] = []
+    for params, future in batch:
+        for i, (first, varying, merged, futures) in enumerate(groups):
+            differing = _differing(first, params, lists)
+            if len(differing) > 1 or (differing and varying and differing != {varying}):
+                continue
+
+            if differing:
+                varying = differing.pop()
+                merged[varying].extend(v for v in params[varying] if v not in merged[varying])
+            groups[i] = (first, varying, merged, futures + [future])
+            break
+        else:
+            groups.append((params, None, {k: list(v) if k in lists else v for k, v in params.items()}, [future]))
+
+    return [(merged, futures) for _, _, merged, futures in groups]
+
+
+class ToolsBatcher:
+    """
+    Merges the calls to the same tool made in the same agent step into a single MCP call, when the tool accepts
+    lists and the calls only differ in one of them: {"area": "Kitchen", "domain": ["light"]} and
+    {"area": "Kitchen", "domain": ["switch"]} become {"area": "Kitchen", "domain": ["light", "switch"]}.
+    Identical calls are sent once. Every caller gets the result (or the error) of the merged call, so only the
+    calls of the same turn are merged.
+    """
+
+    def __init__(self, *, callable_tools: CallableTools, window: float = DEFAULT_BATCH_WINDOW):
+        self.callable_tools = callable_tools
+        self.window = window
+
+        self._pending: Dict[tuple, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._background_tasks = set()
+        self._merged_calls: int = 0
+
+    async def call_tool(self, *, name: str, params: Dict[str, Any], mergeable: Set[str]) -> Dict[str, Any]:
+        lists = {k for k, v in params.items() if k in mergeable and isinstance(v, list)}
+        turn = _turn.get()
+        if not lists or turn is None:
+            return await self.callable_tools.call_tool(name=name, params=params)
+
+        key = _merge_key(name, params, lists, turn)
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            task = asyncio.create_task(self.__flush(key), name=f'tools_batch_{name}')
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+
+        batch.append((params, future))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {'merged_calls': self._merged_calls}
+
+    async def __flush(self, key: tuple):
+        await asyncio.sleep(self.window)
+        batch = self._pending.pop(key)
+
+        name, _, lists, _ = key
+        groups = _group(batch, set(lists))
+        if len(groups) < len(batch):
+            self._merged_calls += len(batch) - len(groups)
+            logging.info('Merged %i calls to %s into %i', len(batch), name, len(groups))
+
+        await asyncio.gather(*[self.__call(name, params, futures) for params, futures in groups])
+
+    async def __call(self, name: str, params: Dict[str, Any], futures: List[asyncio.Future]):
+        try:
+            result = await self.callable_tools.call_tool(name=name, params=params)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in futures:
+            if not future.done():
+                future.set_result(result)
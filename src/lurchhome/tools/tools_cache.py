@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Any, List, Optional
+
+from redis import RedisError
+
+from lurchhome.persistence.storage_handler import StorageHandler
+
+
+def tool_schema_hash(tool_data: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(tool_data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+class ToolsCache:
+    """
+    Persistent cache of the MCP `tools/list` result, stored in Redis when a StorageHandler is available
+    or in a local JSON file otherwise. Every entry is keyed by the hash of the tool definition.
+    """
+
+    def __init__(self, *, storage_handler: Optional[StorageHandler] = None, cache_file: Optional[str] = None):
+        self.storage_handler = storage_handler
+        self.cache_file = cache_file
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            if self.storage_handler:
+                entries = await self.storage_handler.load_mcp_tools()
+            elif self.cache_file and os.path.exists(self.cache_file):
+                entries = await asyncio.to_thread(self.__read_file)
+            else:
+                return {}
+
+            return {schema_hash: json.loads(tool) for schema_hash, tool in entries.items()}
+
+        except (RedisError, OSError, ValueError) as e:
+            logging.error('Unable to load the tools cache: %s', e)
+            return {}
+
+    async def store(self, tools: Dict[str, Dict[str, Any]]):
+        entries = {schema_hash: json.dumps(tool) for schema_hash, tool in tools.items()}
+        try:
+            if self.storage_handler:
+                await self.storage_handler.store_mcp_tools(tools=entries)
+            elif self.cache_file:
+                await asyncio.to_thread(self.__write_file, entries)
+
+        except (RedisError, OSError) as e:
+            logging.error('Unable to store the tools cache: %s', e)
+
+    def __read_file(self) -> Dict[str, str]:
+        with open(self.cache_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    def __write_file(self, entries: Dict[str, str]):
+        tmp_file = f'{self.cache_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp_file, self.cache_file)
+
+
+def index_tools(tools: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {tool_schema_hash(tool): tool for tool in tools}
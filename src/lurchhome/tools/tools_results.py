@@ -0,0 +1,161 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from typing import Dict, Any, Optional
+
+from langchain_core.tools import StructuredTool, BaseTool
+from redis import RedisError
+
+from lurchhome import codec
+from lurchhome.persistence.storage_handler import StorageHandler
+
+READ_TOOL_RESULT_TOOL = 'ReadToolResult'
+
+# Characters of a tool result sent to the LLM, unless a per tool limit applies
+DEFAULT_TOOL_RESULT_MAX_CHARS = 2000
+# Seconds the full results are kept for the agent to read
+DEFAULT_TOOL_RESULT_TTL = 900
+# Full results kept in memory when there's no Redis
+MAX_LOCAL_RESULTS = 64
+
+# Noise of the Home Assistant intent responses
+REDUNDANT_FIELDS = {'language', 'card', 'speech_slots'}
+
+READ_TOOL_RESULT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'handle': {'type': 'string', 'description': 'The handle given in the truncated result'},
+        'offset': {'type': 'integer', 'description': 'Character to start reading from'}
+    },
+    'required': ['handle', 'offset']
+}
+
+
+def _prune(value: Any) -> Any:
+    if isinstance(value, dict):
+        pruned = {k: _prune(v) for k, v in value.items() if k not in REDUNDANT_FIELDS}
+        return {k: v for k, v in pruned.items() if v not in (None, '', [], {})}
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    return value
+
+
+def unwrap(result: Dict[str, Any]) -> str:
+    """
+    The text of a MCP tool result: the content[].text envelope is removed and JSON texts are pruned of empty
+    and redundant fields and re-serialized compactly.
+    """
+    texts = [c.get('text', '') for c in result.get('content') or [] if c.get('type') == 'text']
+    if not texts:
+        return codec.dumps(_prune(result))
+
+    parts = []
+    for text in texts:
+        try:
+            value = _prune(codec.loads(text))
+        except ValueError:
+            parts.append(text)
+            continue
+
+        # {"success": true, "result": "..."} carries nothing but the result
+        if isinstance(value, dict) and value.get('success') is True and set(value) == {'success', 'result'}:
+            value = value['result']
+        parts.append(value if isinstance(value, str) else codec.dumps(value))
+
+    text = '\n'.join(parts)
+    return f'Error: {text}' if result.get('isError') else text
+
+
+class ToolResultsCompactor:
+    """
+    Post-processing of the MCP tool results before they enter the LLM context, where they stay for the following
+    steps of the turn: the results are unwrapped and pruned, then capped to a per tool number of characters.
+    A truncated result is kept whole, in Redis or in memory, under a handle the agent can pass to the
+    ReadToolResult tool to read the rest when it needs to.
+    """
+
+    def __init__(self,
+                 *,
+                 storage_handler: Optional[StorageHandler] = None,
+                 max_chars: int = DEFAULT_TOOL_RESULT_MAX_CHARS,
+                 limits: Optional[Dict[str, int]] = None,
+                 ttl: int = DEFAULT_TOOL_RESULT_TTL):
+        self.storage_handler = storage_handler
+        self.max_chars = max_chars
+        # tool name pattern ("Hass*") -> max characters
+        self.limits = limits or {}
+        self.ttl = ttl
+
+        self._local: OrderedDict[str, str] = OrderedDict()
+        self._raw_chars: int = 0
+        self._sent_chars: int = 0
+        self._truncated: int = 0
+
+    def max_chars_for(self, tool_name: str) -> int:
+        return next((int(limit) for pattern, limit in self.limits.items() if fnmatchcase(tool_name, pattern)),
+                    self.max_chars)
+
+    async def compact(self, tool_name: str, result: Dict[str, Any]) -> str:
+        text = unwrap(result)
+        max_chars = self.max_chars_for(tool_name)
+        self._raw_chars += len(codec.dumps(result))
+
+        if len(text) > max_chars:
+            handle = hashlib.sha1(text.encode()).hexdigest()[:12]
+            if await self.__store(handle, text):
+                self._truncated += 1
+                text = self.__page(text, handle, 0, max_chars)
+                logging.info('Result of %s truncated to %i characters (handle %s)', tool_name, max_chars, handle)
+
+        self._sent_chars += len(text)
+        return text
+
+    async def read(self, handle: str, offset: int = 0) -> str:
+        text = await self.__load(handle)
+        if text is None:
+            return f'No result with handle {handle}: it expired, call the tool again.'
+        return self.__page(text, handle, max(0, offset), self.max_chars)
+
+    def read_tool(self) -> BaseTool:
+        return StructuredTool.from_function(
+            name=READ_TOOL_RESULT_TOOL,
+            description='Reads more of a tool result that was truncated, starting from the given offset.',
+            args_schema=READ_TOOL_RESULT_SCHEMA,
+            coroutine=self.read)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'raw_chars': self._raw_chars, 'sent_chars': self._sent_chars, 'truncated': self._truncated}
+
+    @staticmethod
+    def __page(text: str, handle: str, offset: int, max_chars: int) -> str:
+        page = text[offset:offset + max_chars]
+        remaining = len(text) - offset - len(page)
+        if remaining <= 0:
+            return page
+        return (f'{page}\n[…{remaining} more characters: call {READ_TOOL_RESULT_TOOL} with handle "{handle}" '
+                f'and offset {offset + len(page)} to read more]')
+
+    async def __store(self, handle: str, text: str) -> bool:
+        if self.storage_handler:
+            try:
+                await self.storage_handler.store_tool_result(handle=handle, text=text, ttl=self.ttl)
+                return True
+            except RedisError as e:
+                logging.error('Unable to store the tool result, sending it whole: %s', e)
+                return False
+
+        self._local[handle] = text
+        self._local.move_to_end(handle)
+        while len(self._local) > MAX_LOCAL_RESULTS:
+            self._local.popitem(last=False)
+        return True
+
+    async def __load(self, handle: str) -> Optional[str]:
+        if self.storage_handler:
+            try:
+                return await self.storage_handler.load_tool_result(handle=handle)
+            except RedisError as e:
+                logging.error(e)
+                return None
+        return self._local.get(handle)
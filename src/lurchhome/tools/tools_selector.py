@@ -0,0 +1,86 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Iterable
+
+from langchain_core.tools import BaseTool
+
+DEFAULT_TOP_K = 8
+DEFAULT_CORE_TOOLS = {'GetLiveContext', 'GetDateTime', 'ReadToolResult'}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'i', 'if', 'in', 'is', 'it', 'me', 'my',
+    'of', 'or', 'please', 'the', 'this', 'to', 'use', 'used', 'what', 'when', 'with', 'you', 'your',
+}
+
+# Tool definitions are in English: common words of the household's other language are mapped onto them
+SYNONYMS = {
+    'accendi': ['turn', 'on'], 'spegni': ['turn', 'off'], 'luce': ['light'], 'luci': ['light'],
+    'lampada': ['light'], 'temperatura': ['temperature'], 'termostato': ['climate', 'temperature'],
+    'riscaldamento': ['climate'], 'tapparella': ['cover'], 'tapparelle': ['cover'], 'apri': ['open'],
+    'chiudi': ['close'], 'musica': ['media'], 'ora': ['time'], 'lista': ['list'], 'spesa': ['shopping'],
+    'aspirapolvere': ['vacuum'], 'pausa': ['pause'],
+}
+
+
+def _tokens(text: str) -> List[str]:
+    # "HassTurnOn" -> "Hass Turn On", "media_player" -> "media player"
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text).lower()
+    tokens = []
+    for word in re.findall(r'[^\W_]+', text):
+        if word in STOPWORDS:
+            continue
+        if word in SYNONYMS:
+            tokens.extend(SYNONYMS[word])
+            continue
+        # Naive plural folding, enough for "lights" / "covers" / "temperatures"
+        tokens.append(word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word)
+    return tokens
+
+
+def _tool_text(tool: BaseTool) -> str:
+    args = getattr(tool, 'args', None) or {}
+    # Argument names, descriptions and enum values are good hints ("domain": ["light", "switch", ...])
+    return ' '.join([tool.name, tool.name, tool.description or '', json.dumps(args)])
+
+
+class ToolsSelector:
+    """
+    Local BM25 index over the tool names, descriptions and argument schemas. `select` returns, for a user request,
+    the `top_k` most relevant tools plus the always-on core ones, so that only their schemas are sent to the LLM.
+    """
+
+    def __init__(self, *, tools: List[BaseTool], top_k: int = DEFAULT_TOP_K, core: Optional[Iterable[str]] = None):
+        self.tools = tools
+        self.top_k = top_k
+        self.core: Set[str] = set(DEFAULT_CORE_TOOLS if core is None else core)
+
+        self._postings: Dict[str, List[tuple]] = {}
+        documents = [_tokens(_tool_text(tool)) for tool in tools]
+        for i, document in enumerate(documents):
+            for term, tf in Counter(document).items():
+                self._postings.setdefault(term, []).append((i, tf))
+
+        self._lengths = [len(document) for document in documents]
+        self._avg_length = sum(self._lengths) / len(documents) if documents else 0
+        self._idf = {term: math.log(1 + (len(documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+                     for term, postings in self._postings.items()}
+
+    def scores(self, query: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term in set(_tokens(query)):
+            for i, tf in self._postings.get(term, ()):
+                norm = K1 * (1 - B + B * self._lengths[i] / self._avg_length)
+                scores[i] = scores.get(i, 0) + self._idf[term] * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def select(self, query: str) -> List[BaseTool]:
+        scores = self.scores(query)
+        best = set(sorted(scores, key=lambda i: (-scores[i], i))[:self.top_k])
+        # Keep the original order: the agent gets a stable tool list for the same subset
+        return [tool for i, tool in enumerate(self.tools) if i in best or tool.name in self.core]
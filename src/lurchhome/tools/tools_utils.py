@@ -1,20 +1,38 @@
-import json
+import asyncio
 import logging
 from pprint import pformat
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 
 from jsonschema_pydantic import jsonschema_to_pydantic
 from langchain_core.tools import StructuredTool, BaseTool
+from pydantic import BaseModel
 
+from lurchhome import codec, tracing
+from lurchhome.tools.tools_batcher import ToolsBatcher, list_params
+from lurchhome.tools.tools_cache import ToolsCache, index_tools, tool_schema_hash
 from lurchhome.tools.tools_interfaces import CallableTools, WithTools
+from lurchhome.tools.tools_results import ToolResultsCompactor
 
+_input_models: Dict[str, type[BaseModel]] = {}
+_background_tasks = set()
 
-def _create_langchain_tool(*, tool_data: Dict[str, Any], callable_tool: CallableTools) -> BaseTool:
+
+def _input_model_for(input_schema: Dict[str, Any]) -> type[BaseModel]:
+    schema_hash = tool_schema_hash(input_schema)
+    if schema_hash not in _input_models:
+        _input_models[schema_hash] = jsonschema_to_pydantic(input_schema)
+    return _input_models[schema_hash]
+
+
+def _create_langchain_tool(*,
+                           tool_data: Dict[str, Any],
+                           callable_tool: CallableTools,
+                           batcher: Optional[ToolsBatcher] = None,
+                           compactor: Optional[ToolResultsCompactor] = None) -> BaseTool:
     tool_name = tool_data['name']
     tool_description = tool_data['description']
     input_schema = tool_data.get('inputSchema', {})
-
-    input_model = jsonschema_to_pydantic(input_schema)
+    mergeable = list_params(input_schema)
 
     async def tool_function(*args, **kwargs) -> str:
         try:
@@ -26,19 +44,28 @@ def _create_langchain_tool(*, tool_data: Dict[str, Any], callable_tool: Callable
                         f"{tool_name} received unexpected positional args: {args}"
                     )
 
+            # The pydantic model is only needed to validate a call: build it on first use
+            input_model = _input_model_for(input_schema)
             validated_params = input_model(**kwargs).model_dump(exclude_none=True, exclude_unset=True)
 
             logging.info(f'Calling tool: %s', tool_name)
             logging.debug(f'Params %s', pformat(validated_params))
 
-            result = await callable_tool.call_tool(
-                name=tool_name,
-                params=validated_params
-            )
+            with tracing.span(f'tool.{tool_name}'):
+                if batcher and mergeable:
+                    # The calls of an agent step run concurrently: the ones to the same tool may be merged
+                    result = await batcher.call_tool(name=tool_name, params=validated_params, mergeable=mergeable)
+                else:
+                    result = await callable_tool.call_tool(
+                        name=tool_name,
+                        params=validated_params
+                    )
 
             logging.debug(f'Result: %s', pformat(result))
 
-            return json.dumps(result)
+            if compactor:
+                return await compactor.compact(tool_name, result)
+            return codec.dumps(result)
 
         except Exception as e:
             return f"Error executing {tool_name}: {str(e)}"
@@ -46,15 +73,57 @@ def _create_langchain_tool(*, tool_data: Dict[str, Any], callable_tool: Callable
     return StructuredTool.from_function(
         name=tool_name,
         description=tool_description,
-        args_schema=input_model,
+        args_schema=input_schema or {'type': 'object', 'properties': {}},
         coroutine=tool_function,
     )
 
 
+async def _refresh_tools(*,
+                         with_tools: WithTools,
+                         callable_tools: CallableTools,
+                         tools_cache: ToolsCache,
+                         cached: Dict[str, Dict[str, Any]],
+                         built: Dict[str, BaseTool],
+                         batcher: Optional[ToolsBatcher],
+                         compactor: Optional[ToolResultsCompactor],
+                         on_tools_changed: Optional[Callable[[List[BaseTool]], Awaitable[None]]]):
+    try:
+        live = index_tools(await with_tools.get_tools())
+        if live.keys() == cached.keys():
+            logging.info('Tools cache is up to date (%i tools)', len(live))
+            return
+
+        changed = live.keys() - cached.keys()
+        logging.info('Tools cache outdated: %i tools changed, %i removed',
+                     len(changed), len(cached.keys() - live.keys()))
+
+        tools = {schema_hash: built.get(schema_hash) or _create_langchain_tool(tool_data=tool,
+                                                                               callable_tool=callable_tools,
+                                                                               batcher=batcher,
+                                                                               compactor=compactor)
+                 for schema_hash, tool in live.items()}
+
+        await tools_cache.store(live)
+        if on_tools_changed:
+            await on_tools_changed(_with_read_tool(list(tools.values()), compactor))
+    except Exception:
+        # Runs in background, nobody awaits it: the cached tools stay in use until the next startup
+        logging.exception('Unable to refresh the tools, keeping the cached ones')
+
+
+def _with_read_tool(tools: List[BaseTool], compactor: Optional[ToolResultsCompactor]) -> List[BaseTool]:
+    # Truncated results can be read further through the compactor
+    return tools + [compactor.read_tool()] if compactor and tools else tools
+
+
 async def build_tools(*,
                       with_tools: Optional[WithTools] = None,
                       callable_tools: Optional[CallableTools] = None,
-                      with_and_callable_tools: Optional[BaseTool] = None) -> List[BaseTool]:
+                      with_and_callable_tools: Optional[BaseTool] = None,
+                      tools_cache: Optional[ToolsCache] = None,
+                      on_tools_changed: Optional[Callable[[List[BaseTool]], Awaitable[None]]] = None,
+                      batch_calls: bool = True,
+                      compactor: Optional[ToolResultsCompactor] = None) -> List[BaseTool]:
     if with_and_callable_tools and isinstance(with_and_callable_tools, WithTools):
         _with_tools = with_and_callable_tools
     elif with_tools:
@@ -62,16 +131,49 @@ async def build_tools(*,
     else:
         return []
 
+    if with_and_callable_tools and isinstance(with_and_callable_tools, CallableTools):
+        _callable_tools = with_and_callable_tools
+    elif callable_tools:
+        _callable_tools = callable_tools
+    else:
+        return []
+
+    batcher = ToolsBatcher(callable_tools=_callable_tools) if batch_calls else None
+
+    cached = await tools_cache.load() if tools_cache else {}
+    if cached:
+        # Serve the cached definitions right away and validate them against the live list in background
+        built = {schema_hash: _create_langchain_tool(tool_data=tool,
+                                                     callable_tool=_callable_tools,
+                                                     batcher=batcher,
+                                                     compactor=compactor)
+                 for schema_hash, tool in cached.items()}
+
+        task = asyncio.create_task(_refresh_tools(with_tools=_with_tools,
+                                                  callable_tools=_callable_tools,
+                                                  tools_cache=tools_cache,
+                                                  cached=cached,
+                                                  built=built,
+                                                  batcher=batcher,
+                                                  compactor=compactor,
+                                                  on_tools_changed=on_tools_changed),
+                                   name='tools_refresh')
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+        logging.info('Loaded %i tools from cache', len(built))
+        return _with_read_tool(list(built.values()), compactor)
+
     tools = await _with_tools.get_tools()
 
     if tools:
-        if with_and_callable_tools and isinstance(with_and_callable_tools, CallableTools):
-            _callable_tools = with_and_callable_tools
-        elif callable_tools:
-            _callable_tools = callable_tools
-        else:
-            return []
-
-        return [_create_langchain_tool(tool_data=tool, callable_tool=_callable_tools) for tool in tools]
+        if tools_cache:
+            await tools_cache.store(index_tools(tools))
+
+        return _with_read_tool([_create_langchain_tool(tool_data=tool,
+                                                       callable_tool=_callable_tools,
+                                                       batcher=batcher,
+                                                       compactor=compactor)
+                                for tool in tools], compactor)
 
     return []
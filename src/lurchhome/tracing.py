@@ -0,0 +1,155 @@
+import contextlib
+import contextvars
+import functools
+import os
+import time
+from typing import Dict, Any, List, Optional, NamedTuple, Tuple
+
+# Upper bounds (seconds) of the latency histograms buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+WATERFALL_WIDTH = 40
+
+
+class Span(NamedTuple):
+    name: str
+    start: float
+    end: float
+    depth: int
+    attributes: Dict[str, Any]
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class Trace:
+    """The spans of a turn, for the waterfall: spans are recorded into the trace active in the current context."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.spans: List[Span] = []
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count: int = 0
+        self.sum: float = 0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+_histograms: Dict[str, Histogram] = {}
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('lurch_trace', default=None)
+_depth: contextvars.ContextVar[int] = contextvars.ContextVar('lurch_span_depth', default=0)
+
+
+def _observe(name: str, duration: float) -> None:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = Histogram()
+    histogram.observe(duration)
+
+
+def record(name: str, start: float, end: float, **attributes) -> None:
+    """Records a span measured elsewhere (perf_counter timestamps) into the histograms and the active trace."""
+    _observe(name, end - start)
+
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans.append(Span(name, start, end, _depth.get(), attributes))
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    start = time.perf_counter()
+    token = _depth.set(_depth.get() + 1)
+    try:
+        yield
+    finally:
+        _depth.reset(token)
+        record(name, start, time.perf_counter(), **attributes)
+
+
+def traced(prefix: str):
+    """Spans every call of the decorated coroutine function, as "<prefix>.<function name>"."""
+
+    def decorator(fn):
+        name = f'{prefix}.{fn.__name__}'
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_trace(name: str) -> Tuple[Trace, contextvars.Token]:
+    trace = Trace(name)
+    return trace, _trace.set(trace)
+
+
+def end_trace(trace: Trace, token: contextvars.Token) -> Trace:
+    trace.end = time.perf_counter()
+    _observe(trace.name, trace.end - trace.start)
+    try:
+        _trace.reset(token)
+    except ValueError:
+        # Ended from another context, e.g. a generator closed by the event loop: nothing to restore there
+        pass
+    return trace
+
+
+def histograms() -> Dict[str, Histogram]:
+    return dict(_histograms)
+
+
+def reset() -> None:
+    _histograms.clear()
+
+
+def render_prometheus(prefix: str = 'lurch') -> str:
+    lines = [f'# HELP {prefix}_span_seconds Duration of the traced operations',
+             f'# TYPE {prefix}_span_seconds histogram']
+    for name, histogram in sorted(_histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {histogram.sum:.6f}')
+        lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path: str) -> None:
+    # Written aside and renamed, so that a scraper (e.g. the node exporter textfile collector) never sees half a file
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        f.write(render_prometheus())
+    os.replace(f'{path}.tmp', path)
+
+
+def waterfall(trace: Trace) -> str:
+    end = trace.end or time.perf_counter()
+    total = max(end - trace.start, 1e-9)
+    out = [f'{trace.name}: {total * 1000:.0f} ms']
+    for s in sorted(trace.spans, key=lambda s: (s.start, s.depth)):
+        offset = int((s.start - trace.start) / total * WATERFALL_WIDTH)
+        width = max(1, int(s.duration / total * WATERFALL_WIDTH))
+        bar = (' ' * offset + '█' * width)[:WATERFALL_WIDTH]
+        attributes = ' '.join(f'{k}={v}' for k, v in s.attributes.items())
+        out.append(f'{(s.start - trace.start) * 1000:>7.0f} {s.duration * 1000:>7.0f} ms '
+                   f'|{bar:<{WATERFALL_WIDTH}}| {"  " * s.depth}{s.name} {attributes}'.rstrip())
+    return '\n'.join(out)
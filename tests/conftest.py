@@ -0,0 +1,22 @@
+def make_state(entity_id, state, last_updated='2025-01-01T00:00:00', **attributes):
+    return {'entity_id': entity_id, 'state': state, 'attributes': attributes, 'last_updated': last_updated}
+
+
+class FakeStorageHandler:
+    """
+    In memory stand-in of the response cache part of the StorageHandler.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    async def load_cached_response(self, *, key):
+        return self.entries.get(key)
+
+    async def store_cached_response(self, *, key, value, ttl, max_entries):
+        self.entries[key] = value
+        return 0
+
+    async def delete_cached_responses(self, *, keys):
+        for key in keys:
+            self.entries.pop(key, None)
@@ -0,0 +1,53 @@
+import importlib
+
+import pytest
+
+from lurchhome import codec
+
+CODECS = list(codec.available().values())
+
+
+@pytest.fixture(params=CODECS, ids=[c.name for c in CODECS])
+def json_codec(request) -> codec.Codec:
+    return request.param
+
+
+class TestCodec:
+
+    def test_stdlib_is_always_available(self):
+        assert 'json' in codec.available()
+
+    def test_str_bytes_and_memoryview_are_decoded_alike(self, json_codec):
+        frame = '{"id": 3, "type": "event", "event": {"data": {"entity_id": "light.café"}}}'
+        expected = {'id': 3, 'type': 'event', 'event': {'data': {'entity_id': 'light.café'}}}
+
+        assert json_codec.loads(frame) == expected
+        assert json_codec.loads(frame.encode()) == expected
+        assert json_codec.loads(memoryview(frame.encode())) == expected
+
+    def test_encoding_is_compact_utf8(self, json_codec):
+        encoded = json_codec.dumpb({'name': 'Luce cucina', 'unit': '°C', 'values': [1, 2.5, None, True]})
+
+        assert encoded == '{"name":"Luce cucina","unit":"°C","values":[1,2.5,null,true]}'.encode()
+
+    def test_other_types_are_encoded_as_str(self, json_codec):
+        class Model:
+            def __str__(self):
+                return 'qwen3:8b'
+
+        assert json_codec.dumpb({'model': Model()}) == b'{"model":"qwen3:8b"}'
+
+    def test_malformed_input_raises_value_error(self, json_codec):
+        with pytest.raises(ValueError):
+            json_codec.loads(b'/mcp_server/messages/ABC123')
+
+    def test_codec_can_be_forced(self, monkeypatch):
+        monkeypatch.setenv('LURCH_JSON_CODEC', 'json')
+        try:
+            assert importlib.reload(codec).codec.name == 'json'
+
+            monkeypatch.setenv('LURCH_JSON_CODEC', 'simdjson')
+            assert importlib.reload(codec).codec.name == CODECS[0].name
+        finally:
+            monkeypatch.delenv('LURCH_JSON_CODEC')
+            importlib.reload(codec)
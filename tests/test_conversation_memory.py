@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from lurchhome.brain.conversation_memory import ConversationMemory
+from lurchhome.persistence import conversation_store
+from lurchhome.persistence.conversation_store import ConversationStore, Conversation
+
+
+class FakeStorageHandler:
+    def __init__(self):
+        self.summary = None
+        self.turns = []
+        self.loads = 0
+
+    async def load_conversation(self, *, conversation_id):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return self.summary, list(self.turns)
+
+    async def append_conversation_turn(self, *, conversation_id, turn, ttl):
+        self.turns.append(turn)
+
+    async def store_conversation(self, *, conversation_id, summary, turns, ttl):
+        self.summary, self.turns = summary, list(turns)
+
+
+def _turn(i: int):
+    return [HumanMessage(f'question {i} ' + 'x' * 80), AIMessage(f'answer {i} ' + 'y' * 80)]
+
+
+class TestConversationMemory:
+
+    @pytest.mark.asyncio
+    async def test_history_with_summary(self):
+        conversation = Conversation(conversation_id='c1', summary='The user asked about lights.',
+                                    turns=[_turn(1)])
+
+        history = ConversationMemory.history(conversation)
+
+        assert isinstance(history[0], SystemMessage)
+        assert 'The user asked about lights.' in history[0].text
+        assert history[1:] == _turn(1)
+
+    @pytest.mark.asyncio
+    async def test_no_roll_up_within_budget(self):
+        model = GenericFakeChatModel(messages=iter([]))
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model, max_tokens=1000)
+        conversation = await memory.conversation('c1')
+        await memory.add_turn(conversation, _turn(1))
+
+        assert await memory.roll_up(conversation) is None
+        assert len(conversation.turns) == 1
+
+    @pytest.mark.asyncio
+    async def test_roll_up_oldest_turns(self):
+        storage_handler = FakeStorageHandler()
+        model = GenericFakeChatModel(messages=iter([AIMessage('Summary of turns 0-2')]))
+        memory = ConversationMemory(store=ConversationStore(storage_handler=storage_handler),
+                                    llm_model=model, max_tokens=200)
+        conversation = await memory.conversation('c1')
+        for i in range(5):
+            await memory.add_turn(conversation, _turn(i))
+
+        assert (await memory.roll_up(conversation)).text == 'Summary of turns 0-2'
+
+        assert conversation.summary == 'Summary of turns 0-2'
+        assert [t[0].text.split()[1] for t in conversation.turns] == ['3', '4']
+        assert storage_handler.summary == 'Summary of turns 0-2'
+        assert len(storage_handler.turns) == 2
+
+    @pytest.mark.asyncio
+    async def test_conversation_is_loaded_from_storage(self):
+        storage_handler = FakeStorageHandler()
+        model = GenericFakeChatModel(messages=iter([]))
+        await ConversationMemory(store=ConversationStore(storage_handler=storage_handler),
+                                 llm_model=model).add_turn(Conversation(conversation_id='c1'), _turn(1))
+
+        memory = ConversationMemory(store=ConversationStore(storage_handler=storage_handler), llm_model=model)
+        conversation = await memory.conversation('c1')
+
+        assert [m.text for m in conversation.turns[0]] == [m.text for m in _turn(1)]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_gets_share_one_conversation(self):
+        storage_handler = FakeStorageHandler()
+        store = ConversationStore(storage_handler=storage_handler)
+
+        first, second = await asyncio.gather(store.get('c1'), store.get('c1'))
+
+        assert first is second
+        assert storage_handler.loads == 1
+
+    @pytest.mark.asyncio
+    async def test_conversations_in_use_are_not_evicted(self, monkeypatch):
+        monkeypatch.setattr(conversation_store, 'MAX_CACHED_CONVERSATIONS', 1)
+        store = ConversationStore()
+
+        conversation = await store.get('c1')
+        async with conversation.lock:
+            await store.get('c2')
+            assert await store.get('c1') is conversation
+
+        await store.get('c3')
+        assert await store.get('c1') is not conversation
@@ -0,0 +1,124 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+from lurchhome.persistence.event_writer import EventBatchWriter, OVERFLOW_BLOCK
+
+
+class FakeStorageHandler:
+    def __init__(self, *, failing: bool = False, writing: Optional[asyncio.Event] = None, refused=None):
+        self.batches: List[List[Dict]] = []
+        self.failing = failing
+        # An event Redis refuses fails the whole pipeline
+        self.refused = refused
+        self.writing = writing
+
+    async def store_ha_events(self, *, events: List[Dict]) -> int:
+        if self.writing and not self.writing.is_set():
+            # The first write hangs until cancelled
+            self.writing.set()
+            await asyncio.Event().wait()
+        if self.failing or (self.refused and self.refused in events):
+            # As the real handler does on RedisError
+            return 0
+        self.batches.append(list(events))
+        return len(events)
+
+
+class TestEventBatchWriter:
+    @pytest.fixture
+    def storage_handler(self):
+        return FakeStorageHandler()
+
+    @pytest.mark.asyncio
+    async def test_batches_by_size(self, storage_handler):
+        writer = EventBatchWriter(storage_handler=storage_handler, batch_size=3, flush_interval=10)
+        for i in range(7):
+            await writer.put({'n': i})
+
+        task = asyncio.create_task(writer.run())
+        try:
+            await asyncio.sleep(0.01)
+            assert [len(b) for b in storage_handler.batches] == [3, 3]
+        finally:
+            task.cancel()
+
+        await writer.flush()
+        assert [len(b) for b in storage_handler.batches] == [3, 3, 1]
+        assert writer.stats()['events_written'] == 7
+
+    @pytest.mark.asyncio
+    async def test_batches_by_time(self, storage_handler):
+        writer = EventBatchWriter(storage_handler=storage_handler, batch_size=100, flush_interval=0.05)
+        task = asyncio.create_task(writer.run())
+        try:
+            await writer.put({'n': 1})
+            await writer.put({'n': 2})
+            await asyncio.sleep(0.1)
+            assert storage_handler.batches == [[{'n': 1}, {'n': 2}]]
+        finally:
+            task.cancel()
+
+    @pytest.mark.asyncio
+    async def test_drop_when_full(self, storage_handler):
+        writer = EventBatchWriter(storage_handler=storage_handler, max_queue_size=2)
+        for i in range(5):
+            await writer.put({'n': i})
+
+        stats = writer.stats()
+        assert stats['events_dropped'] == 3
+        assert stats['queue_depth'] == 2
+
+    @pytest.mark.asyncio
+    async def test_block_when_full(self, storage_handler):
+        writer = EventBatchWriter(storage_handler=storage_handler, max_queue_size=1, overflow=OVERFLOW_BLOCK)
+        await writer.put({'n': 1})
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(writer.put({'n': 2}), timeout=0.05)
+        assert writer.stats()['events_dropped'] == 0
+
+    @pytest.mark.asyncio
+    async def test_batch_cancelled_while_writing_is_flushed(self):
+        writing = asyncio.Event()
+        storage_handler = FakeStorageHandler(writing=writing)
+        writer = EventBatchWriter(storage_handler=storage_handler, batch_size=2, flush_interval=10)
+        await writer.put({'n': 1})
+        await writer.put({'n': 2})
+
+        task = asyncio.create_task(writer.run())
+        await writing.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        await writer.flush()
+        assert storage_handler.batches == [[{'n': 1}, {'n': 2}]]
+
+    @pytest.mark.asyncio
+    async def test_failed_batches_are_counted(self):
+        writer = EventBatchWriter(storage_handler=FakeStorageHandler(failing=True))
+        for i in range(3):
+            await writer.put({'n': i})
+
+        await writer.flush()
+
+        stats = writer.stats()
+        assert (stats['failed_batches'], stats['events_failed'], stats['events_written']) == (1, 3, 0)
+
+    @pytest.mark.asyncio
+    async def test_refused_event_does_not_lose_the_batch(self):
+        storage_handler = FakeStorageHandler(refused={'n': 1})
+        writer = EventBatchWriter(storage_handler=storage_handler)
+        for i in range(3):
+            await writer.put({'n': i})
+
+        await writer.flush()
+
+        assert storage_handler.batches == [[{'n': 0}], [{'n': 2}]]
+        stats = writer.stats()
+        assert (stats['failed_batches'], stats['events_failed'], stats['events_written']) == (1, 1, 2)
+
+    def test_unknown_overflow_policy(self, storage_handler):
+        with pytest.raises(ValueError):
+            EventBatchWriter(storage_handler=storage_handler, overflow='whatever')
@@ -0,0 +1,109 @@
+import pytest
+
+from lurchhome.brain.fast_path import FastPath, TURN_ON_TOOL, TURN_OFF_TOOL, SET_TEMPERATURE_TOOL
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+from tests.conftest import make_state
+
+
+STATES = [
+    make_state('light.kitchen', 'on', friendly_name='Kitchen light'),
+    make_state('light.kitchen_spot', 'on', friendly_name='Kitchen spot'),
+    make_state('light.porch', 'off', friendly_name='Porch'),
+    make_state('light.desk', 'off', friendly_name='Desk lamp'),
+    make_state('light.desk_2', 'off', friendly_name='Desk lamp'),
+    make_state('lock.front_door', 'locked', friendly_name='Front door'),
+    make_state('climate.living', 'heat', friendly_name='Living room thermostat', min_temp=7, max_temp=30),
+    # Names starting like an article
+    make_state('light.lamp', 'off', friendly_name='Lamp'),
+    make_state('light.lounge', 'off', friendly_name='Lounge lamp'),
+    make_state('light.island', 'off', friendly_name='Island light'),
+    make_state('light.theater', 'off', friendly_name='Theater light'),
+    make_state('light.reading', 'off', friendly_name='Lettura'),
+    make_state('light.garden', 'off', friendly_name='Illuminazione giardino'),
+]
+
+
+@pytest.fixture
+def fast_path():
+    mirror = HomeStateMirror()
+    mirror.mark_connected()
+    mirror.seed(STATES)
+    mirror.set_entity_registry(areas={'light.kitchen': 'Kitchen', 'light.kitchen_spot': 'Kitchen',
+                                      'light.porch': 'Ingresso'}, hidden=set())
+
+    fast_path = FastPath(state_mirror=mirror)
+    fast_path.set_tools({TURN_ON_TOOL, TURN_OFF_TOOL, SET_TEMPERATURE_TOOL})
+    return fast_path
+
+
+class TestFastPath:
+
+    @pytest.mark.parametrize('message, tool, params', [
+        ('Turn off the kitchen light', TURN_OFF_TOOL, {'name': 'Kitchen light'}),
+        ('please switch the porch on!', TURN_ON_TOOL, {'name': 'Porch'}),
+        ('turn on the kitchen lights', TURN_ON_TOOL, {'area': 'Kitchen', 'domain': ['light']}),
+        ("Spegni le luci dell'ingresso", TURN_OFF_TOOL, {'area': 'Ingresso', 'domain': ['light']}),
+        ('accendi porch', TURN_ON_TOOL, {'name': 'Porch'}),
+        ('set the thermostat to 21', SET_TEMPERATURE_TOOL, {'name': 'Living room thermostat', 'temperature': 21}),
+        ('imposta il termostato a 19,5 gradi', SET_TEMPERATURE_TOOL,
+         {'name': 'Living room thermostat', 'temperature': 19.5}),
+    ])
+    def test_match(self, fast_path, message, tool, params):
+        match = fast_path.match(message)
+
+        assert match.tool == tool
+        assert match.params == params
+
+    @pytest.mark.parametrize('message, name', [
+        ('turn on lamp', 'Lamp'),
+        ('turn on the lamp', 'Lamp'),
+        ('turn on the lounge lamp', 'Lounge lamp'),
+        ('turn on island light', 'Island light'),
+        ('turn on theater light', 'Theater light'),
+        ('accendi lettura', 'Lettura'),
+        ('accendi la lettura', 'Lettura'),
+        ('accendi illuminazione giardino', 'Illuminazione giardino'),
+        ("accendi l'illuminazione giardino", 'Illuminazione giardino'),
+    ])
+    def test_names_starting_like_an_article(self, fast_path, message, name):
+        assert fast_path.match(message).params == {'name': name}
+
+    @pytest.mark.parametrize('message', [
+        'turn off the desk lamp',  # two entities with the same name
+        'turn off the front door',  # locks are never handled here
+        'turn off the garage',  # unknown entity
+        'turn on the kitchen light and the porch',
+        'set the thermostat to 45',  # out of the entity range
+        'what is the temperature in the living room?',
+        'turn it off',
+    ])
+    def test_ambiguous_goes_to_the_agent(self, fast_path, message):
+        assert fast_path.match(message) is None
+
+    def test_reply_in_the_user_language(self, fast_path):
+        assert fast_path.match('turn off the porch').reply == 'Very well. Porch is now off.'
+        assert fast_path.match('spegni porch').reply == 'Molto bene. Porch: spento.'
+        assert fast_path.match('spegni porch').unconfirmed_reply == \
+               'Temo di non poterlo confermare. Home Assistant non ha risposto su Porch.'
+
+    def test_only_exposed_tools(self, fast_path):
+        fast_path.set_tools({TURN_ON_TOOL})
+
+        assert fast_path.match('turn off the porch') is None
+        assert fast_path.match('turn on the porch') is not None
+
+    def test_no_match_when_mirror_is_stale(self, fast_path):
+        fast_path.state_mirror.mark_disconnected()
+
+        assert fast_path.match('turn off the porch') is None
+
+    def test_stats(self, fast_path):
+        fast_path.record_agent_turn(3.0)
+        fast_path.record_miss()
+        fast_path.record_unconfirmed()
+        assert fast_path.record_hit(0.5) == 2.5
+
+        stats = fast_path.stats()
+        assert stats['unconfirmed'] == 1
+        assert stats['hit_rate'] == 1 / 3
+        assert stats['saved_seconds'] == 2.5
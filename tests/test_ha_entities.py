@@ -0,0 +1,66 @@
+from lurchhome.integrations.ha.ha_entities import EntityTable, EntityChange
+
+SNAPSHOT = {'a': {
+    'light.kitchen': {'s': 'off', 'a': {'friendly_name': 'Kitchen', 'brightness': None}, 'c': '01KITCHEN',
+                      'lc': 1735689600.0},
+    'sensor.power': {'s': '120', 'a': {'unit_of_measurement': 'W'}, 'c': {'id': '01POWER', 'user_id': 'u1'},
+                     'lc': 1735689600.0, 'lu': 1735689660.5}}}
+
+
+class TestEntityTable:
+
+    def test_added_entities_are_expanded(self):
+        table = EntityTable()
+
+        changes = table.apply(SNAPSHOT)
+
+        assert [c.entity_id for c in changes] == ['light.kitchen', 'sensor.power']
+        assert all(c.old_state is None for c in changes)
+        assert table.get('light.kitchen') == {
+            'entity_id': 'light.kitchen', 'state': 'off', 'attributes': {'friendly_name': 'Kitchen', 'brightness': None},
+            'last_changed': '2025-01-01T00:00:00+00:00', 'last_updated': '2025-01-01T00:00:00+00:00',
+            'context': {'id': '01KITCHEN', 'parent_id': None, 'user_id': None}}
+        power = table.get('sensor.power')
+        assert power['last_updated'] == '2025-01-01T00:01:00.500000+00:00'
+        assert power['context'] == {'id': '01POWER', 'user_id': 'u1'}
+
+    def test_state_change_updates_last_changed_and_keeps_the_old_state(self):
+        table = EntityTable()
+        table.apply(SNAPSHOT)
+        old_state = table.get('light.kitchen')
+
+        changes = table.apply({'c': {'light.kitchen': {'+': {'s': 'on', 'c': '01ON', 'lc': 1735689720.0,
+                                                             'a': {'brightness': 255}}}}})
+
+        assert changes == [EntityChange('light.kitchen', old_state, table.get('light.kitchen'))]
+        assert old_state['state'] == 'off' and old_state['attributes']['brightness'] is None
+        new_state = table.get('light.kitchen')
+        assert new_state['state'] == 'on'
+        assert new_state['attributes'] == {'friendly_name': 'Kitchen', 'brightness': 255}
+        assert new_state['last_changed'] == new_state['last_updated'] == '2025-01-01T00:02:00+00:00'
+        assert new_state['context'] == {'id': '01ON', 'parent_id': None, 'user_id': None}
+
+    def test_attribute_only_change_and_removed_attributes(self):
+        table = EntityTable()
+        table.apply(SNAPSHOT)
+
+        table.apply({'c': {'light.kitchen': {'+': {'lu': 1735689780.0, 'a': {'color_mode': 'brightness'}},
+                                             '-': {'a': ['brightness']}}}})
+
+        state = table.get('light.kitchen')
+        assert state['state'] == 'off'
+        assert state['attributes'] == {'friendly_name': 'Kitchen', 'color_mode': 'brightness'}
+        assert state['last_changed'] == '2025-01-01T00:00:00+00:00'
+        assert state['last_updated'] == '2025-01-01T00:03:00+00:00'
+
+    def test_removed_and_unknown_entities(self):
+        table = EntityTable()
+        table.apply(SNAPSHOT)
+        old_state = table.get('sensor.power')
+
+        changes = table.apply({'r': ['sensor.power', 'sensor.unknown'],
+                               'c': {'switch.unknown': {'+': {'s': 'on'}}}})
+
+        assert changes == [EntityChange('sensor.power', old_state, None)]
+        assert table.get('sensor.power') is None
+        assert len(table) == 1
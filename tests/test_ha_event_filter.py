@@ -0,0 +1,86 @@
+import pytest
+
+from lurchhome.integrations.ha.ha_event_filter import EventFilter, parse_patterns, parse_pattern_values
+
+
+def _event(entity_id, state, old_state=None, **attributes):
+    data = {
+        'entity_id': entity_id,
+        'new_state': {'entity_id': entity_id, 'state': state, 'attributes': attributes}
+    }
+    if old_state is not None:
+        data['old_state'] = {'entity_id': entity_id, 'state': old_state, 'attributes': attributes}
+    return {'event_type': 'state_changed', 'data': data}
+
+
+class TestParsing:
+
+    def test_parse_patterns(self):
+        assert parse_patterns(' light.*, sensor.power ,') == ['light.*', 'sensor.power']
+        assert parse_patterns(None) == []
+
+    def test_parse_pattern_values(self):
+        assert parse_pattern_values('sensor.*_power=10, sensor.temp=0.5') == {'sensor.*_power': 10.0,
+                                                                              'sensor.temp': 0.5}
+
+
+class TestEventFilter:
+
+    def test_include_and_exclude(self):
+        event_filter = EventFilter(include=['light.*', 'sensor.*'], exclude=['sensor.*_rssi'])
+
+        assert event_filter.accept(_event('light.kitchen', 'on'))
+        assert not event_filter.accept(_event('switch.fan', 'on'))
+        assert not event_filter.accept(_event('sensor.plug_rssi', '-60'))
+        assert event_filter.stats()['excluded'] == 2
+
+    def test_skip_unchanged(self):
+        event_filter = EventFilter()
+
+        assert not event_filter.accept(_event('light.kitchen', 'on', old_state='on'))
+        assert event_filter.accept(_event('light.kitchen', 'off', old_state='on'))
+        assert not event_filter.accept(_event('light.kitchen', 'off'))
+        assert event_filter.accept(_event('light.kitchen', 'off', brightness=10))
+        assert event_filter.stats()['unchanged'] == 2
+
+    def test_deadband_is_relative_to_the_stored_value(self):
+        event_filter = EventFilter(deadbands={'sensor.*_power': 5})
+
+        assert event_filter.accept(_event('sensor.oven_power', '100'))
+        assert not event_filter.accept(_event('sensor.oven_power', '103'))
+        assert not event_filter.accept(_event('sensor.oven_power', '104.9'))
+        assert event_filter.accept(_event('sensor.oven_power', '105'))
+        # non numeric states are not subject to the deadband
+        assert event_filter.accept(_event('sensor.oven_power', 'unavailable'))
+        assert event_filter.stats()['deadband'] == 2
+
+    def test_debounce_keeps_the_latest_event(self):
+        event_filter = EventFilter(debounce={'sensor.*': 10})
+
+        assert event_filter.accept(_event('sensor.power', '1'), now=0)
+        assert not event_filter.accept(_event('sensor.power', '2'), now=1)
+        assert not event_filter.accept(_event('sensor.power', '3'), now=2)
+        assert event_filter.pop_due(now=5) == []
+
+        due = event_filter.pop_due(now=10)
+        assert [e['data']['new_state']['state'] for e in due] == ['3']
+
+        stats = event_filter.stats()
+        assert (stats['coalesced'], stats['debounced'], stats['pending']) == (1, 1, 0)
+
+        # the window restarts from the flushed event
+        assert not event_filter.accept(_event('sensor.power', '4'), now=15)
+        assert event_filter.accept(_event('sensor.power', '5'), now=21)
+        assert event_filter.pop_due(now=30) == []
+
+    def test_debounce_drops_pending_change_when_reverted(self):
+        event_filter = EventFilter(debounce={'sensor.*': 10})
+
+        assert event_filter.accept(_event('sensor.power', '1'), now=0)
+        assert not event_filter.accept(_event('sensor.power', '2'), now=1)
+        assert not event_filter.accept(_event('sensor.power', '1'), now=2)
+        assert event_filter.pop_due(force=True) == []
+
+    def test_removed_entity_is_always_accepted(self):
+        event_filter = EventFilter()
+        assert event_filter.accept({'data': {'entity_id': 'light.kitchen', 'new_state': None}})
@@ -7,6 +7,7 @@ import httpx
 import pytest
 
 import lurchhome.integrations.ha.ha_mcp_connector as ha_mcp_connector
+from lurchhome import tracing
 from lurchhome.integrations.ha.ha_mcp_connector import HAMCPConnector
 
 
@@ -112,6 +113,18 @@ class TestUtilityFunctions:
         assert result == expected
 
 
+    def test_reconnect_delay_is_jittered_and_capped(self):
+        for attempt in range(20):
+            delay = ha_mcp_connector._reconnect_delay(attempt, base=1, cap=8)
+            expected = min(8, 2 ** attempt)
+            assert expected / 2 <= delay <= expected
+
+    def test_is_replayable(self):
+        assert ha_mcp_connector._is_replayable({'method': 'tools/list'})
+        assert ha_mcp_connector._is_replayable({'method': 'tools/call', 'params': {'name': 'GetLiveContext'}})
+        assert not ha_mcp_connector._is_replayable({'method': 'tools/call', 'params': {'name': 'HassTurnOn'}})
+
+
 class TestHomeAssistantConnector:
     @pytest.fixture
     def connector(self):
@@ -174,20 +187,6 @@ class TestHomeAssistantConnector:
         with pytest.raises(httpx.HTTPError, match="HTTP 404"):
             await connector._HAMCPConnector__do_post_request("test_method")
 
-    @pytest.mark.asyncio
-    async def test_queue_request(self, connector):
-        await connector._HAMCPConnector__queue_request("test_method", params={"test": True})
-
-        assert connector._command_queue.qsize() == 1
-
-        command = await connector._command_queue.get()
-        expected = {
-            'action': 'send_request',
-            'method': 'test_method',
-            'params': {'test': True}
-        }
-        assert command == expected
-
     @pytest.mark.asyncio
     async def test_queue_request_and_wait_response_timeout(self, connector):
         with pytest.raises(asyncio.TimeoutError):
@@ -202,9 +201,7 @@ class TestHomeAssistantConnector:
             await asyncio.sleep(0.05)
             request_id = 1
             if request_id in connector._pending_requests:
-                event = connector._pending_requests[request_id]
-                connector._pending_requests[request_id] = {"result": "success"}
-                event.set()
+                connector._pending_requests[request_id].set_result({"result": "success"})
 
         response_task = asyncio.create_task(mock_response())
 
@@ -224,6 +221,7 @@ class TestHomeAssistantConnector:
     async def test_command_processor_send_request(self, connector):
         connector.messages_url = "/mcp_server/messages/TEST123"
         connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
 
         mock_client = AsyncMock()
         mock_response = Mock()
@@ -243,6 +241,328 @@ class TestHomeAssistantConnector:
 
         mock_client.post.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_command_processor_does_not_serialize_requests(self, connector):
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+
+        slow_post = asyncio.Event()
+        posted = []
+
+        async def post(url, content, headers):
+            payload = json.loads(content)
+            posted.append(payload['method'])
+            if payload['method'] == 'slow_method':
+                await slow_post.wait()
+            response = Mock()
+            response.status_code = 200
+            return response
+
+        connector._client = AsyncMock()
+        connector._client.post.side_effect = post
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        try:
+            slow = asyncio.create_task(
+                connector._HAMCPConnector__queue_request_and_wait_response("slow_method", timeout=1))
+            fast = asyncio.create_task(
+                connector._HAMCPConnector__queue_request_and_wait_response("fast_method", timeout=1))
+            await asyncio.sleep(0.05)
+
+            assert posted == ['slow_method', 'fast_method']
+            assert connector.stats()['in_flight_by_method'] == {'slow_method': 1, 'fast_method': 1}
+
+            connector._HAMCPConnector__resolve_reply({"id": 2, "result": "fast"})
+            assert await fast == "fast"
+            assert connector.stats()['in_flight_by_method'] == {'slow_method': 1}
+
+            slow_post.set()
+            connector._HAMCPConnector__resolve_reply({"id": 1, "result": "slow"})
+            assert await slow == "slow"
+            await asyncio.wait_for(connector._command_queue.join(), timeout=1)
+            stats = connector.stats()
+            assert (stats['queue_depth'], stats['in_flight'], stats['in_flight_by_method']) == (0, 0, {})
+        finally:
+            processor.cancel()
+
+    @pytest.mark.asyncio
+    async def test_requests_wait_for_the_first_session(self, connector):
+        connector._HAMCPConnector__set_messages_url("/mcp_server/messages/TEST123")
+        connector._client = AsyncMock()
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await connector._HAMCPConnector__queue_request_and_wait_response("tools/list", timeout=0.05)
+            connector._client.post.assert_not_called()
+        finally:
+            processor.cancel()
+
+    @pytest.mark.asyncio
+    async def test_get_tools_times_out_without_a_session(self, connector):
+        with pytest.raises(asyncio.TimeoutError):
+            await connector.get_tools(timeout=0.05)
+
+    @pytest.mark.asyncio
+    async def test_method_limit_keeps_slot_until_reply(self):
+        connector = HAMCPConnector(ha_base_url='http://test.local', ha_api_token='test_token',
+                                   method_limits={'tools/call': 1})
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+
+        mock_response = Mock()
+        mock_response.status_code = 200
+        connector._client = AsyncMock()
+        connector._client.post.return_value = mock_response
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        first = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("tools/call", timeout=1))
+        second = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("tools/call", timeout=1))
+        try:
+            await asyncio.sleep(0.05)
+            assert connector._client.post.call_count == 1
+            assert connector.stats()['in_flight'] == 1
+
+            connector._HAMCPConnector__resolve_reply({"id": 1, "result": "first"})
+            assert await first == "first"
+
+            await asyncio.sleep(0.05)
+            assert connector._client.post.call_count == 2
+        finally:
+            processor.cancel()
+            second.cancel()
+
+    @pytest.mark.asyncio
+    async def test_saturated_method_does_not_hold_global_slots(self):
+        connector = HAMCPConnector(ha_base_url='http://test.local', ha_api_token='test_token',
+                                   max_in_flight=2, method_limits={'tools/call': 1})
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+
+        posted = []
+
+        async def post(url, content, headers):
+            posted.append(json.loads(content)['method'])
+            response = Mock()
+            response.status_code = 200
+            return response
+
+        connector._client = AsyncMock()
+        connector._client.post.side_effect = post
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        calls = [asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("tools/call", timeout=1)) for _ in range(3)]
+        tools_list = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("tools/list", timeout=1))
+        try:
+            await asyncio.sleep(0.05)
+            assert posted == ['tools/call', 'tools/list']
+            stats = connector.stats()
+            assert (stats['queue_depth'], stats['in_flight']) == (2, 2)
+        finally:
+            processor.cancel()
+            for task in [*calls, tools_list]:
+                task.cancel()
+            await asyncio.gather(processor, *calls, tools_list, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_error_reply_raises_mcp_error(self, connector):
+        waiter = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("tools/call", timeout=1))
+        await asyncio.sleep(0)
+
+        connector._HAMCPConnector__resolve_reply(
+            {"jsonrpc": "2.0", "id": 1, "error": {"code": -32602, "message": "Invalid params"}})
+
+        with pytest.raises(ha_mcp_connector.MCPError, match="Invalid params") as e:
+            await waiter
+        assert e.value.code == -32602
+        assert connector._pending_requests == {}
+
+    @pytest.mark.asyncio
+    async def test_request_latency_is_traced(self, connector):
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+        connector._client = AsyncMock()
+        connector._client.post.return_value = Mock(status_code=200)
+
+        trace, token = tracing.start_trace('turn')
+        waiter = asyncio.create_task(connector._HAMCPConnector__queue_request_and_wait_response(
+            "tools/call", params={'name': 'HassTurnOff', 'arguments': {}}, timeout=1))
+        await asyncio.sleep(0)
+        await connector._HAMCPConnector__command_processor(forever=False)
+        await asyncio.sleep(0.01)
+        connector._HAMCPConnector__resolve_reply({"id": 1, "result": "done"})
+        await waiter
+        tracing.end_trace(trace, token)
+
+        spans = {s.name: s for s in trace.spans}
+        assert list(spans) == ['mcp.queue', 'mcp.post', 'mcp.reply']
+        assert all(s.attributes == {'method': 'HassTurnOff'} for s in spans.values())
+        assert spans['mcp.queue'].end == spans['mcp.post'].start
+        assert spans['mcp.post'].end == spans['mcp.reply'].start
+        assert spans['mcp.reply'].duration >= 0.01
+
+    @pytest.mark.asyncio
+    async def test_out_of_order_replies(self, connector):
+        first = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("first", timeout=1))
+        second = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("second", timeout=1))
+        await asyncio.sleep(0)
+
+        connector._HAMCPConnector__resolve_reply({"id": 2, "result": "two"})
+        connector._HAMCPConnector__resolve_reply({"id": 1, "result": "one"})
+
+        assert await first == "one"
+        assert await second == "two"
+
+    @pytest.mark.asyncio
+    async def test_late_and_orphan_replies_are_counted(self, connector):
+        with pytest.raises(asyncio.TimeoutError):
+            await connector._HAMCPConnector__queue_request_and_wait_response("test_method", timeout=0.01)
+
+        connector._HAMCPConnector__resolve_reply({"id": 1, "result": "too late"})
+        connector._HAMCPConnector__resolve_reply({"id": 99, "result": "unknown"})
+
+        stats = connector.stats()
+        assert stats['late_replies'] == 1
+        assert stats['orphan_replies'] == 1
+        assert stats['pending'] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_request_is_not_sent(self, connector):
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+        connector._client = AsyncMock()
+
+        waiter = asyncio.create_task(
+            connector._HAMCPConnector__queue_request_and_wait_response("test_method", timeout=1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        await connector._HAMCPConnector__command_processor(forever=False)
+
+        connector._client.post.assert_not_called()
+        assert connector.stats()['in_flight'] == 0
+
+    @pytest.mark.asyncio
+    async def test_post_failure_is_propagated(self, connector):
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+        mock_response = Mock()
+        mock_response.status_code = 500
+        mock_response.text = "Boom"
+        connector._client = AsyncMock()
+        connector._client.post.return_value = mock_response
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        try:
+            with pytest.raises(httpx.HTTPError, match="HTTP 500"):
+                await connector._HAMCPConnector__queue_request_and_wait_response("test_method", timeout=1)
+            assert connector.stats()['in_flight'] == 0
+        finally:
+            processor.cancel()
+
+    @pytest.mark.asyncio
+    async def test_session_lost_replays_or_fails_fast(self, connector):
+        connector.messages_url = "/mcp_server/messages/TEST123"
+        connector._messages_url_ready.set()
+        connector._dispatch_ready.set()
+        mock_response = Mock()
+        mock_response.status_code = 200
+        connector._client = AsyncMock()
+        connector._client.post.return_value = mock_response
+
+        processor = asyncio.create_task(connector._HAMCPConnector__command_processor())
+        live_context = asyncio.create_task(connector._HAMCPConnector__queue_request_and_wait_response(
+            "tools/call", params={'name': 'GetLiveContext'}, timeout=1))
+        turn_on = asyncio.create_task(connector._HAMCPConnector__queue_request_and_wait_response(
+            "tools/call", params={'name': 'HassTurnOn'}, timeout=1))
+        try:
+            await asyncio.sleep(0.05)
+            assert connector._client.post.call_count == 2
+
+            connector._HAMCPConnector__on_session_lost()
+
+            with pytest.raises(ha_mcp_connector.MCPConnectionError):
+                await turn_on
+
+            stats = connector.stats()
+            assert (stats['replayed_requests'], stats['failed_fast_requests']) == (1, 1)
+            assert not stats['connected']
+
+            # the replayed request is held back until the session is back
+            await asyncio.sleep(0.05)
+            assert connector._client.post.call_count == 2
+
+            connector._HAMCPConnector__set_messages_url("/mcp_server/messages/NEW456")
+            connector._dispatch_ready.set()
+            await asyncio.sleep(0.05)
+            assert connector._client.post.call_count == 3
+            assert connector._client.post.call_args.args[0] == 'http://test.local/mcp_server/messages/NEW456'
+
+            connector._HAMCPConnector__resolve_reply({"id": 1, "result": "live"})
+            assert await live_context == "live"
+            assert connector.stats()['in_flight'] == 0
+        finally:
+            processor.cancel()
+
+    @pytest.mark.asyncio
+    async def test_connect_and_run_reconnects(self, connector):
+        sessions = 0
+
+        async def sse_listener():
+            nonlocal sessions
+            sessions += 1
+            connector._HAMCPConnector__set_messages_url(f"/mcp_server/messages/S{sessions}")
+            if sessions == 1:
+                await asyncio.sleep(0.05)
+                raise httpx.ReadError("stream dropped")
+            await asyncio.Event().wait()
+
+        async def post(url, content, headers):
+            payload = json.loads(content)
+            if payload.get('method') == 'initialize':
+                asyncio.get_running_loop().call_soon(
+                    connector._HAMCPConnector__resolve_reply, {"id": payload['id'], "result": {"ok": True}})
+            response = Mock()
+            response.status_code = 200
+            return response
+
+        client = AsyncMock()
+        client.post.side_effect = post
+        client.__aenter__.return_value = client
+
+        with patch.object(ha_mcp_connector.httpx, 'AsyncClient', return_value=client), \
+                patch.object(ha_mcp_connector, '_reconnect_delay', return_value=0), \
+                patch.object(connector, '_HAMCPConnector__sse_listener', side_effect=sse_listener):
+            task = asyncio.create_task(connector.connect_and_run())
+            try:
+                for _ in range(100):
+                    if connector.stats()['reconnects'] == 1 and connector.stats()['connected']:
+                        break
+                    await asyncio.sleep(0.01)
+
+                stats = connector.stats()
+                assert stats['reconnects'] == 1
+                assert stats['connected']
+                assert stats['last_outage_seconds'] is not None
+                assert connector.messages_url == "/mcp_server/messages/S2"
+            finally:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
     @pytest.mark.asyncio
     async def test_get_tools_not_initialized(self, connector):
         with pytest.raises(asyncio.TimeoutError):
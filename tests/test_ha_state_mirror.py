@@ -0,0 +1,78 @@
+import pytest
+
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror, render_home_status
+from tests.conftest import make_state
+
+
+class TestHomeStateMirror:
+    @pytest.fixture
+    def mirror(self):
+        return HomeStateMirror()
+
+    def test_not_live_until_connected_and_seeded(self, mirror):
+        assert not mirror.is_live
+
+        mirror.mark_connected()
+        assert not mirror.is_live
+
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00')])
+        assert mirror.is_live
+
+    def test_disconnect_makes_mirror_stale(self, mirror):
+        mirror.mark_connected()
+        mirror.seed([])
+        mirror.mark_disconnected()
+        assert not mirror.is_live
+
+        # a reconnection alone is not enough, a new snapshot is needed
+        mirror.mark_connected()
+        assert not mirror.is_live
+
+    def test_apply_state_changed(self, mirror):
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00')])
+        mirror.apply_state_changed({
+            'entity_id': 'light.kitchen',
+            'new_state': make_state('light.kitchen', 'off', '2025-01-01T10:01:00+00:00')
+        })
+        assert mirror.get('light.kitchen')['state'] == 'off'
+
+    def test_apply_state_removed(self, mirror):
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00')])
+        mirror.apply_state_changed({'entity_id': 'light.kitchen', 'new_state': None})
+        assert mirror.get('light.kitchen') is None
+
+    def test_older_snapshot_does_not_override_newer_event(self, mirror):
+        mirror.apply_state_changed({
+            'entity_id': 'light.kitchen',
+            'new_state': make_state('light.kitchen', 'off', '2025-01-01T10:01:00+00:00')
+        })
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00')])
+        assert mirror.get('light.kitchen')['state'] == 'off'
+
+    def test_reseed_drops_entities_deleted_while_disconnected(self, mirror):
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00'),
+                     make_state('light.old', 'on', '2025-01-01T10:00:00+00:00')])
+        mirror.mark_disconnected()
+        mirror.mark_connected()
+        mirror.seed([make_state('light.kitchen', 'off', '2025-01-01T11:00:00+00:00')])
+
+        assert [s['entity_id'] for s in mirror.states()] == ['light.kitchen']
+        assert mirror.get('light.kitchen')['state'] == 'off'
+
+    def test_only_exposed_entities_are_listed(self, mirror):
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00'),
+                     make_state('switch.pump', 'on', '2025-01-01T10:00:00+00:00')])
+        assert not mirror.exposure_known
+        assert len(mirror.states()) == 2
+
+        mirror.set_exposed_entities({'light.kitchen'})
+        assert mirror.exposure_known
+        assert [s['entity_id'] for s in mirror.states()] == ['light.kitchen']
+
+    def test_render_home_status(self, mirror):
+        mirror.seed([make_state('light.kitchen', 'on', '2025-01-01T10:00:00+00:00',
+                            friendly_name='Kitchen light', brightness=200)])
+        status = render_home_status(mirror.states())
+        assert '- names: Kitchen light' in status
+        assert "state: 'on'" in status
+        assert '"brightness":200' in status
@@ -0,0 +1,109 @@
+from unittest.mock import AsyncMock
+
+import pytest
+import redis.asyncio as aioredis
+from httpx_ws import WebSocketInvalidTypeReceived
+from redis.asyncio.connection import Connection
+from wsproto.events import TextMessage, BytesMessage, Ping
+
+import lurchhome.integrations.ha.ha_ws_connector as ha_ws_connector
+
+
+class TestUtilityFunctions:
+
+    def test_resolve_entity_registry(self):
+        areas, hidden = ha_ws_connector._resolve_entity_registry(
+            areas=[{'area_id': 'kitchen', 'name': 'Kitchen'}, {'area_id': 'bedroom', 'name': 'Bedroom'}],
+            devices=[{'id': 'dev1', 'area_id': 'bedroom'}],
+            entities=[
+                {'entity_id': 'light.kitchen', 'area_id': 'kitchen', 'device_id': 'dev1'},
+                {'entity_id': 'light.bed', 'area_id': None, 'device_id': 'dev1'},
+                {'entity_id': 'sensor.rssi', 'device_id': 'dev1', 'entity_category': 'diagnostic'},
+                {'entity_id': 'switch.orphan'},
+            ])
+
+        assert areas == {'light.kitchen': 'Kitchen', 'light.bed': 'Bedroom', 'sensor.rssi': 'Bedroom'}
+        assert hidden == {'sensor.rssi'}
+
+    def test_resolve_exposed_entities(self):
+        exposed = ha_ws_connector._resolve_exposed_entities({'exposed_entities': {
+            'light.kitchen': {'conversation': True, 'cloud.alexa': True},
+            'switch.pump': {'conversation': False},
+            'sensor.power': {'cloud.google_assistant': True}}})
+        assert exposed == {'light.kitchen'}
+
+    def test_stored_event_attributes_are_compact(self):
+        stored = ha_ws_connector._to_stored_event({
+            'event_type': 'state_changed', 'time_fired': '2025-01-01T00:00:00+00:00',
+            'data': {'entity_id': 'sensor.kitchen', 'new_state': {
+                'state': '21.5', 'attributes': {'unit_of_measurement': '°C', 'friendly_name': 'Kitchen'}}}})
+
+        assert stored['attributes'] == '{"unit_of_measurement":"°C","friendly_name":"Kitchen"}'
+        assert stored['state'] == '21.5'
+
+    def test_removal_event_can_be_encoded_by_redis(self):
+        stored = ha_ws_connector._to_stored_event({
+            'event_type': 'state_changed', 'time_fired': '2025-01-01T00:00:00+00:00',
+            'data': {'entity_id': 'light.kitchen', 'old_state': {'state': 'on'}, 'new_state': None}})
+
+        pipe = aioredis.Redis().pipeline(transaction=False)
+        pipe.xadd('lurch:ha:events', stored)
+        # What redis-py sends on execute: a None value raises DataError here, failing the whole batch
+        assert Connection().pack_commands([args for args, _ in pipe.command_stack])
+        assert stored['state'] == ''
+
+    @pytest.mark.asyncio
+    async def test_text_and_binary_frames_are_decoded(self):
+        ws = AsyncMock()
+        ws.receive.side_effect = [TextMessage(data='{"type": "auth_required"}'),
+                                  BytesMessage(data=b'{"type": "auth_ok"}'),
+                                  Ping()]
+
+        assert await ha_ws_connector._receive_json(ws) == {'type': 'auth_required'}
+        assert await ha_ws_connector._receive_json(ws) == {'type': 'auth_ok'}
+        with pytest.raises(WebSocketInvalidTypeReceived):
+            await ha_ws_connector._receive_json(ws)
+
+
+class FakeEventWriter:
+    def __init__(self):
+        self.events = []
+
+    async def put(self, event):
+        self.events.append(event)
+
+
+class TestHAWSConnector:
+
+    @pytest.mark.asyncio
+    async def test_malformed_frames_are_skipped(self, caplog):
+        connector = ha_ws_connector.HAWSConnector(ha_base_url='http://ha', ha_api_token='token')
+        ws = AsyncMock()
+        ws.receive.side_effect = [TextMessage(data='{"type": '), TextMessage(data='{"type": "event"}')]
+
+        assert await connector._HAWSConnector__receive(ws) == {'type': 'event'}
+        assert connector.stats()['frames_received'] == 2
+        assert 'unable to decode a frame of 9 bytes' in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_entities_diffs_seed_the_mirror_then_are_stored_as_state_changes(self):
+        event_writer = FakeEventWriter()
+        connector = ha_ws_connector.HAWSConnector(ha_base_url='http://ha', ha_api_token='token',
+                                                  event_writer=event_writer, subscribe_entities=True)
+        connector.state_mirror.mark_connected()
+        on_entities = connector._HAWSConnector__on_entities
+
+        await on_entities({'a': {'light.porch': {'s': 'off', 'a': {'friendly_name': 'Porch'}, 'c': '01A',
+                                                 'lc': 1735689600.0}}})
+        assert connector.state_mirror.is_live
+        assert event_writer.events == []
+
+        await on_entities({'c': {'light.porch': {'+': {'s': 'on', 'c': '01B', 'lc': 1735689660.0}}}})
+        await on_entities({'r': ['light.porch']})
+
+        assert event_writer.events == [
+            {'entity_id': 'light.porch', 'state': 'on', 'attributes': '{"friendly_name":"Porch"}',
+             'timestamp': '2025-01-01T00:01:00+00:00', 'event_type': 'state_changed'},
+            {'entity_id': 'light.porch', 'state': '', 'attributes': 'null',
+             'timestamp': event_writer.events[1]['timestamp'], 'event_type': 'state_changed'}]
+        assert connector.state_mirror.get('light.porch') is None
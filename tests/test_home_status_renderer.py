@@ -0,0 +1,100 @@
+import pytest
+
+from lurchhome.brain.home_status_renderer import HomeStatusRenderer, HomeStatus, estimate_tokens
+from tests.conftest import make_state
+
+
+STATES = [
+    make_state('light.kitchen', 'on', friendly_name='Kitchen light', brightness=200, icon='mdi:lamp',
+           supported_color_modes=['brightness']),
+    make_state('sensor.outside_temperature', '12.5', friendly_name='Outside', unit_of_measurement='°C'),
+    make_state('sun.sun', 'above_horizon'),
+    make_state('switch.diagnostic', 'on'),
+]
+
+AREAS = {'light.kitchen': 'Kitchen'}
+
+
+class TestHomeStatusRenderer:
+    @pytest.fixture
+    def renderer(self):
+        return HomeStatusRenderer(max_tokens=1000)
+
+    def test_render_groups_by_area_and_drops_noise(self, renderer):
+        status = renderer.render(STATES, area_of=AREAS.get, is_hidden=lambda e: e == 'switch.diagnostic')
+
+        assert 'Kitchen:\n light: Kitchen light [light.kitchen]=on (brightness=200)' in status
+        assert 'Other:\n sensor: Outside [sensor.outside_temperature]=12.5 °C' in status
+        assert 'sun.sun' not in status
+        assert 'switch.diagnostic' not in status
+        assert 'mdi:lamp' not in status
+
+    def test_render_respects_token_budget(self):
+        states = [make_state(f'light.l{i}', 'on', friendly_name=f'Light number {i}') for i in range(100)]
+        status = HomeStatusRenderer(max_tokens=100).render(states)
+
+        assert estimate_tokens(status) <= 110
+        assert 'entities omitted' in status
+
+    def test_render_delta_for_same_conversation(self, renderer):
+        first = renderer.render(STATES, conversation_id='c1')
+        assert 'Kitchen light' in first
+
+        assert 'no changes' in renderer.render(STATES, conversation_id='c1')
+
+        changed = [make_state('light.kitchen', 'off', friendly_name='Kitchen light')] + STATES[1:]
+        snapshot, changes = renderer.render(changed, conversation_id='c1').split('\n\n')
+        assert snapshot == first
+        assert 'Kitchen light [light.kitchen]=off' in changes
+        assert 'Outside' not in changes
+
+    def test_render_new_snapshot_when_changes_grow(self):
+        renderer = HomeStatusRenderer(max_tokens=60)
+        first = renderer.render(STATES, conversation_id='c1')
+
+        changed = [make_state(s['entity_id'], 'unavailable', friendly_name='Renamed entity') for s in STATES]
+        second = renderer.render(changed, conversation_id='c1')
+        assert second != first
+        assert 'changes since' not in second
+
+    def test_render_full_again_after_reset(self, renderer):
+        renderer.render(STATES, conversation_id='c1')
+        renderer.reset('c1')
+        assert 'Outside' in renderer.render(STATES, conversation_id='c1')
+
+    def test_other_conversations_are_not_affected(self, renderer):
+        renderer.render(STATES, conversation_id='c1')
+        assert 'Outside' in renderer.render(STATES, conversation_id='c2')
+
+    def test_render_parts_keeps_names_in_the_catalogue(self, renderer):
+        first = renderer.render_parts(STATES, area_of=AREAS.get, conversation_id='c1')
+
+        assert 'Kitchen:\n light: Kitchen light [light.kitchen]' in first.catalogue
+        assert ' light.kitchen=on (brightness=200)' in first.pinned
+        assert 'Kitchen light' not in first.pinned
+        assert first.live is None
+
+        changed = [make_state('light.kitchen', 'off', friendly_name='Kitchen light')] + STATES[1:]
+        second = renderer.render_parts(changed, area_of=AREAS.get, conversation_id='c1')
+        assert second.catalogue == first.catalogue
+        assert second.pinned == first.pinned
+        assert 'light.kitchen=off' in second.live
+
+    @pytest.mark.parametrize('max_tokens', [200, 1000])
+    def test_parts_together_respect_the_token_budget(self, max_tokens):
+        renderer = HomeStatusRenderer(max_tokens=max_tokens)
+        states = [make_state(f'light.l{i}', 'on', friendly_name=f'Light number {i}') for i in range(100)]
+        areas = {f'light.l{i}': f'Room {i % 10}' for i in range(100)}
+
+        for turn in range(4):
+            # More changes on every turn, until a new snapshot is needed
+            changed = [make_state(s['entity_id'], 'off', friendly_name=s['attributes']['friendly_name'])
+                       for s in states[:turn * 10]] + states[turn * 10:]
+            status = renderer.render_parts(changed, area_of=areas.get, conversation_id='c1')
+            assert sum(estimate_tokens(part) for part in status if part) <= max_tokens
+
+            text = renderer.render(changed, area_of=areas.get, conversation_id='c2')
+            assert sum(estimate_tokens(part) for part in text.split('\n\n')) <= max_tokens
+
+    def test_home_status_text(self):
+        assert HomeStatus(catalogue='a', live='b').text() == 'a\n\nb'
@@ -0,0 +1,537 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+from lurchhome import tracing
+from lurchhome.brain.conversation_memory import ConversationMemory
+from lurchhome.brain.fast_path import FastPath
+from lurchhome.brain import lurch_brain
+from lurchhome.brain.lurch_brain import Lurch, ToolsUnavailableError, FAST_PATH_STATS_BATCH
+from lurchhome.brain.lurch_events import TextDelta, ToolCall, ToolResult, TurnStats
+from lurchhome.brain.lurch_prompt import SUMMARY_PROMPT
+from lurchhome.brain.model_router import ModelRouter
+from lurchhome.brain.response_cache import ResponseCache
+from lurchhome.integrations.ha.ha_mcp_connector import MCPConnectionError
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+from lurchhome.persistence.conversation_store import ConversationStore
+from lurchhome.persistence.storage_handler import LLMUsage
+from lurchhome.tools.tools_interfaces import WithTools, CallableTools
+from tests.conftest import FakeStorageHandler as CacheStorageHandler
+
+
+class FakeChatModel(GenericFakeChatModel):
+    prompts: List[List[BaseMessage]] = []
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, *args, **kwargs):
+        self.prompts.append(messages)
+        return super()._generate(messages, *args, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Like the real providers: text split in chunks, tool calls and usage on the last one
+        message = self._generate(messages).generations[0].message
+        for token in re.split(r'(\s)', message.content) if message.content else []:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, id=message.id))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content='', id=message.id,
+            usage_metadata=message.usage_metadata,
+            response_metadata=message.response_metadata,
+            tool_call_chunks=[{'name': c['name'], 'args': json.dumps(c['args']), 'id': c['id'], 'index': i}
+                              for i, c in enumerate(message.tool_calls)]))
+
+
+class FailingChatModel(FakeChatModel):
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError('model not loaded')
+
+
+class FakeStorageHandler:
+    def __init__(self):
+        self.usage = []
+        self.model_turns = []
+        self.fast_path = []
+
+    async def record_llm_usage(self, *, usage: Dict[str, LLMUsage]):
+        self.usage.append(usage)
+        return 0, 0
+
+    async def record_model_turn(self, *, model, latency, failed=False):
+        self.model_turns.append((model, failed))
+        return {}
+
+    async def record_fast_path(self, **counts):
+        self.fast_path.append(counts)
+        return {}
+
+
+class FakeMCPConnector(WithTools, CallableTools):
+    def __init__(self, result=None, tools=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+        self.tools = tools or [{'name': 'HassTurnOff', 'description': 'Turns off a device',
+                                'inputSchema': {'type': 'object', 'properties': {'name': {'type': 'string'}}}}]
+
+    async def get_tools(self):
+        return self.tools
+
+    async def call_tool(self, *, name, params):
+        if name == 'GetLiveContext':
+            return {'content': [{'type': 'text', 'text': json.dumps({'result': 'Live Context: porch light on'})}]}
+        self.calls.append((name, params))
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def _fast_path():
+    mirror = HomeStateMirror()
+    mirror.mark_connected()
+    mirror.seed([{'entity_id': 'light.porch', 'state': 'on', 'attributes': {'friendly_name': 'Porch'}}])
+    mirror.set_exposed_entities({'light.porch'})
+    return FastPath(state_mirror=mirror)
+
+
+def _model(*messages):
+    return FakeChatModel(messages=iter(messages))
+
+
+class TestLurch:
+
+    @pytest.mark.asyncio
+    async def test_usage_is_flushed_once_per_turn(self):
+        storage_handler = FakeStorageHandler()
+        model = _model(AIMessage(content='Very well.',
+                                 response_metadata={'model_name': 'qwen3:30b', 'model_provider': 'ollama'},
+                                 usage_metadata={'input_tokens': 120, 'output_tokens': 8, 'total_tokens': 128}))
+        lurch = await Lurch(llm_model=model, storage_handler=storage_handler).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Good evening')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        assert replies == ['Very well.']
+        assert storage_handler.usage == [{'ollama/qwen3:30b': LLMUsage(input=120, output=8, calls=1)}]
+
+    @pytest.mark.asyncio
+    async def test_no_usage_no_flush(self):
+        storage_handler = FakeStorageHandler()
+        lurch = await Lurch(llm_model=_model(AIMessage(content='You rang?')),
+                            storage_handler=storage_handler).startup()
+
+        [m async for m in lurch.talk_to_lurch(message='Lurch!')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        assert storage_handler.usage == []
+
+    @pytest.mark.asyncio
+    async def test_follow_up_sees_the_previous_turn(self):
+        model = _model(AIMessage(content='The kitchen light is on.'), AIMessage(content='Turned off, sir.'))
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model)
+        lurch = await Lurch(llm_model=model, conversation_memory=memory).startup()
+
+        [m async for m in lurch.talk_to_lurch(message='Is the kitchen light on?', conversation_id='c1')]
+        [m async for m in lurch.talk_to_lurch(message='Turn it off', conversation_id='c1')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        texts = [m.text for m in model.prompts[-1]]
+        assert texts.index('Is the kitchen light on?') < texts.index('The kitchen light is on.') \
+               < texts.index('Turn it off')
+
+        conversation = await memory.conversation('c1')
+        assert [[m.text for m in turn] for turn in conversation.turns] == [
+            ['Is the kitchen light on?', 'The kitchen light is on.'],
+            ['Turn it off', 'Turned off, sir.']
+        ]
+
+    @pytest.mark.asyncio
+    async def test_roll_up_holds_an_llm_slot(self):
+        in_flight = []
+
+        class ObservedChatModel(FakeChatModel):
+            def _generate(self, messages, *args, **kwargs):
+                if messages[0].text == SUMMARY_PROMPT:
+                    in_flight.append(lurch.stats()['llm_in_flight'])
+                return super()._generate(messages, *args, **kwargs)
+
+        model = ObservedChatModel(messages=iter([AIMessage(content='Good evening, sir.'),
+                                                 AIMessage(content='Very well, sir.'),
+                                                 AIMessage(content='The user greeted Lurch.')]))
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model, max_tokens=5)
+        lurch = await Lurch(llm_model=model, conversation_memory=memory, max_concurrent_llm=1).startup()
+
+        for message in ['Good evening Lurch', 'Thank you']:
+            [m async for m in lurch.talk_to_lurch(message=message)]
+            await asyncio.gather(*lurch._background_tasks)
+
+        assert in_flight == [1]
+
+    @pytest.mark.asyncio
+    async def test_conversations_are_isolated(self):
+        model = _model(AIMessage(content='Good evening.'), AIMessage(content='Hello.'))
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model)
+        lurch = await Lurch(llm_model=model, conversation_memory=memory).startup()
+
+        [m async for m in lurch.talk_to_lurch(message='Evening Lurch', conversation_id='c1')]
+        [m async for m in lurch.talk_to_lurch(message='Hi', conversation_id='c2')]
+
+        assert 'Evening Lurch' not in [m.text for m in model.prompts[-1]]
+
+    @pytest.mark.asyncio
+    async def test_fast_path_skips_the_llm(self):
+        model = _model()
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': '{}'}], 'isError': False})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector, fast_path=_fast_path()).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Turn off the porch')]
+
+        assert replies == ['Very well. Porch is now off.']
+        assert mcp_connector.calls == [('HassTurnOff', {'name': 'Porch'})]
+        assert model.prompts == []
+        assert lurch.fast_path.stats()['hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_path_failure_falls_back_to_the_agent(self):
+        model = _model(AIMessage(content='I regret the porch light did not respond.'))
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': 'failed'}], 'isError': True})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector, fast_path=_fast_path()).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Turn off the porch')]
+
+        assert replies == ['I regret the porch light did not respond.']
+        assert lurch.fast_path.stats()['failures'] == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('error', [asyncio.TimeoutError(), MCPConnectionError('session lost')])
+    async def test_fast_path_unconfirmed_is_not_run_again(self, error):
+        model = _model()
+        mcp_connector = FakeMCPConnector(error=error)
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector, fast_path=_fast_path()).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Turn off the porch')]
+
+        assert replies == ['I could not confirm that, I am afraid. Home Assistant did not answer about Porch.']
+        assert mcp_connector.calls == [('HassTurnOff', {'name': 'Porch'})]
+        assert model.prompts == []
+        assert lurch.fast_path.stats()['unconfirmed'] == 1
+
+    @pytest.mark.asyncio
+    async def test_fast_path_stats_are_flushed_in_batches(self):
+        storage_handler = FakeStorageHandler()
+        lurch = await Lurch(llm_model=_model(*[AIMessage(content='Good evening.')] * FAST_PATH_STATS_BATCH),
+                            ha_mcp_connector=FakeMCPConnector(), storage_handler=storage_handler,
+                            fast_path=_fast_path()).startup()
+
+        for _ in range(FAST_PATH_STATS_BATCH):
+            [m async for m in lurch.talk_to_lurch(message='Good evening')]
+            await asyncio.gather(*lurch._background_tasks)
+
+        assert storage_handler.fast_path == [{'misses': FAST_PATH_STATS_BATCH}]
+
+    @pytest.mark.asyncio
+    async def test_agents_are_cached_per_tool_subset(self):
+        tools = [{'name': name, 'description': description, 'inputSchema': {'type': 'object', 'properties': {}}}
+                 for name, description in [('HassTurnOff', 'Turns off a device'),
+                                           ('HassMediaPause', 'Pauses a media player'),
+                                           ('GetLiveContext', 'Current state of the devices')]]
+        model = _model(*[AIMessage(content='Done.')] * 3)
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=FakeMCPConnector(tools=tools), tools_top_k=1).startup()
+
+        for message in ['turn off the fan', 'turn off the fan', 'pause the music']:
+            [m async for m in lurch.talk_to_lurch(message=message)]
+
+        assert sorted(sorted(names) for _, names in lurch._agents) == [['GetLiveContext', 'HassMediaPause'],
+                                                                ['GetLiveContext', 'HassTurnOff']]
+
+    @pytest.mark.asyncio
+    async def test_repeated_question_is_answered_from_the_cache(self):
+        model = _model(AIMessage(content='The porch light is on, sir.'))
+        cache = ResponseCache(storage_handler=CacheStorageHandler(), state_mirror=_fast_path().state_mirror)
+        lurch = await Lurch(llm_model=model, response_cache=cache).startup()
+
+        for _ in range(2):
+            replies = [m.text async for m in lurch.talk_to_lurch(message='Is the porch on?')]
+            await asyncio.gather(*lurch._background_tasks)
+            assert replies == ['The porch light is on, sir.']
+
+        assert len(model.prompts) == 1
+        assert cache.stats()['hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_follow_ups_are_not_answered_from_the_cache(self):
+        model = _model(AIMessage(content='The porch light is on, sir.'), AIMessage(content='It is off, sir.'),
+                       AIMessage(content='It is off, sir.'))
+        cache = ResponseCache(storage_handler=CacheStorageHandler(), state_mirror=_fast_path().state_mirror)
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model)
+        lurch = await Lurch(llm_model=model, response_cache=cache, conversation_memory=memory).startup()
+
+        for conversation_id, message in [('c1', 'Is the porch on?'), ('c1', 'And the porch?'), ('c2', 'And the porch?')]:
+            [m async for m in lurch.talk_to_lurch(message=message, conversation_id=conversation_id)]
+            await asyncio.gather(*lurch._background_tasks)
+
+        # The follow-up of c1 is neither stored nor served: c2 asks the model again
+        assert len(model.prompts) == 3
+        assert cache.stats()['hits'] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_text_deltas_and_tool_calls(self):
+        model = _model(AIMessage(content='', tool_calls=[{'name': 'HassTurnOff', 'args': {'name': 'Porch'},
+                                                          'id': 'call_1'}]),
+                       AIMessage(content='The porch light is now off.'))
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': 'ok'}], 'isError': False})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector).startup()
+
+        events = [e async for e in lurch.stream(message='Could you switch off the porch light?')]
+
+        assert events[0] == ToolCall(name='HassTurnOff', args={'name': 'Porch'})
+        assert isinstance(events[1], ToolResult) and events[1].name == 'HassTurnOff'
+        deltas = [e.text for e in events if isinstance(e, TextDelta)]
+        assert len(deltas) > 1
+        assert ''.join(deltas) == 'The porch light is now off.'
+
+        stats = events[-1]
+        assert isinstance(stats, TurnStats) and stats.source == 'agent'
+        assert 0 < stats.time_to_first_token <= stats.latency
+
+    @pytest.mark.asyncio
+    async def test_llm_slot_is_not_held_while_tools_run(self):
+        in_flight_during_tools = []
+
+        class ObservedMCPConnector(FakeMCPConnector):
+            async def call_tool(self, *, name, params):
+                if name == 'HassTurnOff':
+                    in_flight_during_tools.append(lurch._llm_in_flight)
+                return await super().call_tool(name=name, params=params)
+
+        model = _model(AIMessage(content='', tool_calls=[{'name': 'HassTurnOff', 'args': {'name': 'Porch'},
+                                                          'id': 'call_1'}]),
+                       AIMessage(content='The porch light is now off.'))
+        mcp_connector = ObservedMCPConnector({'content': [{'type': 'text', 'text': 'ok'}], 'isError': False})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector, max_concurrent_llm=1).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Could you switch off the porch light?')]
+
+        assert replies[-1] == 'The porch light is now off.'
+        assert in_flight_during_tools == [0]
+        assert (lurch._llm_in_flight, lurch._llm_peak_in_flight, lurch._llm_waiting) == (0, 1, 0)
+
+    @pytest.mark.asyncio
+    async def test_turns_wait_for_the_tools_loaded_in_background(self):
+        tools_listed = asyncio.Event()
+
+        class SlowMCPConnector(FakeMCPConnector):
+            async def get_tools(self):
+                await tools_listed.wait()
+                return self.tools
+
+        model = _model(AIMessage(content='', tool_calls=[{'name': 'HassTurnOff', 'args': {'name': 'Porch'},
+                                                          'id': 'call_1'}]),
+                       AIMessage(content='The porch light is now off.'))
+        mcp_connector = SlowMCPConnector({'content': [{'type': 'text', 'text': 'ok'}], 'isError': False})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector).startup(wait_for_tools=False)
+
+        async def talk():
+            return [e async for e in lurch.stream(message='Could you switch off the porch light?')]
+
+        turn = asyncio.create_task(talk())
+        await asyncio.sleep(0.01)
+        assert not turn.done()
+
+        tools_listed.set()
+        events = await turn
+        assert events[0] == ToolCall(name='HassTurnOff', args={'name': 'Porch'})
+        assert 'turn.tools_loading' in [s.name for s in events[-1].trace.spans]
+
+    @pytest.mark.asyncio
+    async def test_tools_load_is_retried(self, monkeypatch):
+        monkeypatch.setattr(lurch_brain, 'TOOLS_RETRY_BASE_DELAY', 0.01)
+
+        class FlakyMCPConnector(FakeMCPConnector):
+            attempts = 0
+
+            async def get_tools(self):
+                self.attempts += 1
+                if self.attempts < 3:
+                    raise ConnectionError('HA not ready')
+                return self.tools
+
+        mcp_connector = FlakyMCPConnector()
+        lurch = await Lurch(llm_model=_model(AIMessage(content='Very well.')),
+                            ha_mcp_connector=mcp_connector).startup()
+
+        assert mcp_connector.attempts == 3
+        assert [tool.name for tool in lurch._tools] == ['HassTurnOff']
+
+    @pytest.mark.asyncio
+    async def test_turns_fail_clearly_while_tools_are_unavailable(self, monkeypatch):
+        monkeypatch.setattr(lurch_brain, 'TOOLS_WAIT_TIMEOUT', 0.01)
+
+        class DownMCPConnector(FakeMCPConnector):
+            async def get_tools(self):
+                raise ConnectionError('HA down')
+
+        lurch = await Lurch(llm_model=_model(), ha_mcp_connector=DownMCPConnector()).startup(wait_for_tools=False)
+        try:
+            with pytest.raises(ToolsUnavailableError):
+                [m async for m in lurch.talk_to_lurch(message='Turn off the porch')]
+        finally:
+            lurch._tools_loaded.cancel()
+
+    @pytest.mark.asyncio
+    async def test_turn_stats_carry_the_trace(self):
+        model = _model(AIMessage(content='', tool_calls=[{'name': 'HassTurnOff', 'args': {'name': 'Porch'},
+                                                          'id': 'call_1'}]),
+                       AIMessage(content='The porch light is now off.'))
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': 'ok'}], 'isError': False})
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector).startup()
+
+        events = [e async for e in lurch.stream(message='Could you switch off the porch light?')]
+
+        trace = events[-1].trace
+        names = [s.name for s in sorted(trace.spans, key=lambda s: s.start)]
+        assert names == ['turn.home_status', 'llm.step', 'tool.HassTurnOff', 'llm.step']
+        assert trace.end - trace.start == pytest.approx(events[-1].latency, abs=0.01)
+        assert 'turn' in tracing.histograms()
+
+    @pytest.mark.asyncio
+    async def test_static_prompt_parts_come_first_and_do_not_change(self):
+        model = _model(AIMessage(content='It is on.'), AIMessage(content='It is off now.'))
+        memory = ConversationMemory(store=ConversationStore(), llm_model=model)
+        mirror = _fast_path().state_mirror
+        lurch = await Lurch(llm_model=model, conversation_memory=memory,
+                            ha_ws_connector=SimpleNamespace(state_mirror=mirror)).startup()
+
+        [m async for m in lurch.talk_to_lurch(message='Is the porch on?', conversation_id='c1')]
+        mirror.apply_state_changed({'entity_id': 'light.porch', 'old_state': None,
+                                    'new_state': {'entity_id': 'light.porch', 'state': 'off',
+                                                  'attributes': {'friendly_name': 'Porch'}}})
+        [m async for m in lurch.talk_to_lurch(message='And now?', conversation_id='c1')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        first, second = [[m.text for m in prompt] for prompt in model.prompts[-2:]]
+        # persona, catalogue and pinned states: a byte-identical prefix
+        assert second[:3] == first[:3]
+        assert 'Porch [light.porch]' in first[1]
+        # then the history, and the changes right before the request
+        assert second[3:5] == ['Is the porch on?', 'It is on.']
+        assert 'light.porch=off' in second[-2]
+        assert second[-1] == 'And now?'
+
+    @pytest.mark.asyncio
+    async def test_live_context_until_exposed_entities_are_known(self):
+        model = _model(AIMessage(content='It is on.'), AIMessage(content='It is on.'))
+        mirror = _fast_path().state_mirror
+        mirror.set_exposed_entities(None)
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=FakeMCPConnector(),
+                            ha_ws_connector=SimpleNamespace(state_mirror=mirror)).startup()
+
+        [m async for m in lurch.talk_to_lurch(message='Is the porch on?')]
+        assert 'Live Context: porch light on' in [m.text for m in model.prompts[-1]]
+
+        mirror.set_exposed_entities({'light.porch'})
+        [m async for m in lurch.talk_to_lurch(message='Is the porch on?')]
+        assert 'Live Context: porch light on' not in [m.text for m in model.prompts[-1]]
+
+    @pytest.mark.asyncio
+    async def test_full_status_is_rendered_once_per_snapshot(self, monkeypatch):
+        rendered = []
+
+        def render_home_status(states):
+            rendered.append(len(states))
+            return 'Live Context: ' + ' '.join(s['entity_id'] for s in states)
+
+        monkeypatch.setattr(lurch_brain, 'render_home_status', render_home_status)
+        mirror = _fast_path().state_mirror
+        lurch = await Lurch(llm_model=_model(*[AIMessage(content='It is on.')] * 3),
+                            ha_ws_connector=SimpleNamespace(state_mirror=mirror)).startup()
+
+        for _ in range(2):
+            [m async for m in lurch.talk_to_lurch(message='Is the porch on?')]
+        assert rendered == [1]
+
+        mirror.seed(mirror.states())
+        [m async for m in lurch.talk_to_lurch(message='Is the porch on?')]
+        assert rendered == [1, 1]
+
+    @pytest.mark.asyncio
+    async def test_cached_input_tokens_are_reported(self):
+        storage_handler = FakeStorageHandler()
+        model = _model(AIMessage(content='Very well.',
+                                 response_metadata={'model_name': 'gpt-4.1', 'model_provider': 'openai'},
+                                 usage_metadata={'input_tokens': 1200, 'output_tokens': 8, 'total_tokens': 1208,
+                                                 'input_token_details': {'cache_read': 1024}}))
+        lurch = await Lurch(llm_model=model, storage_handler=storage_handler).startup()
+
+        events = [e async for e in lurch.stream(message='Good evening')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        assert events[-1].input_tokens == 1200
+        assert events[-1].cached_input_tokens == 1024
+        assert events[-1].output_tokens == 8
+        assert storage_handler.usage == [{'openai/gpt-4.1': LLMUsage(input=1200, output=8, calls=1, cached=1024)}]
+
+    @pytest.mark.asyncio
+    async def test_simple_request_is_routed_to_the_fast_model(self):
+        fast = _model(AIMessage(content='It is on.'))
+        large = _model(AIMessage(content='Let me think about it.'))
+        storage_handler = FakeStorageHandler()
+        lurch = await Lurch(llm_model=large, storage_handler=storage_handler,
+                            model_router=ModelRouter(fast_model=fast, large_model=large)).startup()
+
+        events = [e async for e in lurch.stream(message='Is the porch light on?')]
+        await asyncio.gather(*lurch._background_tasks)
+
+        assert ''.join(e.text for e in events if isinstance(e, TextDelta)) == 'It is on.'
+        assert events[-1].model == 'generic-fake-chat-model/unknown'
+        assert storage_handler.model_turns == [('generic-fake-chat-model/unknown', False)]
+        assert lurch.stats()['models']['fast']['turns'] == 1
+
+    @pytest.mark.asyncio
+    async def test_failing_model_falls_back_to_the_other_one(self):
+        large = _model(AIMessage(content='Very well, sir.'))
+        router = ModelRouter(fast_model=FailingChatModel(messages=iter([])), large_model=large)
+        lurch = await Lurch(llm_model=large, model_router=router).startup()
+
+        replies = [m.text async for m in lurch.talk_to_lurch(message='Turn off the porch light')]
+
+        assert replies == ['Very well, sir.']
+        assert router.stats()['fast']['failures'] == 1
+        assert router.stats()['large']['turns'] == 1
+
+    @pytest.mark.asyncio
+    async def test_tool_calls_of_a_step_are_merged(self):
+        tools = [{'name': 'HassTurnOff', 'description': 'Turns off a device',
+                  'inputSchema': {'type': 'object', 'properties': {
+                      'area': {'type': 'string'}, 'domain': {'type': 'array', 'items': {'type': 'string'}}}}}]
+        model = _model(AIMessage(content='', tool_calls=[
+            {'name': 'HassTurnOff', 'args': {'area': 'Hall', 'domain': [domain]}, 'id': f'call_{domain}'}
+            for domain in ['light', 'switch']]), AIMessage(content='Everything is off downstairs.'))
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': 'ok'}], 'isError': False}, tools=tools)
+        lurch = await Lurch(llm_model=model, ha_mcp_connector=mcp_connector).startup()
+
+        events = [e async for e in lurch.stream(message='Turn off everything in the hall')]
+
+        assert mcp_connector.calls == [('HassTurnOff', {'area': 'Hall', 'domain': ['light', 'switch']})]
+        assert [e.name for e in events if isinstance(e, ToolResult)] == ['HassTurnOff', 'HassTurnOff']
+
+    @pytest.mark.asyncio
+    async def test_stream_fast_path_reply(self):
+        mcp_connector = FakeMCPConnector({'content': [{'type': 'text', 'text': '{}'}], 'isError': False})
+        lurch = await Lurch(llm_model=_model(), ha_mcp_connector=mcp_connector, fast_path=_fast_path()).startup()
+
+        events = [e async for e in lurch.stream(message='Turn off the porch')]
+
+        assert events[0] == TextDelta('Very well. Porch is now off.')
+        assert events[1].source == 'fast_path'
@@ -0,0 +1,47 @@
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+
+from lurchhome.brain.model_router import ModelRouter, ROUTE_FAST, ROUTE_LARGE, MAX_CONSECUTIVE_FAILURES
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(fast_model=GenericFakeChatModel(messages=iter([])),
+                       large_model=GenericFakeChatModel(messages=iter([])))
+
+
+class TestModelRouter:
+
+    @pytest.mark.parametrize('message', ['Turn off the kitchen light',
+                                         'Is the garage door open?',
+                                         'Che temperatura c\'è in sala?'])
+    def test_simple_requests_go_to_the_fast_model(self, router, message):
+        assert [r.route for r in router.route(message)] == [ROUTE_FAST, ROUTE_LARGE]
+
+    @pytest.mark.parametrize('message', ['Turn off the lights and close the blinds',
+                                         'If nobody is home turn off the heating',
+                                         'Why is the living room so cold?',
+                                         'Spegni le luci e poi chiudi le tapparelle',
+                                         'Could you please tell me which of the lights of the ground floor are on '
+                                         'right now?'])
+    def test_complex_requests_go_to_the_large_model(self, router, message):
+        assert router.route(message)[0].route == ROUTE_LARGE
+
+    def test_failing_model_is_tried_last(self, router):
+        for _ in range(MAX_CONSECUTIVE_FAILURES):
+            router.record(ROUTE_FAST, latency=20, failed=True)
+
+        assert router.route('Turn off the kitchen light')[0].route == ROUTE_LARGE
+
+        stats = router.stats()[ROUTE_FAST]
+        assert stats['failures'] == MAX_CONSECUTIVE_FAILURES
+        assert stats['latency'] is None
+
+    def test_success_resets_the_failures(self, router):
+        for _ in range(MAX_CONSECUTIVE_FAILURES - 1):
+            router.record(ROUTE_FAST, latency=20, failed=True)
+        router.record(ROUTE_FAST, latency=0.5)
+        router.record(ROUTE_FAST, latency=20, failed=True)
+
+        assert router.route('Turn off the kitchen light')[0].route == ROUTE_FAST
+        assert router.stats()[ROUTE_FAST]['latency'] == 0.5
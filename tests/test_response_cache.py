@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from lurchhome.brain.response_cache import ResponseCache
+from lurchhome.integrations.ha.ha_state_mirror import HomeStateMirror
+from tests.conftest import FakeStorageHandler, make_state
+
+
+@pytest.fixture
+def mirror():
+    mirror = HomeStateMirror()
+    mirror.mark_connected()
+    mirror.seed([make_state('cover.garage_door', 'closed', friendly_name='Garage door'),
+                 make_state('sensor.outside_temperature', '12', friendly_name='Outside temperature'),
+                 make_state('light.kitchen', 'on', friendly_name='Kitchen light'),
+                 make_state('light.porch', 'off', friendly_name='Porch')])
+    return mirror
+
+
+@pytest.fixture
+def cache(mirror):
+    return ResponseCache(storage_handler=FakeStorageHandler(), state_mirror=mirror)
+
+
+async def _put(cache, message, answer, tools_called=()):
+    await cache.put(message, answer, fingerprints=cache.fingerprints(message), tools_called=list(tools_called))
+
+
+class TestResponseCache:
+
+    def test_dependencies(self, cache):
+        assert cache.dependencies("What's the temperature outside?") == {'sensor.outside_temperature'}
+        assert cache.dependencies('Which lights are on?') == {'light.kitchen', 'light.porch'}
+        assert cache.dependencies('What time is it?') == set()
+
+    @pytest.mark.asyncio
+    async def test_hit_with_normalized_input(self, cache):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+
+        assert await cache.get('is the garage door open') == 'No, it is closed.'
+        assert cache.stats()['hits'] == 1
+
+    @pytest.mark.asyncio
+    async def test_invalidated_by_state_changes(self, cache, mirror):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+
+        mirror.apply_state_changed({'entity_id': 'cover.garage_door',
+                                    'new_state': make_state('cover.garage_door', 'open', friendly_name='Garage door')})
+        await asyncio.gather(*cache._background_tasks)
+
+        assert cache.storage_handler.entries == {}
+        assert await cache.get('Is the garage door open?') is None
+
+    @pytest.mark.asyncio
+    async def test_unrelated_changes_keep_the_entry(self, cache, mirror):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+
+        mirror.apply_state_changed({'entity_id': 'light.porch',
+                                    'new_state': make_state('light.porch', 'on', friendly_name='Porch')})
+
+        assert await cache.get('Is the garage door open?') == 'No, it is closed.'
+
+    @pytest.mark.asyncio
+    async def test_changes_missed_are_detected_on_read(self, cache, mirror):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+        cache._dependents.clear()
+
+        mirror.apply_state_changed({'entity_id': 'cover.garage_door',
+                                    'new_state': make_state('cover.garage_door', 'open', friendly_name='Garage door')})
+
+        assert await cache.get('Is the garage door open?') is None
+
+    @pytest.mark.asyncio
+    async def test_actions_are_never_cached(self, cache):
+        await _put(cache, 'Turn on the kitchen light', 'Done.', tools_called=['HassTurnOn'])
+
+        assert cache.storage_handler.entries == {}
+
+    @pytest.mark.asyncio
+    async def test_questions_without_dependencies_are_not_cached(self, cache):
+        await _put(cache, 'What time is it?', 'Half past nine.', tools_called=['GetDateTime'])
+        await _put(cache, 'Tell me a joke', 'No.')
+
+        assert cache.storage_handler.entries == {}
+
+    @pytest.mark.asyncio
+    async def test_no_hit_when_mirror_is_stale(self, cache, mirror):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+        mirror.mark_disconnected()
+
+        assert await cache.get('Is the garage door open?') is None
+
+    @pytest.mark.asyncio
+    async def test_entries_evicted_by_redis_are_forgotten(self, cache):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+        cache.storage_handler.entries.clear()
+
+        assert await cache.get('Is the garage door open?') is None
+        assert cache._dependents == {}
+
+    @pytest.mark.asyncio
+    async def test_corrupt_entry_is_a_miss(self, cache):
+        await _put(cache, 'Is the garage door open?', 'No, it is closed.')
+        key, = cache.storage_handler.entries
+        cache.storage_handler.entries[key] = '{"answer": '
+
+        assert await cache.get('Is the garage door open?') is None
+        await asyncio.gather(*cache._background_tasks)
+        assert cache.storage_handler.entries == {}
+        assert cache.stats()['misses'] == 1
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk, ChatResult, ChatGeneration
+from websockets.asyncio.client import connect
+
+from lurchhome.brain.lurch_brain import Lurch
+from lurchhome.server import LurchServer
+
+LLM_LATENCY = 0.2
+
+
+class SlowChatModel(BaseChatModel):
+    """Answers every request with the same text after LLM_LATENCY seconds, as a busy local model would."""
+
+    @property
+    def _llm_type(self) -> str:
+        return 'slow-fake'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content='At your service.'))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(LLM_LATENCY)
+        for token in ['At ', 'your ', 'service.']:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+async def _talk(port: int, session: str, message: str):
+    frames = []
+    async with connect(f'ws://127.0.0.1:{port}/ws?session={session}') as ws:
+        await ws.send(json.dumps({'message': message}))
+        while not frames or frames[-1]['type'] not in ('done', 'error'):
+            frames.append(json.loads(await ws.recv()))
+    return frames
+
+
+async def _server(**kwargs) -> LurchServer:
+    lurch = await Lurch(llm_model=SlowChatModel(), **kwargs).startup()
+    return await LurchServer(lurch=lurch, port=0).start()
+
+
+class TestLurchServer:
+
+    @pytest.mark.asyncio
+    async def test_streamed_answer(self):
+        server = await _server()
+        try:
+            frames = await _talk(server.bound_port, 's1', 'Lurch?')
+        finally:
+            await server.aclose()
+
+        assert ''.join(f['text'] for f in frames if f['type'] == 'delta') == 'At your service.'
+        assert frames[-1]['type'] == 'done'
+        assert frames[-1]['time_to_first_token'] >= LLM_LATENCY
+
+    @pytest.mark.asyncio
+    async def test_sessions_are_served_concurrently(self):
+        server = await _server()
+        try:
+            replies = await asyncio.gather(*(_talk(server.bound_port, f's{i}', 'Lurch?') for i in range(4)))
+            stats = server.lurch.stats()
+        finally:
+            await server.aclose()
+
+        assert all(frames[-1]['type'] == 'done' for frames in replies)
+        assert stats['llm_peak_in_flight'] == 4
+
+    @pytest.mark.asyncio
+    async def test_llm_concurrency_limit(self):
+        server = await _server(max_concurrent_llm=1)
+        try:
+            replies = await asyncio.gather(*(_talk(server.bound_port, f's{i}', 'Lurch?') for i in range(3)))
+            stats = server.lurch.stats()
+        finally:
+            await server.aclose()
+
+        assert all(frames[-1]['type'] == 'done' for frames in replies)
+        assert (stats['llm_peak_in_flight'], stats['llm_in_flight'], stats['llm_waiting']) == (1, 0, 0)
+
+    @pytest.mark.asyncio
+    async def test_health_and_stats(self):
+        server = await _server()
+        try:
+            async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{server.bound_port}') as client:
+                assert (await client.get('/health')).text == 'ok\n'
+                stats = (await client.get('/stats')).json()
+                metrics = await client.get('/metrics')
+        finally:
+            await server.aclose()
+
+        assert stats['sessions'] == 0
+        assert stats['lurch']['llm_in_flight'] == 0
+        assert metrics.headers['content-type'].startswith('text/plain')
+        assert '# TYPE lurch_span_seconds histogram' in metrics.text
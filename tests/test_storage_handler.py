@@ -0,0 +1,161 @@
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, call, patch
+
+import pytest
+
+import lurchhome.persistence.storage_handler as storage_handler
+from lurchhome.persistence.storage_handler import StorageHandler, StreamRetention, EVENTS_STREAM_KEY, LLMUsage
+
+
+def _mock_pipeline(handler, results=None):
+    pipe = MagicMock()
+    pipe.execute = AsyncMock(return_value=results)
+    pipeline = MagicMock()
+    pipeline.__aenter__ = AsyncMock(return_value=pipe)
+    pipeline.__aexit__ = AsyncMock(return_value=False)
+    handler.redis = MagicMock()
+    handler.redis.pipeline.return_value = pipeline
+    return pipe
+
+
+class TestStorageHandler:
+    @pytest.fixture
+    def handler(self):
+        return StorageHandler(host='localhost',
+                              retention={EVENTS_STREAM_KEY: StreamRetention(maxlen=1000, max_age=3600)})
+
+    def test_pool_configuration(self):
+        handler = StorageHandler(host='redis.local', port='6380', max_connections=4, socket_timeout=2)
+        assert handler.pool.max_connections == 4
+        assert handler.pool.connection_kwargs['host'] == 'redis.local'
+        assert handler.pool.connection_kwargs['port'] == 6380
+        assert handler.pool.connection_kwargs['socket_timeout'] == 2
+
+    def test_unix_socket(self):
+        handler = StorageHandler(unix_socket_path='/run/redis.sock')
+        assert handler.pool.connection_kwargs['path'] == '/run/redis.sock'
+        assert 'host' not in handler.pool.connection_kwargs
+
+    def test_stream_id(self):
+        assert storage_handler.stream_id(1700000000.5) == '1700000000500-0'
+
+    @pytest.mark.asyncio
+    async def test_store_ha_events_trims_by_length_and_age(self, handler):
+        pipe = _mock_pipeline(handler)
+
+        with patch.object(storage_handler.time, 'time', return_value=10000):
+            assert await handler.store_ha_events(events=[{'n': 1}, {'n': 2}]) == 2
+
+        assert pipe.xadd.call_count == 2
+        assert pipe.xadd.call_args.kwargs == {'maxlen': 1000, 'approximate': True}
+        pipe.xtrim.assert_called_once_with(EVENTS_STREAM_KEY, minid='6400000-0', approximate=True)
+
+    @pytest.mark.asyncio
+    async def test_read_ha_events_pagination(self, handler):
+        handler.redis = MagicMock()
+        handler.redis.xrange = AsyncMock(return_value=[(b'1-0', {b'state': b'on'}), (b'2-0', {b'state': b'off'})])
+
+        events, cursor = await handler.read_ha_events(count=2)
+        assert events == [{'id': '1-0', 'state': 'on'}, {'id': '2-0', 'state': 'off'}]
+        assert cursor == '(2-0'
+
+        handler.redis.xrange = AsyncMock(return_value=[(b'3-0', {b'state': b'on'})])
+        events, cursor = await handler.read_ha_events(start=cursor, count=2)
+        handler.redis.xrange.assert_called_once_with(EVENTS_STREAM_KEY, min='(2-0', max='+', count=2)
+        assert cursor is None
+
+    @pytest.mark.asyncio
+    async def test_read_ha_events_reverse(self, handler):
+        handler.redis = MagicMock()
+        handler.redis.xrevrange = AsyncMock(return_value=[(b'9-0', {b'state': b'on'})])
+
+        events, cursor = await handler.read_ha_events(count=1, reverse=True)
+        handler.redis.xrevrange.assert_called_once_with(EVENTS_STREAM_KEY, max='+', min='-', count=1)
+        assert cursor == '(9-0'
+
+    @pytest.mark.asyncio
+    async def test_record_llm_usage_single_round_trip(self, handler):
+        pipe = _mock_pipeline(handler, results=[130, 12])
+        when = datetime(2025, 3, 1, 18, 30, tzinfo=timezone.utc)
+
+        totals = await handler.record_llm_usage(usage={'ollama/qwen3': LLMUsage(input=100, output=10, calls=2),
+                                                       'openai/gpt-4o': LLMUsage(input=30, output=2, calls=1)},
+                                                when=when)
+
+        assert totals == (130, 12)
+        pipe.execute.assert_awaited_once()
+        pipe.hincrby.assert_any_call('lurch:llm:usage:hour:2025030118', 'ollama/qwen3:input', 100)
+        pipe.hincrby.assert_any_call('lurch:llm:usage:day:20250301', 'openai/gpt-4o:calls', 1)
+        assert pipe.expire.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_top_llm_consumers(self, handler):
+        handler.redis = MagicMock()
+        handler.redis.hgetall = AsyncMock(return_value={
+            b'ollama/qwen3:30b:input': b'100', b'ollama/qwen3:30b:output': b'10',
+            b'openai/gpt-4o:input': b'500', b'openai/gpt-4o:output': b'50', b'openai/gpt-4o:calls': b'3',
+        })
+
+        top = await handler.top_llm_consumers(period='day', limit=1)
+        assert top == [('openai/gpt-4o', LLMUsage(input=500, output=50, calls=3))]
+
+        usage = await handler.get_llm_usage()
+        assert usage['ollama/qwen3:30b'] == LLMUsage(input=100, output=10, calls=0)
+
+    @pytest.mark.asyncio
+    async def test_store_conversation_replaces_summary_and_turns(self, handler):
+        pipe = _mock_pipeline(handler)
+
+        await handler.store_conversation(conversation_id='c1', summary='short', turns=['t1', 't2'], ttl=60)
+
+        pipe.delete.assert_called_once_with('lurch:conv:c1:summary', 'lurch:conv:c1:turns')
+        pipe.set.assert_called_once_with('lurch:conv:c1:summary', 'short', ex=60)
+        pipe.rpush.assert_called_once_with('lurch:conv:c1:turns', 't1', 't2')
+        pipe.execute.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_record_fast_path(self, handler):
+        pipe = _mock_pipeline(handler, results=[1, 2.5, {b'hits': b'1', b'saved_seconds': b'2.5'}])
+
+        stats = await handler.record_fast_path(hits=1, misses=19, saved_seconds=2.5)
+
+        assert pipe.hincrby.call_args_list == [call('lurch:fast_path', 'hits', 1),
+                                               call('lurch:fast_path', 'misses', 19)]
+        pipe.hincrbyfloat.assert_called_once_with('lurch:fast_path', 'saved_seconds', 2.5)
+        assert stats == {'hits': 1.0, 'saved_seconds': 2.5}
+
+    @pytest.mark.asyncio
+    async def test_record_model_turn(self, handler):
+        pipe = _mock_pipeline(handler, results=[3, 4.5, {b'ollama/qwen3:4b:turns': b'3',
+                                                         b'ollama/qwen3:4b:latency_seconds': b'4.5',
+                                                         b'ollama/qwen3:30b:turns': b'1'}])
+
+        stats = await handler.record_model_turn(model='ollama/qwen3:4b', latency=1.5)
+
+        pipe.hincrby.assert_called_once_with('lurch:llm:models', 'ollama/qwen3:4b:turns', 1)
+        pipe.hincrbyfloat.assert_called_once_with('lurch:llm:models', 'ollama/qwen3:4b:latency_seconds', 1.5)
+        assert stats == {'turns': 3.0, 'latency_seconds': 4.5}
+
+    @pytest.mark.asyncio
+    async def test_tool_result_round_trip(self, handler):
+        handler.redis = MagicMock()
+        handler.redis.set = AsyncMock()
+        handler.redis.get = AsyncMock(return_value=b'full result')
+
+        await handler.store_tool_result(handle='abc', text='full result', ttl=900)
+
+        handler.redis.set.assert_awaited_once_with('lurch:tool_result:abc', 'full result', ex=900)
+        assert await handler.load_tool_result(handle='abc') == 'full result'
+
+    @pytest.mark.asyncio
+    async def test_store_cached_response_evicts_least_recently_used(self, handler):
+        pipe = _mock_pipeline(handler, results=[True, 1, 0, 3])
+        handler.redis.zpopmin = AsyncMock(return_value=[(b'old', 1.0)])
+        handler.redis.delete = AsyncMock()
+
+        evicted = await handler.store_cached_response(key='new', value='{}', ttl=60, max_entries=2)
+
+        assert evicted == 1
+        pipe.set.assert_called_once_with('lurch:resp_cache:new', '{}', ex=60)
+        handler.redis.zpopmin.assert_awaited_once_with('lurch:resp_cache_lru', 1)
+        handler.redis.delete.assert_awaited_once_with('lurch:resp_cache:old')
@@ -0,0 +1,120 @@
+import asyncio
+from typing import Dict, Any
+
+import pytest
+
+from lurchhome.tools.tools_batcher import ToolsBatcher, list_params, batching_turn
+from lurchhome.tools.tools_interfaces import CallableTools
+
+TURN_OFF_SCHEMA = {'type': 'object', 'properties': {'name': {'type': 'string'},
+                                                    'area': {'type': 'string'},
+                                                    'domain': {'type': 'array', 'items': {'type': 'string'}}}}
+
+
+class SlowConnector(CallableTools):
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    async def call_tool(self, *, name=str, params=Dict) -> Dict[str, Any]:
+        self.calls.append((name, params))
+        await asyncio.sleep(0.05)
+        if self.error:
+            raise self.error
+        return {'content': [{'type': 'text', 'text': 'ok'}]}
+
+
+class TestToolsBatcher:
+
+    def test_list_params(self):
+        assert list_params(TURN_OFF_SCHEMA) == {'domain'}
+        assert list_params({'properties': {'x': {'anyOf': [{'type': 'array'}, {'type': 'null'}]}}}) == {'x'}
+
+    @pytest.mark.asyncio
+    async def test_calls_differing_in_lists_are_merged(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector)
+
+        with batching_turn():
+            results = await asyncio.gather(*[
+                batcher.call_tool(name='HassTurnOff', params={'area': 'Kitchen', 'domain': [domain]},
+                                  mergeable={'domain'})
+                for domain in ['light', 'switch', 'light']])
+
+        assert connector.calls == [('HassTurnOff', {'area': 'Kitchen', 'domain': ['light', 'switch']})]
+        assert results == [{'content': [{'type': 'text', 'text': 'ok'}]}] * 3
+        assert batcher.stats() == {'merged_calls': 2}
+
+    @pytest.mark.asyncio
+    async def test_calls_differing_in_two_lists_are_not_merged(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector)
+
+        with batching_turn():
+            await asyncio.gather(*[
+                batcher.call_tool(name='HassTurnOff', params={'area': area, 'domain': domain},
+                                  mergeable={'area', 'domain'})
+                for area, domain in [(['Kitchen'], ['light']), (['Hall'], ['switch']), (['Kitchen'], ['fan'])]])
+
+        assert [params for _, params in connector.calls] == [{'area': ['Kitchen'], 'domain': ['light', 'fan']},
+                                                             {'area': ['Hall'], 'domain': ['switch']}]
+
+    @pytest.mark.asyncio
+    async def test_calls_of_different_turns_are_not_merged(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector)
+
+        async def turn(domain):
+            with batching_turn():
+                return await batcher.call_tool(name='HassTurnOff', params={'area': 'Kitchen', 'domain': [domain]},
+                                               mergeable={'domain'})
+
+        await asyncio.gather(turn('light'), turn('switch'))
+
+        assert sorted(params['domain'] for _, params in connector.calls) == [['light'], ['switch']]
+        assert batcher.stats() == {'merged_calls': 0}
+
+    @pytest.mark.asyncio
+    async def test_calls_outside_a_turn_are_not_merged(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector, window=10)
+
+        await asyncio.gather(*[
+            batcher.call_tool(name='HassTurnOff', params={'area': 'Kitchen', 'domain': [domain]}, mergeable={'domain'})
+            for domain in ['light', 'switch']])
+
+        assert sorted(params['domain'] for _, params in connector.calls) == [['light'], ['switch']]
+
+    @pytest.mark.asyncio
+    async def test_calls_differing_in_scalars_run_concurrently(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector)
+
+        started = asyncio.get_running_loop().time()
+        with batching_turn():
+            await asyncio.gather(*[
+                batcher.call_tool(name='HassTurnOff', params={'area': area, 'domain': ['light']}, mergeable={'domain'})
+                for area in ['Kitchen', 'Hall', 'Office']])
+
+        assert sorted(params['area'] for _, params in connector.calls) == ['Hall', 'Kitchen', 'Office']
+        assert asyncio.get_running_loop().time() - started < 0.1
+
+    @pytest.mark.asyncio
+    async def test_calls_without_lists_are_not_delayed(self):
+        connector = SlowConnector()
+        batcher = ToolsBatcher(callable_tools=connector, window=10)
+
+        await batcher.call_tool(name='HassTurnOff', params={'name': 'Porch'}, mergeable={'domain'})
+
+        assert connector.calls == [('HassTurnOff', {'name': 'Porch'})]
+
+    @pytest.mark.asyncio
+    async def test_error_reaches_every_caller(self):
+        batcher = ToolsBatcher(callable_tools=SlowConnector(error=TimeoutError()))
+
+        with batching_turn():
+            results = await asyncio.gather(*[
+                batcher.call_tool(name='HassTurnOff', params={'domain': [domain]}, mergeable={'domain'})
+                for domain in ['light', 'fan']], return_exceptions=True)
+
+        assert all(isinstance(result, TimeoutError) for result in results)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from lurchhome.tools.tools_results import ToolResultsCompactor, unwrap, READ_TOOL_RESULT_TOOL
+
+
+def _result(payload, is_error=False):
+    text = payload if isinstance(payload, str) else json.dumps(payload)
+    return {'content': [{'type': 'text', 'text': text}], 'isError': is_error}
+
+
+INTENT_RESPONSE = {'speech': {}, 'response_type': 'action_done', 'language': 'en',
+                   'data': {'targets': [], 'failed': [],
+                            'success': [{'name': 'Kitchen light', 'type': 'entity', 'id': 'light.kitchen'}]}}
+
+
+class TestToolResults:
+
+    def test_unwrap_prunes_intent_responses(self):
+        assert json.loads(unwrap(_result(INTENT_RESPONSE))) == {
+            'response_type': 'action_done',
+            'data': {'success': [{'name': 'Kitchen light', 'type': 'entity', 'id': 'light.kitchen'}]}}
+
+    def test_unwrap_result_envelope_and_errors(self):
+        assert unwrap(_result({'success': True, 'result': 'Live Context: ...'})) == 'Live Context: ...'
+        assert unwrap(_result('No device named Attic', is_error=True)) == 'Error: No device named Attic'
+
+    @pytest.mark.asyncio
+    async def test_long_result_is_truncated_and_readable(self):
+        compactor = ToolResultsCompactor(max_chars=100)
+        text = ''.join(f'line {i}\n' for i in range(50))
+
+        compacted = await compactor.compact('GetLiveContext', _result(text))
+
+        assert compacted.startswith(text[:100])
+        assert f'call {READ_TOOL_RESULT_TOOL} with handle' in compacted
+        handle = compacted.split('handle "')[1].split('"')[0]
+
+        rest = await compactor.read_tool().ainvoke({'handle': handle, 'offset': 100})
+        assert rest.startswith(text[100:200])
+        assert 'offset 200' in rest
+        assert compactor.stats()['truncated'] == 1
+
+    @pytest.mark.asyncio
+    async def test_per_tool_limits(self):
+        compactor = ToolResultsCompactor(max_chars=10, limits={'GetLive*': 1000})
+
+        assert await compactor.compact('GetLiveContext', _result('x' * 500)) == 'x' * 500
+        assert 'more characters' in await compactor.compact('HassTurnOn', _result('x' * 500))
+
+    @pytest.mark.asyncio
+    async def test_unknown_handle(self):
+        assert 'expired' in await ToolResultsCompactor().read('nope')
@@ -0,0 +1,78 @@
+import pytest
+
+from lurchhome.tools.tools_selector import ToolsSelector
+from lurchhome.tools.tools_utils import _create_langchain_tool
+
+
+def _tool(tool_name, description, **properties):
+    return _create_langchain_tool(tool_data={'name': tool_name,
+                                             'description': description,
+                                             'inputSchema': {'type': 'object', 'properties': properties}},
+                                  callable_tool=None)
+
+
+NAME = {'type': 'string'}
+AREA = {'type': 'string'}
+DOMAIN = {'type': 'array', 'items': {'type': 'string', 'enum': ['light', 'switch', 'fan', 'cover', 'climate']}}
+
+TOOLS = [
+    _tool('HassTurnOn', 'Turns on/opens/presses a device or entity', name=NAME, area=AREA, domain=DOMAIN),
+    _tool('HassTurnOff', 'Turns off/closes a device or entity', name=NAME, area=AREA, domain=DOMAIN),
+    _tool('HassLightSet', 'Sets the brightness percentage or color of a light', name=NAME, area=AREA,
+          brightness={'type': 'integer', 'description': 'Brightness percentage'}),
+    _tool('HassClimateSetTemperature', 'Sets the target temperature of a climate device', name=NAME,
+          temperature={'type': 'number'}),
+    _tool('HassMediaPause', 'Pauses a media player', name=NAME),
+    _tool('HassSetVolume', 'Sets the volume percentage of a media player', name=NAME,
+          volume_level={'type': 'integer'}),
+    _tool('HassListAddItem', 'Add item to a todo list', item={'type': 'string'}, name=NAME),
+    _tool('HassCancelAllTimers', 'Cancels all timers', area=AREA),
+    _tool('HassVacuumStart', 'Starts a vacuum', name=NAME),
+    _tool('GetLiveContext', 'Provides real-time information about the CURRENT state of devices'),
+    _tool('GetDateTime', 'Provides the current date and time'),
+]
+
+
+def _names(tools):
+    return [tool.name for tool in tools]
+
+
+class TestToolsSelector:
+
+    @pytest.fixture
+    def selector(self):
+        return ToolsSelector(tools=TOOLS, top_k=2)
+
+    @pytest.mark.parametrize('query, expected', [
+        ('set the kitchen light brightness to 40%', 'HassLightSet'),
+        ('turn off the porch', 'HassTurnOff'),
+        ('spegni la luce del bagno', 'HassTurnOff'),
+        ('add milk to the shopping list', 'HassListAddItem'),
+        ('lower the volume of the speaker', 'HassSetVolume'),
+        ('imposta il termostato a 21', 'HassClimateSetTemperature'),
+    ])
+    def test_relevant_tool_is_selected(self, selector, query, expected):
+        assert expected in _names(selector.select(query))
+
+    def test_core_tools_are_always_selected(self, selector):
+        names = _names(selector.select('pause the music'))
+
+        assert 'HassMediaPause' in names
+        assert {'GetLiveContext', 'GetDateTime'} <= set(names)
+        assert len(names) <= 4
+
+    def test_no_match_only_core_tools(self, selector):
+        assert _names(selector.select('good evening Lurch')) == ['GetLiveContext', 'GetDateTime']
+
+    def test_original_order_is_kept(self, selector):
+        names = _names(selector.select('turn off the light'))
+        assert names == [tool.name for tool in TOOLS if tool.name in names]
+
+    def test_large_catalogue_is_cut_to_top_k(self):
+        filler = [_tool(f'Script{i}', f'Runs the automation script number {i}', name=NAME) for i in range(200)]
+        selector = ToolsSelector(tools=filler + TOOLS, top_k=8)
+
+        names = _names(selector.select('please turn off all the lights in the living room and set the heating to 20'))
+
+        assert {'HassTurnOff', 'HassClimateSetTemperature', 'GetLiveContext', 'GetDateTime'} <= set(names)
+        assert len(names) <= 8 + 2
@@ -0,0 +1,106 @@
+import asyncio
+from typing import Dict, Any, List
+
+import pytest
+
+from lurchhome.tools.tools_cache import ToolsCache, index_tools
+from lurchhome.tools.tools_interfaces import CallableTools, WithTools
+from lurchhome.tools.tools_results import ToolResultsCompactor
+from lurchhome.tools import tools_utils
+from lurchhome.tools.tools_utils import build_tools
+
+TURN_ON = {
+    'name': 'HassTurnOn',
+    'description': 'Turns on a device',
+    'inputSchema': {'type': 'object', 'properties': {'name': {'type': 'string'}}}
+}
+
+TURN_OFF = {
+    'name': 'HassTurnOff',
+    'description': 'Turns off a device',
+    'inputSchema': {'type': 'object', 'properties': {'name': {'type': 'string'}}}
+}
+
+
+class FakeConnector(WithTools, CallableTools):
+    def __init__(self, tools: List[Dict[str, Any]]):
+        self.tools = tools
+        self.get_tools_calls = 0
+        self.calls = []
+
+    async def get_tools(self) -> List[Dict[str, Any]]:
+        self.get_tools_calls += 1
+        return self.tools
+
+    async def call_tool(self, *, name=str, params=Dict) -> Dict[str, Any]:
+        self.calls.append((name, params))
+        return {'content': [{'type': 'text', 'text': 'ok'}]}
+
+
+class TestBuildTools:
+
+    @pytest.mark.asyncio
+    async def test_build_tools_stores_cache(self, tmp_path):
+        cache = ToolsCache(cache_file=str(tmp_path / 'tools.json'))
+        connector = FakeConnector([TURN_ON])
+
+        tools = await build_tools(with_and_callable_tools=connector, tools_cache=cache)
+
+        assert [t.name for t in tools] == ['HassTurnOn']
+        assert await cache.load() == index_tools([TURN_ON])
+
+    @pytest.mark.asyncio
+    async def test_build_tools_from_cache_and_refresh(self, tmp_path):
+        cache = ToolsCache(cache_file=str(tmp_path / 'tools.json'))
+        await cache.store(index_tools([TURN_ON]))
+
+        connector = FakeConnector([TURN_ON, TURN_OFF])
+        changed = asyncio.Event()
+        refreshed = []
+
+        async def on_tools_changed(tools):
+            refreshed.extend(tools)
+            changed.set()
+
+        tools = await build_tools(with_and_callable_tools=connector,
+                                  tools_cache=cache,
+                                  on_tools_changed=on_tools_changed)
+
+        assert [t.name for t in tools] == ['HassTurnOn']
+
+        await asyncio.wait_for(changed.wait(), timeout=1)
+        assert sorted(t.name for t in refreshed) == ['HassTurnOff', 'HassTurnOn']
+        # unchanged tools are reused, not rebuilt
+        assert tools[0] in refreshed
+        assert await cache.load() == index_tools([TURN_ON, TURN_OFF])
+
+    @pytest.mark.asyncio
+    async def test_refresh_error_is_logged(self, tmp_path, caplog):
+        cache = ToolsCache(cache_file=str(tmp_path / 'tools.json'))
+        await cache.store(index_tools([TURN_ON]))
+
+        class FailingConnector(FakeConnector):
+            async def get_tools(self):
+                raise ConnectionError('HA down')
+
+        tools = await build_tools(with_and_callable_tools=FailingConnector([]), tools_cache=cache)
+        await asyncio.gather(*tools_utils._background_tasks)
+
+        assert [t.name for t in tools] == ['HassTurnOn']
+        assert 'Unable to refresh the tools' in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_tool_call_validates_params(self):
+        connector = FakeConnector([TURN_ON])
+        tools = await build_tools(with_and_callable_tools=connector)
+
+        await tools[0].ainvoke({'name': 'Kitchen light'})
+        assert connector.calls == [('HassTurnOn', {'name': 'Kitchen light'})]
+
+    @pytest.mark.asyncio
+    async def test_tool_results_are_compacted(self):
+        connector = FakeConnector([TURN_ON])
+        tools = await build_tools(with_and_callable_tools=connector, compactor=ToolResultsCompactor())
+
+        assert [t.name for t in tools] == ['HassTurnOn', 'ReadToolResult']
+        assert await tools[0].ainvoke({'name': 'Kitchen light'}) == 'ok'
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from lurchhome import tracing
+
+
+@pytest.fixture(autouse=True)
+def _reset_histograms():
+    tracing.reset()
+    yield
+    tracing.reset()
+
+
+class TestTracing:
+
+    @pytest.mark.asyncio
+    async def test_spans_are_recorded_into_the_active_trace(self):
+        trace, token = tracing.start_trace('turn')
+        with tracing.span('outer', kind='test'):
+            with tracing.span('inner'):
+                await asyncio.sleep(0.01)
+        tracing.end_trace(trace, token)
+
+        spans = {s.name: s for s in trace.spans}
+        assert spans['outer'].depth == 0 and spans['outer'].attributes == {'kind': 'test'}
+        assert spans['inner'].depth == 1
+        assert spans['inner'].duration >= 0.01
+        assert trace.start <= spans['outer'].start <= spans['inner'].start
+        assert spans['inner'].end <= spans['outer'].end <= trace.end
+
+    @pytest.mark.asyncio
+    async def test_spans_of_concurrent_tasks_reach_the_trace(self):
+        @tracing.traced('test')
+        async def call():
+            await asyncio.sleep(0)
+
+        trace, token = tracing.start_trace('turn')
+        await asyncio.gather(call(), call())
+        tracing.end_trace(trace, token)
+
+        assert [s.name for s in trace.spans] == ['test.call', 'test.call']
+
+    def test_without_a_trace_only_the_histograms_are_updated(self):
+        tracing.record('mcp.post', 1.0, 1.02)
+        tracing.record('mcp.post', 1.0, 3.0)
+
+        histogram = tracing.histograms()['mcp.post']
+        assert histogram.count == 2
+        assert histogram.sum == pytest.approx(2.02)
+        assert histogram.counts[tracing.BUCKETS.index(0.025)] == 1
+        assert histogram.counts[tracing.BUCKETS.index(2.5)] == 1
+
+    def test_prometheus_buckets_are_cumulative(self):
+        tracing.record('llm.step', 0, 0.3)
+        tracing.record('llm.step', 0, 60)
+
+        text = tracing.render_prometheus()
+
+        assert '# TYPE lurch_span_seconds histogram' in text
+        assert 'lurch_span_seconds_bucket{span="llm.step",le="0.25"} 0' in text
+        assert 'lurch_span_seconds_bucket{span="llm.step",le="0.5"} 1' in text
+        assert 'lurch_span_seconds_bucket{span="llm.step",le="30"} 1' in text
+        assert 'lurch_span_seconds_bucket{span="llm.step",le="+Inf"} 2' in text
+        assert 'lurch_span_seconds_count{span="llm.step"} 2' in text
+
+    def test_write_prometheus(self, tmp_path):
+        tracing.record('turn', 0, 1)
+        path = tmp_path / 'lurch.prom'
+
+        tracing.write_prometheus(str(path))
+
+        assert path.read_text() == tracing.render_prometheus()
+
+    def test_waterfall(self):
+        trace = tracing.Trace('turn')
+        trace.start, trace.end = 0.0, 1.0
+        trace.spans.append(tracing.Span('llm.step', 0.0, 0.5, 0, {'model': 'fake'}))
+        trace.spans.append(tracing.Span('tool.HassTurnOff', 0.5, 0.75, 0, {}))
+        trace.spans.append(tracing.Span('mcp.reply', 0.5, 0.7, 1, {}))
+
+        lines = tracing.waterfall(trace).splitlines()
+
+        assert lines[0] == 'turn: 1000 ms'
+        assert lines[1].endswith('| llm.step model=fake')
+        assert '|' + '█' * 20 + ' ' * 20 + '|' in lines[1]
+        assert lines[2].endswith('| tool.HassTurnOff')
+        assert lines[3].endswith('|   mcp.reply')